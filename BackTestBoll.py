@@ -1,13 +1,15 @@
 import datetime
-from collections import deque
-import numpy as np
 from core.Account import Account
+from core.BatchEngine import BatchBackTestEngine
 from core.Engine import BackTestEngine
+from core.Indicator import RollingStd, rolling_mean, rolling_std
+from core.Optimizer import ParameterSweep, parameter_grid
 from core.Order import MarketOrder
-from core.Strategy import StrategyBase
+from core.Strategy import BatchStrategyBase, StrategyBase
 from core.Symbol import SymbolRB
 from core.common import *
 from data_manager.DataEngine import get_future_data
+import numpy as np
 
 
 class ParameterBoll:
@@ -27,14 +29,24 @@ class StrategyBoll(StrategyBase):
     """
     def __init__(self, strategy_id, parameter, symbol):
         super().__init__(strategy_id, parameter, symbol)
-        self.price = deque(maxlen=parameter.tau)
+        self.boll = self.use_indicator(RollingStd, parameter.tau)   # 布林带均值和标准差(引擎中同品种同窗口的策略共用)
+        self.price = None
         self.stop_days = datetime.timedelta(days=self.parameter.stop_days)
         self.time = None
         self.open_flag = None
         self.position_ls = None
+        self.entry_cache = None     # 跳跃模式：(bars, 有开仓信号的bar位置)
+
+    def set_parameter(self, parameter):
+        super().set_parameter(parameter)
+        self.entry_cache = None
+        self.indicators = []
+        self.boll = self.use_indicator(RollingStd, parameter.tau)
+        self.stop_days = datetime.timedelta(days=parameter.stop_days)
 
     def update(self, data, pos_ls):
-        self.price.append(data.open)
+        self.update_indicators(data)
+        self.price = data.open
         self.time = data.date_time
         self.position_ls = pos_ls
 
@@ -45,7 +57,7 @@ class StrategyBoll(StrategyBase):
         :return:
         """
         # 策略未达到初始化要求不允许开仓
-        if len(self.price) < self.parameter.tau:
+        if not self.boll.ready:
             return False
 
         # 当前策略持仓不允许开新仓
@@ -53,14 +65,14 @@ class StrategyBoll(StrategyBase):
             self.open_flag = None
             return False
 
-        mean = np.mean(self.price)
-        std = np.std(self.price)
+        mean = self.boll.mean
+        std = self.boll.value
         # 向上趋势突破
-        if self.price[-1] > mean + std*self.parameter.delta:
+        if self.price > mean + std*self.parameter.delta:
             self.open_flag = 'buy'
             return True
         # 向下趋势突破
-        elif self.price[-1] < mean - std*self.parameter.delta:
+        elif self.price < mean - std*self.parameter.delta:
             self.open_flag = 'sell'
             return True
         else:
@@ -82,6 +94,43 @@ class StrategyBoll(StrategyBase):
             return True
         return False
 
+    def vector_signals(self, bars):
+        """
+        向量化的开仓信号，与open_condition一致
+        """
+        price = np.asarray(bars.columns['open'], dtype=np.float64)
+        mean = rolling_mean(price, self.parameter.tau)
+        std = rolling_std(price, self.parameter.tau)
+        signal = np.zeros(len(price), dtype=np.int8)
+        signal[price > mean + std*self.parameter.delta] = ORDER_TYPE_BUY
+        signal[price < mean - std*self.parameter.delta] = ORDER_TYPE_SELL
+        return signal
+
+    def vector_exits(self):
+        return self.parameter.take_profit, self.stop_days
+
+    def next_action_index(self, bars, index, pos_ls):
+        """
+        空仓时：下一个出现开仓信号的bar；
+        持仓时：下一个获利超过take_profit或持仓时间超过stop_days的bar
+        """
+        if len(pos_ls) == 0:
+            if self.entry_cache is None or self.entry_cache[0] is not bars:
+                self.entry_cache = (bars, np.flatnonzero(self.vector_signals(bars)))
+            entries = self.entry_cache[1]
+            i = np.searchsorted(entries, index + 1)
+            return int(entries[i]) if i < len(entries) else len(bars)
+
+        price = bars.columns['open']
+        time = bars.columns['date_time']
+        target = len(bars)
+        for pos in pos_ls:
+            stop = int(np.searchsorted(time, np.datetime64(pos.open_time + self.stop_days, 'ns'), side='right'))
+            stop = max(stop, index + 1)
+            hit = np.flatnonzero(pos.profit_at(price[index + 1:stop]) > self.parameter.take_profit)
+            target = min(target, index + 1 + int(hit[0]) if len(hit) else stop)
+        return target
+
     # @fn_timer
     def run(self, data_new, pos_ls):
         open_order_flow = []
@@ -117,6 +166,78 @@ class StrategyBoll(StrategyBase):
         return open_order_flow, close_order_flow
 
 
+class BatchStrategyBoll(BatchStrategyBase):
+    """
+    批量参数的布林带策略：逻辑与StrategyBoll一致，均值/标准差由各参数窗口内的滑动和增量更新
+    """
+    resync_period = 8192    # 每隔若干bar按窗口重新求和，消除累计舍入误差
+
+    def prepare(self, bars):
+        self.tau = self.parameter_array('tau', np.int64)
+        self.delta = self.parameter_array('delta')
+        self.take_profit = self.parameter_array('take_profit')
+        self.stop_time = np.array([np.timedelta64(datetime.timedelta(days=p.stop_days), 'ns').astype(np.int64)
+                                   for p in self.parameter_list])
+        price = np.asarray(bars.columns['open'], dtype=np.float64)
+        self.shift = price[0] if len(price) else 0.0    # 价格平移后求和，减小舍入误差
+        # 前面补tau_max个0，窗口外的旧值统一按下标取出，窗口未满时取到0
+        tau_max = int(self.tau.max())
+        self.y = np.concatenate((np.zeros(tau_max), price - self.shift))
+        self.y2 = self.y * self.y
+        self.old_index = tau_max - self.tau - 1     # 每个bar先自增，指向移出窗口的旧值
+        self.new_index = tau_max - 1
+        self.tau_max = tau_max
+        self.s1 = np.zeros(self.size)   # 窗口内的和
+        self.s2 = np.zeros(self.size)   # 窗口内的平方和
+
+    def update_indicators(self, index):
+        self.new_index += 1
+        self.old_index += 1
+        self.s1 += self.y[self.new_index]
+        self.s1 -= self.y.take(self.old_index)
+        self.s2 += self.y2[self.new_index]
+        self.s2 -= self.y2.take(self.old_index)
+        if (index + 1) % self.resync_period == 0:
+            for i, tau in enumerate(self.tau):
+                self.s1[i] = self.y[self.new_index + 1 - tau:self.new_index + 1].sum()
+                self.s2[i] = self.y2[self.new_index + 1 - tau:self.new_index + 1].sum()
+
+    def run(self, index, price, time, positions):
+        self.update_indicators(index)
+        if index + 1 < self.tau_max:
+            count = np.minimum(index + 1, self.tau)
+        else:
+            count = self.tau
+        mean = self.s1 / count
+        std = np.sqrt(np.maximum(self.s2 / count - mean * mean, 0.0))
+        band = std * self.delta
+        y = price - self.shift
+        # ORDER_TYPE_BUY = 1, ORDER_TYPE_SELL = -1
+        signal = (y > mean + band).view(np.int8) - (y < mean - band).view(np.int8)
+        if index + 1 < self.tau_max:
+            signal[index + 1 < self.tau] = 0
+        close = (positions.profit > self.take_profit) | (positions.hold_time > self.stop_time)
+        return signal, close
+
+
+def sweep():
+    # 参数扫描
+    data = get_future_data(path='../Data/FutureData/', nrows=100000)
+    parameter_list = parameter_grid(ParameterBoll, tau=[60, 120, 240], delta=[1.5, 2, 2.5], take_profit=[3000, 5000])
+    result = ParameterSweep(StrategyBoll, parameter_list, data, SymbolRB()).run()
+    print(result.sort_values('annualized_rate', ascending=False))
+
+
+def batch_sweep():
+    # 批量参数回测：一次遍历数据回测全部参数
+    data = get_future_data(path='../Data/FutureData/', nrows=100000)
+    parameter_list = parameter_grid(ParameterBoll, tau=[60, 120, 240], delta=[1.5, 2, 2.5], take_profit=[3000, 5000],
+                                    stop_days=[3, 7, 14])
+    bt = BatchBackTestEngine(data, BatchStrategyBoll(1, parameter_list, SymbolRB()), Account(initial_capital=100000))
+    bt.run()
+    print(bt.result_table().sort_values('annualized_rate', ascending=False))
+
+
 if __name__ == '__main__':
     data = get_future_data(path='../Data/FutureData/', nrows=100000)
     s = StrategyBoll(strategy_id=1, parameter=ParameterBoll(), symbol=SymbolRB())
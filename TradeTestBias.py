@@ -2,16 +2,16 @@
 import pandas as pd
 from core.common import *
 from core.Symbol import SymbolRB
-from core.Account import Account
+from core.Account import Account, EquityRecorder
 from core.Engine import BacKTestEngine2
 from core.Function import fn_timer
-from core.Strategy import StrategyBase
-from collections import deque
+from core.Metrics import performance_metrics
+from core.Strategy import BatchStrategyBase, StrategyBase
+from core.Indicator import RollingBias, rolling_mean
+from core.BatchEngine import CrossSymbolEngine
 import datetime
 import numpy as np
 from core.Order import MarketOrder
-import copy
-import matplotlib.pyplot as plt
 
 # 使用订单列表作为持仓进行测试
 
@@ -44,14 +44,22 @@ class StrategyBias(StrategyBase):
     def __init__(self, strategy_id, parameter, symbol):
         super().__init__(strategy_id, parameter, symbol)
 
-        self.price = deque(maxlen=parameter.tau)
+        self.bias = self.use_indicator(RollingBias, parameter.tau)  # 乖离率
+        self.price = None
         self.stop_days = datetime.timedelta(days=self.parameter.stop_days)
         self.engine = None
         self.time = None
         self.open_flag = None
 
+    def set_parameter(self, parameter):
+        super().set_parameter(parameter)
+        self.indicators = []
+        self.bias = self.use_indicator(RollingBias, parameter.tau)
+        self.stop_days = datetime.timedelta(days=parameter.stop_days)
+
     def update_data(self, data):
-        self.price.append(data.open)
+        self.update_indicators(data)
+        self.price = data.open
         self.time = data.date_time
 
     def open_condition(self):
@@ -62,14 +70,13 @@ class StrategyBias(StrategyBase):
         :return:
         """
         # 策略未达到初始化要求不允许开仓
-        if len(self.price) < self.parameter.tau:
+        if not self.bias.ready:
             return False
         # 当前策略持仓不允许开新仓
         if not self.engine.position_list.is_empty(self.strategy_id):
             self.open_flag = None
             return False
-        ma = np.mean(self.price)
-        bias_current = (self.price[-1] - ma) / ma
+        bias_current = self.bias.value
         # print(bias_current)
 
         # 反转做多
@@ -142,12 +149,41 @@ class StrategyBias(StrategyBase):
                 self.send_order(close_order, ORDER_CLOSE)
 
 
+class BatchStrategyBias(BatchStrategyBase):
+    """
+    跨品种的bias策略：同一组参数在多个品种上运行，逻辑与StrategyBias一致，乖离率按品种自身的bar计算
+    """
+    def __init__(self, strategy_id, parameter, symbols):
+        super().__init__(strategy_id, [parameter] * len(symbols), symbols)
+
+    def prepare(self, panel):
+        self.bias_buy_open = self.parameter_array('bias_buy_open')
+        self.bias_sell_open = self.parameter_array('bias_sell_open')
+        self.take_profit = self.parameter_array('take_profit')
+        self.stop_time = np.array([np.timedelta64(datetime.timedelta(days=p.stop_days), 'ns').astype(np.int64)
+                                   for p in self.parameter_list])
+        # 乖离率[时间, 品种]，该品种没有bar的时间为nan(不产生信号)
+        self.bias = np.full(panel.price.shape, np.nan)
+        for j, p in enumerate(self.parameter_list):
+            price = panel.open(j)
+            mean = rolling_mean(price, p.tau)
+            self.bias[panel.rows[j], j] = (price - mean) / mean
+
+    def run(self, index, price, time, positions):
+        bias = self.bias[index]
+        signal = np.where(bias < self.bias_buy_open, ORDER_TYPE_BUY,
+                          np.where(bias > self.bias_sell_open, ORDER_TYPE_SELL, 0)).astype(np.int8)
+        close = (positions.profit > self.take_profit) | (positions.hold_time > self.stop_time)
+        return signal, close
+
+
 class MyTradeTest:
     def __init__(self, data, strategy, engine):
         self.data = data
         self.strategy = strategy
         self.engine = engine
-        self.account_dict = []
+        self.recorder = EquityRecorder()     # 账户资金记录
+        self.metrics = None     # 绩效指标
 
     def back_test(self):
         for index, row in self.data.iterrows():
@@ -160,8 +196,8 @@ class MyTradeTest:
             # 运行每个策略
             for i, s in enumerate(self.strategy):
                     s.run(row, self.engine)
-            self.account_dict.append(dict(copy.deepcopy(self.engine.account.__dict__), **{'time': row.date_time}))
-        day_num = (self.account_dict[-1].get('time') - self.account_dict[0].get('time')) / np.timedelta64(1, 'D')
+            self.engine.account.record(self.recorder, row.date_time)
+        day_num = (self.recorder['time'][-1] - self.recorder['time'][0]) / np.timedelta64(1, 'D')
         total_rate = (self.engine.account.equity / self.engine.account.initial_capital) - 1
         annualized_rate = (self.engine.account.equity / self.engine.account.initial_capital) ** (365 / day_num) - 1
         print('back test OK!')
@@ -169,30 +205,21 @@ class MyTradeTest:
         return day_num, total_rate, annualized_rate
 
     def result_analysis(self, need_plot=False):
-        res_account = pd.DataFrame(self.account_dict).set_index('time')
-        equity_array = np.array(res_account['equity'])
-        res_account['max_draw_down'] = [(equity_array[i:].min()-equity_array[i])/equity_array[i] for i in range(len(equity_array)) ]
-        capital = res_account[['balance', 'equity']]
+        equity_array = self.recorder['equity']
+        self.metrics = performance_metrics(equity_array, self.recorder['time'], self.engine.trade_list)
         if need_plot:
-            plt.figure(1)
-            ax1 = plt.subplot(211)
-            ax2 = plt.subplot(212)
-            # plt.figure(1)
-            plt.sca(ax1)
-            plt.plot(capital)
-            plt.sca(ax2)
-            plt.plot(res_account['max_draw_down'])
-            plt.show()
-
-        rate = res_account['equity'][-1]/res_account['equity'][0]-1
-        max_draw_down = min(res_account['max_draw_down'])
-
-        day_num = (self.account_dict[-1].get('time') - self.account_dict[0].get('time')) / np.timedelta64(1, 'D')
-        annualized_rate = (rate + 1) ** (365 / day_num) - 1
-
-        print('Days', day_num, 'equity at last:', res_account['equity'][-1], 'equity at begin:', res_account['equity'][0],
-              'Total Rate:', rate, 'Annualized Rate:', annualized_rate, 'Max-Draw down:', max_draw_down)
-        plt.savefig('test.png')
+            from core.Report import plot_equity
+            plot_equity(self.recorder, 'test.png')
+
+        rate = self.metrics['total_rate']
+        max_draw_down = self.metrics['max_draw_down']
+
+        day_num = self.metrics['days']
+        annualized_rate = self.metrics['annualized_rate']
+
+        print('Days', day_num, 'equity at last:', equity_array[-1], 'equity at begin:', equity_array[0],
+              'Total Rate:', rate, 'Annualized Rate:', annualized_rate, 'Max-Draw down:', max_draw_down,
+              'Sharpe:', self.metrics['sharpe_ratio'], 'Win Rate:', self.metrics['win_rate'])
         return annualized_rate, max_draw_down
 
 
@@ -217,5 +244,24 @@ def test():
     print('back test end...')
     mtt.result_analysis(need_plot=True)
 
+
+def cross_symbol_test(symbols, files, path='../Data/FutureData/', nrows=100000):
+    """
+    同一Bias配置在多个品种上的向量化回测
+    :param symbols: FutureSymbol列表
+    :param files: 与symbols对应的数据文件名
+    """
+    from data_manager.DataEngine import get_future_data
+    feeds = [get_future_data(file_name, symbol.symbol_name, path=path, nrows=nrows)
+             for symbol, file_name in zip(symbols, files)]
+    p_bias = ParameterBias(tau=120, bias_buy_open=-0.005, bias_buy_close=0, bias_sell_open=0.005,
+                           bias_sell_close=0, stop_days=0.5, take_profit=500)
+    bt = CrossSymbolEngine(feeds, BatchStrategyBias(strategy_id=1, parameter=p_bias, symbols=symbols),
+                           Account(initial_capital=100000))
+    bt.run()
+    print(bt.result_table())
+    return bt
+
+
 if __name__ == '__main__':
     test()
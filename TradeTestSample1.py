@@ -2,16 +2,15 @@
 import pandas as pd
 from core.common import *
 from core.Symbol import SymbolRB
-from core.Account import Account
+from core.Account import Account, EquityRecorder
 from core.Engine import BacKTestEngine1
 from core.Function import fn_timer
+from core.Metrics import performance_metrics
 from core.Strategy import StrategyBase
-from collections import deque
+from core.Indicator import RollingStd
 import datetime
 import numpy as np
 from core.Order import FutureMarketOrder
-import copy
-import matplotlib.pyplot as plt
 
 # 使用订单列表作为持仓进行测试
 
@@ -34,14 +33,16 @@ class StrategyBoll(StrategyBase):
     def __init__(self, strategy_id, parameter, symbol):
         super().__init__(strategy_id, parameter, symbol)
 
-        self.price = deque(maxlen=parameter.tau)
+        self.boll = self.add_indicator(RollingStd(parameter.tau))   # 布林带均值和标准差
+        self.price = None
         self.stop_days = datetime.timedelta(days=self.parameter.stop_days)
         self.engine = None
         self.time = None
         self.open_flag = None
 
     def update_data(self, data):
-        self.price.append(data.open)
+        self.update_indicators(data)
+        self.price = data.open
         self.time = data.date_time
 
     def open_condition(self):
@@ -51,7 +52,7 @@ class StrategyBoll(StrategyBase):
         :return:
         """
         # 策略未达到初始化要求不允许开仓
-        if len(self.price) < self.parameter.tau:
+        if not self.boll.ready:
             return False
 
         # 当前策略持仓不允许开新仓
@@ -59,14 +60,14 @@ class StrategyBoll(StrategyBase):
             self.open_flag = None
             return False
 
-        mean = np.mean(self.price)
-        std = np.std(self.price)
+        mean = self.boll.mean
+        std = self.boll.value
         # 向上趋势突破
-        if self.price[-1] > mean + std*self.parameter.delta:
+        if self.price > mean + std*self.parameter.delta:
             self.open_flag = 'buy'
             return True
         # 向下趋势突破
-        elif self.price[-1] < mean - std*self.parameter.delta:
+        elif self.price < mean - std*self.parameter.delta:
             self.open_flag = 'sell'
             return True
         else:
@@ -104,11 +105,11 @@ class StrategyBoll(StrategyBase):
         self.update_data(data)
         if self.open_condition():
             if self.open_flag == 'buy':
-                open_order = FutureMarketOrder(open_time=self.time, open_price=self.price[-1], symbol=self.symbol,
+                open_order = FutureMarketOrder(open_time=self.time, open_price=self.price, symbol=self.symbol,
                                                order_type=ORDER_TYPE_BUY, lots=1, strategy_id=self.strategy_id)
                 print('send open_buy_order at time:', self.time)
             else:
-                open_order = FutureMarketOrder(open_time=self.time, open_price=self.price[-1], symbol=self.symbol,
+                open_order = FutureMarketOrder(open_time=self.time, open_price=self.price, symbol=self.symbol,
                                                order_type=ORDER_TYPE_SELL, lots=1, strategy_id=self.strategy_id)
                 print('send open_sell_order at time:', self.time)
             self.send_order(open_order, ORDER_OPEN)
@@ -127,7 +128,8 @@ class MyTradeTest:
         self.data = data
         self.strategy = strategy
         self.engine = engine
-        self.account_dict = []
+        self.recorder = EquityRecorder()     # 账户资金记录
+        self.metrics = None     # 绩效指标
 
     def back_test(self):
         for index, row in self.data.iterrows():
@@ -140,8 +142,8 @@ class MyTradeTest:
             # 运行每个策略
             for i, s in enumerate(self.strategy):
                     s.run(row, self.engine)
-            self.account_dict.append(dict(copy.deepcopy(self.engine.account.__dict__), **{'time': row.date_time}))
-        day_num = (self.account_dict[-1].get('time') - self.account_dict[0].get('time')) / np.timedelta64(1, 'D')
+            self.engine.account.record(self.recorder, row.date_time)
+        day_num = (self.recorder['time'][-1] - self.recorder['time'][0]) / np.timedelta64(1, 'D')
         total_rate = (self.engine.account.equity / self.engine.account.initial_capital) - 1
         annualized_rate = (self.engine.account.equity / self.engine.account.initial_capital) ** (365 / day_num) - 1
         print('back test OK!')
@@ -149,30 +151,21 @@ class MyTradeTest:
         return day_num, total_rate, annualized_rate
 
     def result_analysis(self, need_plot=False):
-        res_account = pd.DataFrame(self.account_dict).set_index('time')
-        equity_array = np.array(res_account['equity'])
-        res_account['max_draw_down'] = [(equity_array[i:].min()-equity_array[i])/equity_array[i] for i in range(len(equity_array)) ]
-        capital = res_account[['balance', 'equity']]
+        equity_array = self.recorder['equity']
+        self.metrics = performance_metrics(equity_array, self.recorder['time'], self.engine.trade_list)
         if need_plot:
-            plt.figure(1)
-            ax1 = plt.subplot(211)
-            ax2 = plt.subplot(212)
-            # plt.figure(1)
-            plt.sca(ax1)
-            plt.plot(capital)
-            plt.sca(ax2)
-            plt.plot(res_account['max_draw_down'])
-            plt.show()
-
-        rate = res_account['equity'][-1]/res_account['equity'][0]-1
-        max_draw_down = min(res_account['max_draw_down'])
-
-        day_num = (self.account_dict[-1].get('time') - self.account_dict[0].get('time')) / np.timedelta64(1, 'D')
-        annualized_rate = (rate + 1) ** (365 / day_num) - 1
-
-        print('Days', day_num, 'equity at last:', res_account['equity'][-1], 'equity at begin:', res_account['equity'][0],
-              'Total Rate:', rate, 'Annualized Rate:', annualized_rate, 'Max-Draw down:', max_draw_down)
-        plt.savefig('test.png')
+            from core.Report import plot_equity
+            plot_equity(self.recorder, 'test.png')
+
+        rate = self.metrics['total_rate']
+        max_draw_down = self.metrics['max_draw_down']
+
+        day_num = self.metrics['days']
+        annualized_rate = self.metrics['annualized_rate']
+
+        print('Days', day_num, 'equity at last:', equity_array[-1], 'equity at begin:', equity_array[0],
+              'Total Rate:', rate, 'Annualized Rate:', annualized_rate, 'Max-Draw down:', max_draw_down,
+              'Sharpe:', self.metrics['sharpe_ratio'], 'Win Rate:', self.metrics['win_rate'])
         return annualized_rate, max_draw_down
 
 
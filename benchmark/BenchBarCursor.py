@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import io
+import time
+from core.Account import Account
+from core.Bar import BarCursor
+from core.Engine import BackTestEngine
+from core.Symbol import SymbolRB
+from BackTestBoll import ParameterBoll, StrategyBoll
+from benchmark.SyntheticData import make_bar_data
+
+# 对比DataFrame.iterrows与BarCursor的逐bar吞吐量
+# 在仓库根目录以模块方式运行(依赖core和benchmark包的导入路径)：python -m benchmark.BenchBarCursor
+
+
+def bench_iterrows(data):
+    begin = time.perf_counter()
+    for index, row in data.iterrows():
+        row.open, row.date_time, row.symbol_name
+    return len(data) / (time.perf_counter() - begin)
+
+
+def bench_cursor(data):
+    begin = time.perf_counter()
+    for bar in BarCursor.from_frame(data):
+        bar.open, bar.date_time, bar.symbol_name
+    return len(data) / (time.perf_counter() - begin)
+
+
+def bench_engine(data):
+    s = StrategyBoll(strategy_id=1, parameter=ParameterBoll(), symbol=SymbolRB())
+    bt = BackTestEngine(data=data, strategy=[s], account=Account(initial_capital=100000))
+    begin = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        bt.run()
+    return len(data) / (time.perf_counter() - begin)
+
+
+if __name__ == '__main__':
+    for n in (10000, 100000):
+        test_data = make_bar_data(n)
+        print('bars:', n,
+              'iterrows(bars/sec): %.0f' % bench_iterrows(test_data),
+              'cursor(bars/sec): %.0f' % bench_cursor(test_data),
+              'BackTestEngine.run(bars/sec): %.0f' % bench_engine(test_data))
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import copy
+import datetime
+import time
+import tracemalloc
+from core.Account import Account, EquityRecorder
+
+# 对比逐bar深拷贝账户字典与EquityRecorder的耗时和内存
+# 在仓库根目录以模块方式运行(依赖core和benchmark包的导入路径)：python -m benchmark.BenchEquityRecorder
+
+
+def record_by_deepcopy(account, times):
+    account_dict = []
+    for t in times:
+        account_dict.append(dict(copy.deepcopy(account.__dict__), **{'time': t}))
+    return account_dict
+
+
+def record_by_recorder(account, times):
+    recorder = EquityRecorder()
+    for t in times:
+        account.record(recorder, t)
+    return recorder
+
+
+def measure(func, account, times):
+    # 计时与内存分开测量，避免tracemalloc影响耗时
+    begin = time.perf_counter()
+    func(account, times)
+    used = time.perf_counter() - begin
+    tracemalloc.start()
+    result = func(account, times)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return used / len(times) * 1e9, current / 2 ** 20, peak / 2 ** 20
+
+
+if __name__ == '__main__':
+    n = 100000
+    start = datetime.datetime(2015, 1, 5, 9)
+    times = [start + datetime.timedelta(minutes=i) for i in range(n)]
+    for name, func in (('deepcopy', record_by_deepcopy), ('recorder', record_by_recorder)):
+        ns_per_bar, retained, peak = measure(func, Account(), times)
+        print('%-8s bars: %d  ns/bar: %.0f  retained(MB): %.1f  peak(MB): %.1f' % (name, n, ns_per_bar, retained, peak))
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import datetime
+import time
+from core.Account import Account
+from core.common import *
+from core.Position import Position, PositionList
+from core.PositionBook import PositionBook
+from core.Symbol import SymbolRB
+
+# 对比逐仓位盯市与仓位账本向量化盯市的耗时
+# 在仓库根目录以模块方式运行(依赖core和benchmark包的导入路径)：python -m benchmark.BenchPositionBook
+
+
+def open_positions(position_list, n_positions, open_time):
+    symbol = SymbolRB()
+    for i in range(n_positions):
+        position_type = POSITION_TYPE_LONG if i % 2 else POSITION_TYPE_SHORT
+        position_list.add(Position(strategy_id=i, symbol=symbol, position_type=position_type,
+                                   open_time=open_time, open_price=3000 + i, lots=1))
+
+
+def bench_loop(n_positions, n_bars, open_time):
+    account, position_list = Account(), PositionList()
+    open_positions(position_list, n_positions, open_time)
+    begin = time.perf_counter()
+    for i in range(n_bars):
+        for pos in position_list.get_by_symbol('rb-SHF'):
+            pos.update(close_time=open_time, close_price=3000 + i % 50)
+            account.update(profit_increased=pos.profit, margin_increased=pos.margin[1] - pos.margin[0],
+                           event_type=EVENT_TYPE_TICK_CHANGE)
+    return (time.perf_counter() - begin) / n_bars * 1e6
+
+
+def bench_book(n_positions, n_bars, open_time):
+    account, book = Account(), PositionBook()
+    open_positions(book, n_positions, open_time)
+    begin = time.perf_counter()
+    for i in range(n_bars):
+        profit, margin_increased = book.mark_to_market('rb-SHF', open_time, 3000 + i % 50)
+        account.update(profit_increased=profit, margin_increased=margin_increased, event_type=EVENT_TYPE_TICK_CHANGE)
+    return (time.perf_counter() - begin) / n_bars * 1e6
+
+
+if __name__ == '__main__':
+    t = datetime.datetime(2015, 1, 5, 9)
+    for n in (1, 10, 100, 1000):
+        print('positions: %4d  loop(us/bar): %8.1f  book(us/bar): %8.1f' % (n, bench_loop(n, 2000, t), bench_book(n, 2000, t)))
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+import argparse
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import tempfile
+import time
+
+# 回测基准测试集：
+#   在合成数据上测量三个回测引擎在不同bar数目/策略数目下的吞吐量(bars/sec)和峰值内存，
+#   以及数据读取(csv、列式缓存、流式读取)和绩效分析，结果写入json，便于不同版本之间对比
+#   每个场景在单独的子进程中运行，峰值内存(ru_maxrss)互不影响
+#   在仓库根目录以模块方式运行(依赖core和benchmark包的导入路径)：python -m benchmark.BenchSuite --help
+
+BAR_COUNTS = (10000, 100000, 1000000)
+STRATEGY_COUNTS = (1, 10, 100)
+ENGINES = ('BacKTestEngine1', 'BacKTestEngine2', 'BackTestEngine')
+# 单个场景的工作量(bar数 * 策略数)上限，超过时跳过：旧引擎逐行iterrows，百万级工作量需要数十分钟
+WORK_LIMITS = {'BacKTestEngine1': 2e6, 'BacKTestEngine2': 2e6, 'BackTestEngine': 2e7}
+
+
+def boll_parameters(n):
+    """
+    n组布林带策略参数，窗口、带宽、止盈和持仓时间轮换取值
+    """
+    from BackTestBoll import ParameterBoll
+    taus, deltas, take_profits = (60, 120, 240), (1.5, 2, 2.5), (500, 2000, 5000)
+    return [ParameterBoll(tau=taus[i % 3], delta=deltas[i // 3 % 3], take_profit=take_profits[i // 9 % 3],
+                          stop_days=0.5 + i % 5) for i in range(n)]
+
+
+def bench_engine(engine_name, n_bars, n_strategies, seed=0):
+    """
+    回测引擎的逐bar回测
+    :param engine_name: ENGINES中的引擎名称
+    :return: 耗时(秒)
+    """
+    from benchmark.SyntheticData import make_bar_data
+    from core.Account import Account
+    from core.Symbol import SymbolRB
+    data = make_bar_data(n_bars, seed=seed)
+    parameters = boll_parameters(n_strategies)
+    if engine_name == 'BackTestEngine':
+        from core.Engine import BackTestEngine
+        from BackTestBoll import StrategyBoll
+        bt = BackTestEngine(data, [StrategyBoll(i + 1, p, SymbolRB()) for i, p in enumerate(parameters)],
+                            Account(100000))
+        run = bt.run
+    else:
+        # 旧引擎由TradeTestSample1/2中的MyTradeTest驱动
+        import core.Engine
+        if engine_name == 'BacKTestEngine1':
+            import TradeTestSample1 as sample
+        else:
+            import TradeTestSample2 as sample
+        engine = getattr(core.Engine, engine_name)(Account(100000))
+        bt = sample.MyTradeTest(data, [sample.StrategyBoll(i + 1, p, SymbolRB()) for i, p in enumerate(parameters)],
+                                engine)
+        run = bt.back_test
+    begin = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        run()
+    return time.perf_counter() - begin
+
+
+def bench_write_csv(path, n_bars, seed=0):
+    from benchmark.SyntheticData import write_bar_csv
+    write_bar_csv(path, n_bars, seed=seed)
+    return 0.0
+
+
+def bench_load(method, path):
+    """
+    数据读取
+    :param method: read_csv(不使用缓存), cache_build(首次读取并建立缓存), cache_load(读取已有缓存), stream(流式读取全部bar)
+    :param path: csv文件路径
+    :return: 耗时(秒)
+    """
+    from data_manager.DataEngine import get_future_data, get_future_stream
+    import pandas   # get_future_data在函数内导入pandas，提前导入使首次计时不包含导入耗时
+    directory, file_name = os.path.split(path)
+    directory += os.sep
+    begin = time.perf_counter()
+    if method == 'stream':
+        for bar in get_future_stream(file_name, path=directory):
+            pass
+    else:
+        data = get_future_data(file_name, path=directory, nrows=None, use_cache=method != 'read_csv')
+        data['open'].to_numpy().sum()   # 读取内存映射的列
+    return time.perf_counter() - begin
+
+
+def bench_analysis(n_bars, seed=0):
+    """
+    BackTestEngine.result_analysis(绩效指标)，资金曲线为随机游走
+    """
+    import numpy as np
+    from benchmark.SyntheticData import make_bar_data
+    from core.Account import Account, EquityRecorder
+    from core.Engine import BackTestEngine
+    data = make_bar_data(n_bars, seed=seed)
+    bt = BackTestEngine(data, [], Account(100000))
+    equity = 100000 + np.cumsum(np.random.default_rng(seed).normal(0, 50, n_bars))
+    values = np.zeros((n_bars, len(EquityRecorder.FIELDS)))
+    values[:, 0] = values[:, 1] = values[:, 3] = equity
+    bt.recorder.extend(data['date_time'].to_numpy(), values)
+    begin = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        bt.result_analysis()
+    return time.perf_counter() - begin
+
+
+def _max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _measure(function_name, args):
+    start_rss = _max_rss_mb()
+    seconds = globals()[function_name](*args)
+    return seconds, start_rss, _max_rss_mb()
+
+
+def run_isolated(function_name, *args):
+    """
+    在新的子进程中运行一个场景
+    :return: (耗时, 子进程开始时的峰值内存MB, 结束时的峰值内存MB)
+    """
+    with multiprocessing.Pool(1) as pool:
+        return pool.apply(_measure, (function_name, args))
+
+
+class BenchSuite:
+    """
+    基准测试集：依次运行各场景，汇总为结果列表
+    """
+    def __init__(self, bar_counts=BAR_COUNTS, strategy_counts=STRATEGY_COUNTS, engines=ENGINES,
+                 work_limits=None, seed=0, load=True, analysis=True):
+        self.bar_counts = bar_counts
+        self.strategy_counts = strategy_counts
+        self.engines = engines
+        self.work_limits = dict(WORK_LIMITS, **(work_limits or {}))
+        self.seed = seed
+        self.load = load
+        self.analysis = analysis
+        self.results = []
+
+    def add_result(self, scenario, seconds, start_rss, peak_rss, **fields):
+        result = dict(scenario=scenario, **fields)
+        result.update({'seconds': seconds, 'bars_per_sec': fields['bars'] / seconds if seconds > 0 else None,
+                       'peak_rss_mb': peak_rss, 'peak_increase_mb': peak_rss - start_rss})
+        self.results.append(result)
+        print('%-14s %-16s bars: %8d strategies: %4s  %8.2fs  bars/sec: %10.0f  peak(MB): %7.1f (+%.1f)' % (
+            scenario, fields.get('engine', fields.get('method', '')), fields['bars'], fields.get('strategies', '-'),
+            seconds, result['bars_per_sec'] or 0, peak_rss, peak_rss - start_rss))
+        return result
+
+    def run(self):
+        for n_bars in self.bar_counts:
+            for engine in self.engines:
+                for n_strategies in self.strategy_counts:
+                    if n_bars * n_strategies > self.work_limits[engine]:
+                        print('skip %s bars: %d strategies: %d (over work limit)' % (engine, n_bars, n_strategies))
+                        continue
+                    self.add_result('engine', *run_isolated('bench_engine', engine, n_bars, n_strategies, self.seed),
+                                    engine=engine, bars=n_bars, strategies=n_strategies)
+            if self.load:
+                directory = tempfile.mkdtemp(prefix='bench-')
+                try:
+                    path = os.path.join(directory, 'bench-%d.csv' % n_bars)
+                    run_isolated('bench_write_csv', path, n_bars, self.seed)
+                    for method in ('read_csv', 'cache_build', 'cache_load', 'stream'):
+                        self.add_result('load', *run_isolated('bench_load', method, path), method=method, bars=n_bars)
+                finally:
+                    shutil.rmtree(directory, ignore_errors=True)
+            if self.analysis:
+                self.add_result('result_analysis', *run_isolated('bench_analysis', n_bars, self.seed), bars=n_bars)
+        return self.results
+
+    def to_json(self, path):
+        import numpy as np
+        report = {
+            'meta': {'time': datetime.datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+                     'numpy': np.__version__, 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+                     'seed': self.seed},
+            'results': self.results,
+        }
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        return path
+
+
+def _result_key(result):
+    return result['scenario'], result.get('engine', result.get('method')), result['bars'], result.get('strategies')
+
+
+def compare(old_path, new_path):
+    """
+    对比两次结果的吞吐量：new/old > 1 为变快
+    """
+    with open(old_path) as f:
+        old = {_result_key(r): r for r in json.load(f)['results']}
+    with open(new_path) as f:
+        new = json.load(f)['results']
+    for result in new:
+        previous = old.get(_result_key(result))
+        if previous and previous['bars_per_sec'] and result['bars_per_sec']:
+            print('%-14s %-16s bars: %8d strategies: %4s  speed: %6.2fx  peak: %+8.1fMB' % (
+                result['scenario'], _result_key(result)[1] or '', result['bars'], result.get('strategies', '-'),
+                result['bars_per_sec'] / previous['bars_per_sec'], result['peak_rss_mb'] - previous['peak_rss_mb']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='back test benchmark suite')
+    parser.add_argument('--bars', type=int, nargs='+', default=list(BAR_COUNTS))
+    parser.add_argument('--strategies', type=int, nargs='+', default=list(STRATEGY_COUNTS))
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=ENGINES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-load', action='store_true', help='skip data loading scenarios')
+    parser.add_argument('--no-analysis', action='store_true', help='skip result_analysis scenarios')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help='previous json result to compare with')
+    options = parser.parse_args()
+    suite = BenchSuite(options.bars, options.strategies, options.engines, seed=options.seed,
+                       load=not options.no_load, analysis=not options.no_analysis)
+    suite.run()
+    print('results:', suite.to_json(options.output))
+    if options.compare:
+        compare(options.compare, options.output)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+from core.common import *
+
+
+def make_bar_data(n_bars=10000, symbol_name='rb-SHF', start='2015-01-05 09:00:00', start_price=3000.0,
+                  volatility=0.0008, seed=0):
+    """
+    生成可复现的分钟bar数据，格式与BAR_DATA_COLUMN_NAMES_10一致
+    :param n_bars: bar数目
+    :param symbol_name: 品种名称
+    :param start: 起始时间
+    :param start_price: 起始价格
+    :param volatility: 每分钟对数收益率的标准差
+    :param seed: 随机种子
+    :return:
+    """
+    rng = np.random.default_rng(seed)
+    log_return = rng.normal(0, volatility, n_bars)
+    close = np.round(start_price * np.exp(np.cumsum(log_return)))
+    open_ = np.empty(n_bars)
+    open_[0] = start_price
+    open_[1:] = close[:-1]
+    spread = np.round(np.abs(rng.normal(0, volatility * start_price, n_bars)))
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread
+    volume = rng.integers(100, 5000, n_bars).astype(np.float64)
+    data = pd.DataFrame({
+        'date_time': pd.date_range(start=start, periods=n_bars, freq='min'),
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': volume,
+        'turn_over': volume * close * 10,
+        'match_item': np.zeros(n_bars),
+        'interest': rng.integers(1000000, 2000000, n_bars).astype(np.float64),
+        'symbol_name': symbol_name,
+    })
+    data.columns = BAR_DATA_COLUMN_NAMES_10
+    return data
+
+
+def write_bar_csv(path, n_bars=10000, seed=0, **kwargs):
+    """
+    生成数据并写成与行情csv相同的格式(不含symbol_name列，由get_future_data读取时补上)
+    :param path: csv文件路径
+    :param n_bars: bar数目
+    :param seed: 随机种子
+    :param kwargs: make_bar_data的其他参数
+    :return: path
+    """
+    data = make_bar_data(n_bars, seed=seed, **kwargs)
+    data.drop(columns='symbol_name').to_csv(path, index=False)
+    return path
+
+
+if __name__ == '__main__':
+    print(make_bar_data(10))
@@ -1,6 +1,22 @@
 # -*- coding: utf-8 -*-
+import datetime
+import numpy as np
 from core.common import *
 
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def to_ns(time):
+    """
+    将时间转换为int64纳秒时间戳
+    :param time: datetime.datetime/pd.Timestamp/np.datetime64
+    :return:
+    """
+    if type(time) is datetime.datetime:
+        return (time - _EPOCH) // _MICROSECOND * 1000
+    return int(np.datetime64(time, 'ns').astype(np.int64))
+
 
 class Account:
     def __init__(self, initial_capital=100000):
@@ -31,3 +47,177 @@ class Account:
         self.margin_used += margin_increased
         self.margin_free = self.equity - self.margin_used
         self.capital_ratio = self.margin_used/self.equity
+
+    def record(self, recorder, time):
+        """
+        将当前账户状态写入资金记录器
+        :param recorder: EquityRecorder
+        :param time: 记录时间
+        :return:
+        """
+        recorder.append(time, self.equity, self.balance, self.margin_used, self.margin_free,
+                        self.capital_ratio, self.commission)
+
+
+class EquityRecorder:
+    """
+    账户资金记录器：
+        预分配numpy数组存放每个bar的账户状态，容量不足时倍增，避免逐bar复制账户字典
+    """
+    FIELDS = ('equity', 'balance', 'margin_used', 'margin_free', 'capital_ratio', 'commission')
+
+    def __init__(self, capacity=4096):
+        self.size = 0
+        self.capacity = capacity
+        self.time = np.empty(capacity, dtype=np.int64)     # 纳秒时间戳
+        self.values = np.empty((capacity, len(self.FIELDS)))
+
+    def _grow(self, min_capacity):
+        capacity = max(self.capacity * 2, min_capacity)
+        time = np.empty(capacity, dtype=np.int64)
+        time[:self.size] = self.time[:self.size]
+        values = np.empty((capacity, len(self.FIELDS)))
+        values[:self.size] = self.values[:self.size]
+        self.time, self.values, self.capacity = time, values, capacity
+
+    def append(self, time, equity, balance, margin_used, margin_free, capital_ratio, commission):
+        if self.size == self.capacity:
+            self._grow(self.size + 1)
+        self.time[self.size] = to_ns(time)
+        self.values[self.size] = (equity, balance, margin_used, margin_free, capital_ratio, commission)
+        self.size += 1
+
+    def extend(self, time, values):
+        """
+        批量追加记录(向量化回测使用)
+        :param time: datetime64或int64纳秒时间数组
+        :param values: 形状为(记录数, len(FIELDS))的数组
+        :return:
+        """
+        time = np.asarray(time)
+        if time.dtype != np.int64:
+            time = time.astype('datetime64[ns]').view(np.int64)
+        n = len(time)
+        if self.size + n > self.capacity:
+            self._grow(self.size + n)
+        self.time[self.size:self.size + n] = time
+        self.values[self.size:self.size + n] = values
+        self.size += n
+
+    def __len__(self):
+        return self.size
+
+    def __getstate__(self):
+        # 只保存已写入的记录(断点文件不包含预分配的空间)
+        return {'size': self.size, 'time': self.time[:self.size].copy(), 'values': self.values[:self.size].copy()}
+
+    def __setstate__(self, state):
+        self.size = state['size']
+        self.capacity = max(self.size, 1)
+        self.time = np.empty(self.capacity, dtype=np.int64)
+        self.values = np.empty((self.capacity, len(self.FIELDS)))
+        self.time[:self.size] = state['time']
+        self.values[:self.size] = state['values']
+
+    def __getitem__(self, field):
+        """
+        按字段取记录：recorder['equity'], recorder['time']
+        """
+        if field == 'time':
+            return self.time[:self.size].view('datetime64[ns]')
+        return self.values[:self.size, self.FIELDS.index(field)]
+
+    def to_frame(self):
+        """
+        转换为以time为索引的DataFrame，仅在报告/绘图时使用
+        :return:
+        """
+        import pandas as pd
+        return pd.DataFrame({field: self[field] for field in self.FIELDS},
+                            index=pd.DatetimeIndex(self['time'], name='time'))
+
+
+class SpillEquityRecorder(EquityRecorder):
+    """
+    写入磁盘的资金记录器(流式回测的有界内存)：
+        内存中只保留buffer_size条记录的缓冲区，写满后追加到path.time和path.values两个二进制文件，
+        按字段取记录时返回文件的内存映射；回测内存与bar数目无关(已平仓的仓位trade_list仍随交易数目增长)
+    """
+    def __init__(self, path, buffer_size=65536):
+        """
+        :param path: 记录文件路径前缀(已存在时覆盖)
+        :param buffer_size: 内存缓冲区的记录数
+        """
+        super().__init__(buffer_size)
+        self.path = path
+        self.spilled = 0    # 已写入文件的记录数
+        self._truncate()
+
+    def _files(self):
+        return self.path + '.time', self.path + '.values'
+
+    def _truncate(self):
+        """
+        文件截断到已写入的记录数(从断点恢复时丢弃断点之后写入的记录)
+        """
+        for name, row_bytes in zip(self._files(), (8, 8 * len(self.FIELDS))):
+            with open(name, 'ab') as f:
+                f.truncate(self.spilled * row_bytes)
+
+    def flush(self):
+        """
+        缓冲区的记录追加到文件
+        """
+        if self.size == 0:
+            return
+        time_file, values_file = self._files()
+        with open(time_file, 'ab') as f:
+            f.write(self.time[:self.size].tobytes())
+        with open(values_file, 'ab') as f:
+            f.write(self.values[:self.size].tobytes())
+        self.spilled += self.size
+        self.size = 0
+
+    def append(self, time, equity, balance, margin_used, margin_free, capital_ratio, commission):
+        if self.size == self.capacity:
+            self.flush()
+        super().append(time, equity, balance, margin_used, margin_free, capital_ratio, commission)
+
+    def extend(self, time, values):
+        n = len(time)
+        if self.size + n <= self.capacity:
+            return super().extend(time, values)
+        self.flush()
+        for begin in range(0, n, self.capacity):
+            super().extend(time[begin:begin + self.capacity], values[begin:begin + self.capacity])
+            if self.size == self.capacity:
+                self.flush()
+
+    def __len__(self):
+        return self.spilled + self.size
+
+    def __getstate__(self):
+        # 断点只记录文件路径和已写入的记录数
+        self.flush()
+        return {'path': self.path, 'spilled': self.spilled, 'capacity': self.capacity}
+
+    def __setstate__(self, state):
+        EquityRecorder.__init__(self, state['capacity'])
+        self.path = state['path']
+        self.spilled = state['spilled']
+        self._truncate()
+
+    def __getitem__(self, field):
+        """
+        按字段取记录：文件的只读内存映射
+        """
+        self.flush()
+        time_file, values_file = self._files()
+        if field == 'time':
+            if self.spilled == 0:
+                return np.empty(0, dtype='datetime64[ns]')
+            return np.memmap(time_file, dtype=np.int64, mode='r', shape=(self.spilled,)).view('datetime64[ns]')
+        if self.spilled == 0:
+            return np.empty(0)
+        values = np.memmap(values_file, dtype=np.float64, mode='r', shape=(self.spilled, len(self.FIELDS)))
+        return values[:, self.FIELDS.index(field)]
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+from itertools import repeat
+import numpy as np
+from core.common import *
+
+
+class Bar:
+    """
+    单根bar数据--替代DataFrame.iterrows产生的Series，字段与BAR_DATA_COLUMN_NAMES_10一致
+    """
+    __slots__ = tuple(BAR_DATA_COLUMN_NAMES_10)
+
+    def __init__(self, date_time, open, high, low, close, volume,
+                 turn_over=None, match_item=None, interest=None, symbol_name=None):
+        self.date_time = date_time
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.turn_over = turn_over
+        self.match_item = match_item
+        self.interest = interest
+        self.symbol_name = symbol_name
+
+    def __getitem__(self, item):
+        # 兼容row['open']的取值方式
+        return getattr(self, item)
+
+    def __repr__(self):
+        return 'Bar(%s, %s, open=%s)' % (self.symbol_name, self.date_time, self.open)
+
+
+class BarCursor:
+    """
+    列式bar游标：
+        每列只转换一次为numpy数组，回测时按块转换为python对象并逐bar产生Bar
+    """
+    def __init__(self, columns, chunk_size=65536):
+        """
+        :param columns: 列名 -> 一维数组，列名取自BAR_DATA_COLUMN_NAMES_10
+        :param chunk_size: 每次转换为python对象的bar数目，控制迭代时的额外内存
+        """
+        self.columns = {}
+        for name, values in columns.items():
+            values = np.asarray(values)
+            if name == 'date_time' and values.dtype != 'datetime64[ns]':
+                values = values.astype('datetime64[ns]')
+            self.columns[name] = values
+        self.length = len(self.columns['date_time'])
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_frame(cls, data, chunk_size=65536):
+        """
+        由DataFrame构建游标，每列只取一次
+        :param data: 列名为BAR_DATA_COLUMN_NAMES_7或BAR_DATA_COLUMN_NAMES_10的DataFrame
+        :param chunk_size:
+        :return:
+        """
+        return cls({name: data[name].to_numpy() for name in data.columns}, chunk_size=chunk_size)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return self.iter_bars()
+
+    def _column_values(self, name, begin, end):
+        """
+        将某列的[begin, end)区间转换为python对象列表
+        """
+        if name not in self.columns:
+            return repeat(None)
+        values = self.columns[name][begin:end]
+        if name == 'date_time':
+            # 精度降到微秒，得到datetime.datetime，与策略中的datetime.timedelta直接比较
+            return values.astype('datetime64[us]').tolist()
+        return values.tolist()
+
+    def iter_bars(self, start=0, stop=None, chunk_size=None):
+        """
+        逐bar迭代
+        :param start: 起始位置
+        :param stop: 结束位置(不包含)
+        :param chunk_size: 每次转换的bar数目，默认为self.chunk_size
+        :return:
+        """
+        stop = self.length if stop is None else min(stop, self.length)
+        chunk_size = chunk_size or self.chunk_size
+        for begin in range(start, stop, chunk_size):
+            end = min(begin + chunk_size, stop)
+            values = [self._column_values(name, begin, end) for name in BAR_DATA_COLUMN_NAMES_10]
+            for row in zip(*values):
+                yield Bar(*row)
+
+    def slice(self, begin, end):
+        """
+        返回[begin, end)区间的游标，列为原数组的视图
+        """
+        return BarCursor({name: values[begin:end] for name, values in self.columns.items()}, self.chunk_size)
+
+    def get_bar(self, index):
+        """
+        随机访问第index根bar
+        """
+        return next(self.iter_bars(index, index + 1))
+
+
+def as_bar_cursor(data):
+    """
+    将回测数据统一转换为BarCursor
+    :param data: DataFrame或BarCursor
+    :return:
+    """
+    if isinstance(data, BarCursor):
+        return data
+    return BarCursor.from_frame(data)
+
+
+def as_bar_source(data):
+    """
+    回测引擎的数据源：DataFrame转换为BarCursor，BarCursor和bar流(逐个产生Bar的可迭代对象)原样返回
+    :param data: DataFrame、BarCursor或bar流(如DataStream.BarStream)
+    :return:
+    """
+    if isinstance(data, BarCursor) or not hasattr(data, 'columns'):
+        return data
+    return BarCursor.from_frame(data)
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from core.Account import Account
+from core.Bar import BarCursor, as_bar_cursor
+from core.Metrics import performance_metrics
+
+
+class BatchPositions:
+    """
+    参数轴上的仓位状态：每组参数至多一个仓位，position_type为0表示空仓
+    """
+    def __init__(self, size):
+        self.position_type = np.zeros(size, dtype=np.int8)
+        self.open_price = np.zeros(size)
+        self.open_time = np.zeros(size, dtype=np.int64)     # 纳秒时间戳
+        self.profit = np.zeros(size)    # 浮动盈亏(已扣平仓手续费)，开仓bar上和空仓时为0
+        self.hold_time = np.zeros(size, dtype=np.int64)     # 持仓时间(纳秒)，开仓bar上为0，空仓时无意义
+        self.commission = np.zeros(size)    # 开仓手续费
+        self.profit_slope = np.zeros(size)  # 浮动盈亏 = profit_slope * price + profit_base，空仓时系数为0
+        self.profit_base = np.zeros(size)
+
+    def mark(self, price, time):
+        """
+        按当前价格盯市
+        """
+        np.multiply(self.profit_slope, price, out=self.profit)
+        self.profit += self.profit_base
+        np.subtract(time, self.open_time, out=self.hold_time)
+
+    @property
+    def holding(self):
+        return self.position_type != 0
+
+
+class BatchBackTestEngine:
+    """
+    批量参数回测：一次遍历bar数据，同时回测一组参数
+        账户、仓位、订单状态都是参数轴上的数组，每个bar对全部参数一起更新，
+        数据解码和逐bar的python开销只发生一次；成交时序、滑点和手续费与BackTestEngine一致，
+        输出每组参数的资金曲线equity[bar, 参数]和交易统计
+    """
+    def __init__(self, data, strategy, account=Account(), lots=1):
+        """
+        :param data: DataFrame或BarCursor，只含策略品种的数据
+        :param strategy: BatchStrategyBase
+        :param account: 账户(每组参数使用相同的初始资金)
+        :param lots: 每笔交易的手数
+        """
+        self.bars = None if data is None else as_bar_cursor(data)
+        self.strategy = strategy
+        self.account = account
+        self.lots = lots
+        self.size = strategy.size   # 参数组数
+        self.positions = BatchPositions(self.size)
+        # 各组对应品种的合约参数
+        self.tons = lots * strategy.cost_array('tons_per_lots')
+        self.slip_point = strategy.cost_array('slip_point')
+        self.commission_ratio = strategy.cost_array('commission_ratio')
+        self.balance = np.full(self.size, float(account.initial_capital))
+        self.equity = None  # 资金曲线(bar数, 参数组数)
+
+        # 交易统计
+        self.trade_num = np.zeros(self.size, dtype=np.int64)
+        self.win_num = np.zeros(self.size, dtype=np.int64)
+        self.gross_profit = np.zeros(self.size)
+        self.gross_loss = np.zeros(self.size)
+        self.hold_time = np.zeros(self.size, dtype=np.int64)
+
+        if self.bars is not None:
+            symbol_names = self.bars.columns.get('symbol_name')
+            if symbol_names is not None and len(symbol_names) and np.any(symbol_names != strategy.symbol.symbol_name):
+                raise Exception('batch back test needs data of the strategy symbol only')
+
+    def open_positions(self, signal, price, time):
+        """
+        成交开仓订单
+        :param signal: 参数轴上的开仓方向，0为不开仓
+        :param price: 开盘价，标量或参数轴上的数组
+        :param time: 纳秒时间戳
+        """
+        pos = self.positions
+        o = signal != 0
+        position_type = signal[o].astype(np.float64)
+        if np.ndim(price):
+            price = price[o]
+        open_price = price + position_type * self.slip_point[o]
+        tons = self.tons[o]
+        commission = tons * open_price * self.commission_ratio[o]
+        pos.position_type[o] = signal[o]
+        pos.open_price[o] = open_price
+        pos.open_time[o] = time
+        pos.profit[o] = 0.0
+        pos.hold_time[o] = 0
+        pos.commission[o] = commission
+        pos.profit_slope[o] = tons * (position_type - self.commission_ratio[o])
+        pos.profit_base[o] = -tons * position_type * open_price
+        self.balance[o] -= commission
+
+    def close_positions(self, close):
+        """
+        成交平仓订单，按最新盯市的浮动盈亏平仓
+        :param close: 参数轴上的平仓标记
+        """
+        pos = self.positions
+        profit = pos.profit[close]
+        self.balance[close] += profit
+        net = profit - pos.commission[close]
+        self.trade_num[close] += 1
+        self.win_num[close] += net > 0
+        self.gross_profit[close] += np.where(net > 0, net, 0.0)
+        self.gross_loss[close] -= np.where(net < 0, net, 0.0)
+        self.hold_time[close] += pos.hold_time[close]
+        pos.position_type[close] = 0
+        pos.profit[close] = 0.0
+        pos.profit_slope[close] = 0.0
+        pos.profit_base[close] = 0.0
+
+    def run(self):
+        print('batch back test begin...')
+        price = np.asarray(self.bars.columns['open'], dtype=np.float64)
+        time = self.bars.columns['date_time'].view(np.int64)
+        n = len(price)
+        pos = self.positions
+        self.equity = np.empty((n, self.size))
+        pending_open = np.zeros(self.size, dtype=np.int8)
+        pending_close = np.zeros(self.size, dtype=bool)
+        self.strategy.prepare(self.bars)
+        for index, (p, t) in enumerate(zip(price.tolist(), time.tolist())):
+            # 盯市：空仓的参数组系数为0，浮动盈亏为0
+            pos.mark(p, t)
+            # 上一个bar发出的订单按当前bar开盘价成交
+            if pending_open.any():
+                self.open_positions(pending_open, p, t)
+            if pending_close.any():
+                self.close_positions(pending_close)
+            # 策略批量运行，开仓订单只对空仓的参数组有效，平仓订单只对持仓的参数组有效
+            signal, close = self.strategy.run(index, p, t, pos)
+            flat = pos.position_type == 0
+            pending_open = signal * flat
+            pending_close = close & ~flat
+            # 净值 = 余额 + 浮动盈亏(开仓bar和空仓时浮动盈亏为0)
+            np.add(self.balance, pos.profit, out=self.equity[index])
+        print('batch back test OK!')
+        return self.equity
+
+    def result_table(self):
+        """
+        :return: DataFrame，每行为一组参数及其年化收益、最大回撤等指标
+        """
+        import pandas as pd
+        time = self.bars.columns['date_time']
+        rows = []
+        for i, parameter in enumerate(self.strategy.parameter_list):
+            metrics = performance_metrics(self.equity[:, i], time)
+            row = dict(vars(parameter))
+            row.update({name: metrics[name] for name in ('annualized_rate', 'max_draw_down', 'sharpe_ratio',
+                                                         'calmar_ratio')})
+            row['trade_num'] = int(self.trade_num[i])
+            row['win_rate'] = float(self.win_num[i] / self.trade_num[i]) if self.trade_num[i] else 0.0
+            row['profit_factor'] = float(self.gross_profit[i] / self.gross_loss[i]) if self.gross_loss[i] > 0 else np.inf
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+
+class SymbolPanel:
+    """
+    多品种按共同时间轴对齐的数据：
+        time为各品种时间的并集，price[时间, 品种]为开盘价(该品种没有bar的时间向前填充)，
+        valid[时间, 品种]表示该品种在该时间有bar
+    """
+    def __init__(self, feeds, symbol_names):
+        """
+        :param feeds: 与symbol_names对应的各品种数据(DataFrame或BarCursor)
+        :param symbol_names: 品种名称列表
+        """
+        self.symbol_names = list(symbol_names)
+        self.cursors = [as_bar_cursor(feed) for feed in feeds]
+        times = [cursor.columns['date_time'].view(np.int64) for cursor in self.cursors]
+        self.time = np.unique(np.concatenate(times)) if times else np.zeros(0, dtype=np.int64)
+        self.rows = [np.searchsorted(self.time, t) for t in times]  # 各品种的bar在时间轴上的位置
+        n, m = len(self.time), len(self.cursors)
+        self.valid = np.zeros((n, m), dtype=bool)
+        price = np.zeros((n, m))
+        for j, (cursor, rows) in enumerate(zip(self.cursors, self.rows)):
+            self.valid[rows, j] = True
+            price[rows, j] = cursor.columns['open']
+        # 向前填充：取每个位置之前最近一个有bar的行，品种开始之前使用第一个价格
+        last = np.where(self.valid, np.arange(n)[:, None], -1)
+        np.maximum.accumulate(last, axis=0, out=last)
+        for j, rows in enumerate(self.rows):
+            if len(rows):
+                last[:rows[0], j] = rows[0]
+        self.price = np.take_along_axis(price, np.maximum(last, 0), axis=0)
+
+    @classmethod
+    def from_frame(cls, data, symbol_names):
+        """
+        由含symbol_name列的数据(DataFrame或BarCursor)按品种拆分构建
+        """
+        cursor = as_bar_cursor(data)
+        names = cursor.columns['symbol_name']
+        feeds = []
+        for symbol_name in symbol_names:
+            mask = names == symbol_name
+            feeds.append(BarCursor({name: values[mask] for name, values in cursor.columns.items()}))
+        return cls(feeds, symbol_names)
+
+    def open(self, j):
+        """
+        第j个品种自身的开盘价序列
+        """
+        return np.asarray(self.cursors[j].columns['open'], dtype=np.float64)
+
+
+class CrossSymbolEngine(BatchBackTestEngine):
+    """
+    跨品种向量化回测：同一策略配置在多个品种上同时运行
+        各品种按共同时间轴对齐，指标、信号、仓位和合约参数(FutureSymbol)都是品种轴上的数组，
+        每个品种使用独立的子账户(初始资金均为account.initial_capital)，逐品种的交易时序与BackTestEngine一致：
+        某品种在一个时间点没有bar时，该品种不成交、不发出订单，待成交订单保留到它的下一个bar；
+        输出逐品种的资金曲线equity[时间, 品种]和合计资金曲线
+    """
+    def __init__(self, data, strategy, account=Account(), lots=1):
+        """
+        :param data: SymbolPanel、与strategy.symbol_list对应的各品种数据列表，或含symbol_name列的数据
+        :param strategy: BatchStrategyBase，symbol为品种列表
+        :param account:
+        :param lots:
+        """
+        super().__init__(None, strategy, account, lots)
+        symbol_names = [symbol.symbol_name for symbol in strategy.symbol_list]
+        if isinstance(data, SymbolPanel):
+            self.panel = data
+        elif isinstance(data, (list, tuple)):
+            self.panel = SymbolPanel(data, symbol_names)
+        else:
+            self.panel = SymbolPanel.from_frame(data, symbol_names)
+        if self.panel.symbol_names != symbol_names:
+            raise Exception('panel symbols and strategy symbols do not match!')
+
+    def run(self):
+        print('cross symbol back test begin...')
+        panel = self.panel
+        pos = self.positions
+        self.equity = np.empty((len(panel.time), self.size))
+        pending_open = np.zeros(self.size, dtype=np.int8)
+        pending_close = np.zeros(self.size, dtype=bool)
+        self.strategy.prepare(panel)
+        for index, t in enumerate(panel.time.tolist()):
+            price = panel.price[index]
+            valid = panel.valid[index]
+            # 盯市：没有bar的品种价格不变，浮动盈亏不变
+            pos.mark(price, t)
+            # 订单在该品种的下一个bar成交
+            fill = pending_open * valid
+            if fill.any():
+                self.open_positions(fill, price, t)
+                pending_open[valid] = 0
+            fill = pending_close & valid
+            if fill.any():
+                self.close_positions(fill)
+                pending_close[valid] = False
+            # 只有当前有bar的品种运行策略
+            signal, close = self.strategy.run(index, price, t, pos)
+            flat = pos.position_type == 0
+            pending_open[valid] = (signal * flat)[valid]
+            pending_close[valid] = (close & ~flat)[valid]
+            np.add(self.balance, pos.profit, out=self.equity[index])
+        print('cross symbol back test OK!')
+        return self.equity
+
+    def aggregate_equity(self):
+        """
+        全部品种子账户的合计资金曲线
+        """
+        return self.equity.sum(axis=1)
+
+    def result_table(self):
+        """
+        :return: DataFrame，每行为一个品种的绩效指标，最后一行为合计
+        """
+        import pandas as pd
+        time = self.panel.time.view('datetime64[ns]')
+        rows = []
+        for i, symbol in enumerate(self.strategy.symbol_list):
+            # 只使用该品种自身bar上的资金记录
+            rows_i = self.panel.rows[i]
+            metrics = performance_metrics(self.equity[rows_i, i], time[rows_i])
+            rows.append({'symbol_name': symbol.symbol_name, 'annualized_rate': metrics['annualized_rate'],
+                         'max_draw_down': metrics['max_draw_down'], 'sharpe_ratio': metrics['sharpe_ratio'],
+                         'trade_num': int(self.trade_num[i]),
+                         'win_rate': float(self.win_num[i] / self.trade_num[i]) if self.trade_num[i] else 0.0})
+        metrics = performance_metrics(self.aggregate_equity(), time)
+        rows.append({'symbol_name': 'all', 'annualized_rate': metrics['annualized_rate'],
+                     'max_draw_down': metrics['max_draw_down'], 'sharpe_ratio': metrics['sharpe_ratio'],
+                     'trade_num': int(self.trade_num.sum()),
+                     'win_rate': float(self.win_num.sum() / self.trade_num.sum()) if self.trade_num.sum() else 0.0})
+        return pd.DataFrame(rows)
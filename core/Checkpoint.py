@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import io
+import os
+import pickle
+import time
+import zlib
+
+# 回测引擎的断点保存与恢复：
+#   引擎的全部状态(已处理的bar数目、账户、仓位、待成交订单流、资金记录、策略及其指标/价格窗口等)pickle后zlib压缩写入文件，
+#   回测数据本身不写入，恢复时由调用方重新提供同一份数据
+# 增量回测：保存回测结束时的状态和已处理数据的指纹，追加新bar后校验历史数据未变，只回测新增的bar
+
+MAGIC = b'BTCKPT'
+VERSION = 3
+_DATA = 'data'
+_BARS = 'bars'
+
+
+class _EnginePickler(pickle.Pickler):
+    """
+    引擎引用的回测数据只记录占位符
+    """
+    def __init__(self, file, engine):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.data = engine.data
+        self.bars = engine.bars
+
+    def persistent_id(self, obj):
+        if obj is self.bars:
+            return _BARS
+        if obj is self.data:
+            return _DATA
+        return None
+
+
+class _EngineUnpickler(pickle.Unpickler):
+    def __init__(self, file, data, bars):
+        super().__init__(file)
+        self.data = data
+        self.bars = bars
+
+    def persistent_load(self, pid):
+        if pid == _BARS:
+            return self.bars
+        if pid == _DATA:
+            return self.data
+        raise pickle.UnpicklingError('unknown persistent id %r' % pid)
+
+
+def dump_engine(engine, level=6, meta=None):
+    """
+    :param engine: BackTestEngine
+    :param level: zlib压缩级别
+    :param meta: 随断点保存的附加信息(字典)
+    :return: 断点的二进制内容
+    """
+    buffer = io.BytesIO()
+    _EnginePickler(buffer, engine).dump((meta or {}, engine))
+    return MAGIC + bytes([VERSION]) + zlib.compress(buffer.getvalue(), level)
+
+
+def load_engine_bytes(content, data):
+    """
+    :param content: dump_engine的结果
+    :param data: 与保存时相同的回测数据
+    :return: (meta, BackTestEngine)
+    """
+    from core.Bar import as_bar_source
+    if content[:len(MAGIC)] != MAGIC:
+        raise Exception('not a back test checkpoint')
+    if content[len(MAGIC)] != VERSION:
+        raise Exception('unsupported checkpoint version: %d' % content[len(MAGIC)])
+    payload = zlib.decompress(content[len(MAGIC) + 1:])
+    return _EngineUnpickler(io.BytesIO(payload), data, as_bar_source(data)).load()
+
+
+def save_engine(engine, path, level=6, meta=None):
+    """
+    保存断点：先写临时文件再改名，中断时不会留下不完整的断点
+    :param engine: BackTestEngine
+    :param path: 断点文件路径
+    :param level: zlib压缩级别
+    :param meta: 附加信息
+    :return: 写入的字节数
+    """
+    content = dump_engine(engine, level, meta)
+    tmp = '%s.tmp-%d' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(content)
+    os.replace(tmp, path)
+    return len(content)
+
+
+def load_engine(path, data):
+    """
+    从断点恢复引擎，之后调用run()从断点位置继续回测
+    :param path: 断点文件路径
+    :param data: 与保存时相同的回测数据(DataFrame、BarCursor或bar流)
+    :return: BackTestEngine
+    """
+    with open(path, 'rb') as f:
+        return load_engine_bytes(f.read(), data)[1]
+
+
+def data_fingerprint(data, end):
+    """
+    前end个bar的数据指纹：各列数值的sha1
+    :param data: DataFrame或BarCursor
+    :param end: bar数目
+    :return:
+    """
+    from core.Bar import as_bar_cursor
+    import numpy as np
+    columns = as_bar_cursor(data).columns
+    digest = hashlib.sha1(str(end).encode('utf-8'))
+    for name in sorted(columns):
+        values = columns[name][:end]
+        digest.update(name.encode('utf-8'))
+        if values.dtype == object:
+            digest.update('\0'.join(map(str, values)).encode('utf-8'))
+        else:
+            if values.dtype.kind == 'M':
+                values = values.astype('datetime64[ns]').view(np.int64)
+            digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()
+
+
+def save_incremental(engine, path, level=6):
+    """
+    回测结束后保存状态和已处理数据的指纹，之后用extend_backtest在追加的数据上继续
+    :param engine: 已运行的BackTestEngine，数据须在内存中(DataFrame或BarCursor)
+    :param path: 状态文件路径
+    :param level: zlib压缩级别
+    :return: 写入的字节数
+    """
+    if not hasattr(engine.bars, 'columns'):
+        raise Exception('incremental back test needs in-memory data (DataFrame or BarCursor)')
+    meta = {'bars': engine.position, 'fingerprint': data_fingerprint(engine.bars, engine.position)}
+    return save_engine(engine, path, level, meta)
+
+
+def extend_backtest(path, data, save=True, level=6):
+    """
+    增量回测：从保存的状态继续，只回测追加的bar
+    :param path: save_incremental保存的状态文件
+    :param data: 完整数据(已回测的历史 + 追加的bar)，历史部分须与保存时完全一致
+    :param save: 回测后是否用新状态覆盖状态文件
+    :param level: zlib压缩级别
+    :return: BackTestEngine，资金记录、交易记录覆盖全部数据
+    """
+    from core.Bar import BarCursor, as_bar_cursor
+    bars = as_bar_cursor(data)
+    with open(path, 'rb') as f:
+        # 旧数据的引用恢复为None：策略中以数据对象为键的缓存(如开仓信号)会在新数据上重新计算
+        meta, engine = load_engine_bytes(f.read(), None)
+    if 'fingerprint' not in meta:
+        raise Exception('%s is not an incremental back test state' % path)
+    consumed = meta['bars']
+    if len(bars) < consumed:
+        raise Exception('data has %d bars, fewer than the %d bars already tested' % (len(bars), consumed))
+    if data_fingerprint(bars, consumed) != meta['fingerprint']:
+        raise Exception('historical data has changed since the saved back test, re-run from the beginning')
+    if engine.indicators.precompute:
+        raise Exception('incremental back test does not support precomputed indicators')
+    engine.data = data
+    engine.bars = bars
+    engine.indicators.bars = bars if isinstance(bars, BarCursor) else None
+    if len(bars) > consumed:
+        engine.run()
+    if save:
+        save_incremental(engine, path, level)
+    return engine
+
+
+class Checkpointer:
+    """
+    回测中定期保存断点：每处理every_bars个bar，或距上次保存超过every_seconds秒
+    """
+    def __init__(self, path, every_bars=100000, every_seconds=None, level=6):
+        """
+        :param path: 断点文件路径(每次覆盖)
+        :param every_bars: 保存间隔(bar数)，None为不按bar数保存
+        :param every_seconds: 保存间隔(秒)，None为不按时间保存
+        :param level: zlib压缩级别
+        """
+        self.path = path
+        self.every_bars = every_bars
+        self.every_seconds = every_seconds
+        self.level = level
+        self.last_position = 0
+        self.last_time = time.monotonic()
+        self.saved = 0  # 保存次数
+
+    def step(self, engine):
+        """
+        引擎每处理完一个bar(或跳过一段bar)后调用
+        """
+        if self.every_bars is not None and engine.position - self.last_position >= self.every_bars:
+            self.save(engine)
+        elif self.every_seconds is not None and time.monotonic() - self.last_time >= self.every_seconds:
+            self.save(engine)
+
+    def save(self, engine):
+        self.last_position = engine.position
+        self.last_time = time.monotonic()
+        self.saved += 1
+        return save_engine(engine, self.path, self.level)
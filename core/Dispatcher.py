@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+
+class EventDispatcher:
+    """
+    按品种分发bar事件：
+        维护 品种名称 -> 订阅该品种的策略 表，每个bar只运行订阅了该品种的策略(保持策略列表中的先后顺序)；
+        未订阅任何品种的策略接收全部bar；品种 -> 仓位 表由仓位账本的get_by_symbol提供
+    """
+    def __init__(self, strategies):
+        self.strategies = list(strategies)
+        self._table = {}    # symbol_name -> [strategy]
+
+    def subscribers(self, symbol_name):
+        """
+        订阅该品种的策略列表
+        :param symbol_name:
+        :return:
+        """
+        table = self._table.get(symbol_name)
+        if table is None:
+            table = self._table[symbol_name] = [s for s in self.strategies
+                                                if not s.symbols or symbol_name in s.symbols]
+        return table
+
+    def add_strategy(self, strategy):
+        """
+        回测中加入新策略，订阅表随之重建
+        """
+        self.strategies.append(strategy)
+        self._table = {}
@@ -1,11 +1,16 @@
 # -*- coding: utf-8 -*-
 from core.Position import OrderList, Position, PositionList
+from core.PositionBook import PositionBook
 from core.common import *
-from core.Account import Account
-import copy
+from core.Account import Account, EquityRecorder
+from core.Bar import BarCursor, as_bar_source
+from core.Dispatcher import EventDispatcher
+from core.Function import PhaseProfiler
+from core.Indicator import IndicatorRegistry
+from core.Metrics import performance_metrics
+import itertools
+import time as timer
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
 
 
 class BacKTestEngine1:
@@ -17,6 +22,7 @@ class BacKTestEngine1:
         self.position_list = OrderList()    # 仓位信息
         self.current_data = None    # 回测引擎每次拿到的数据
         self.order_flow = []  # 策略产生的开仓订单流
+        self.trade_list = []    # 已平仓的订单
 
     # @fn_timer
     def update_engine(self):
@@ -26,11 +32,10 @@ class BacKTestEngine1:
             资金账户更新
         :return:
         """
-        for order in self.position_list.ol:
-            if order.symbol.symbol_name == self.current_data.symbol_name:
-                order.update(close_time=self.current_data.date_time, close_price=self.current_data.open)
-                self.account.update(profit_increased=order.profit, margin_increased=order.margin[1]-order.margin[0],
-                                    event_type=EVENT_TYPE_TICK_CHANGE)
+        for order in self.position_list.get_by_symbol(self.current_data.symbol_name):
+            order.update(close_time=self.current_data.date_time, close_price=self.current_data.open)
+            self.account.update(profit_increased=order.profit, margin_increased=order.margin[1]-order.margin[0],
+                                event_type=EVENT_TYPE_TICK_CHANGE)
 
     # @fn_timer
     def handle_orders(self):
@@ -65,6 +70,7 @@ class BacKTestEngine1:
                                     margin_increased=-order.margin[0],
                                     event_type=EVENT_TYPE_CLOSE)
                 self.position_list.remove(order)
+                self.trade_list.append(order)
 
 
 class BacKTestEngine2:
@@ -77,6 +83,7 @@ class BacKTestEngine2:
         self.current_data = None    # 回测引擎每次拿到的数据
         self.open_order_flow = []  # 策略产生的开仓订单流
         self.close_order_flow = []  # 策略产生的平仓订单流
+        self.trade_list = []    # 已平仓的仓位
 
     # @fn_timer
     def update_engine(self):
@@ -86,11 +93,10 @@ class BacKTestEngine2:
             资金账户更新
         :return:
         """
-        for pos in self.position_list.pl:
-            if pos.symbol.symbol_name == self.current_data.symbol_name:
-                pos.update(close_time=self.current_data.date_time, close_price=self.current_data.open)
-                self.account.update(profit_increased=pos.profit, margin_increased=pos.margin[1]-pos.margin[0],
-                                    event_type=EVENT_TYPE_TICK_CHANGE)
+        for pos in self.position_list.get_by_symbol(self.current_data.symbol_name):
+            pos.update(close_time=self.current_data.date_time, close_price=self.current_data.open)
+            self.account.update(profit_increased=pos.profit, margin_increased=pos.margin[1]-pos.margin[0],
+                                event_type=EVENT_TYPE_TICK_CHANGE)
 
     # @fn_timer
     def handle_orders(self):
@@ -123,8 +129,8 @@ class BacKTestEngine2:
 
         # 平仓订单流处理
         for order in self.close_order_flow:
-            for pos in self.position_list.pl:
-                if pos.symbol == order.symbol and pos.strategy_id == order.strategy_id:
+            for pos in self.position_list.get_position(order.strategy_id):
+                if pos.symbol == order.symbol:
                     if order.lots == pos.lots:
                         b1 = order.order_type == ORDER_TYPE_BUY and pos.position_type == POSITION_TYPE_SHORT
                         b2 = order.order_type == ORDER_TYPE_SELL and pos.position_type == POSITION_TYPE_LONG
@@ -133,6 +139,7 @@ class BacKTestEngine2:
                             self.account.update(profit_increased=pos.profit, margin_increased=-pos.margin[0],
                                                 event_type=EVENT_TYPE_CLOSE)
                             self.position_list.remove(pos)
+                            self.trade_list.append(pos)
                         else:
                             raise Exception('order and position direction does not match! ')    # 订单和仓位的方向不匹配
                     else:
@@ -145,17 +152,42 @@ class BackTestEngine:
     """
     回测引擎升级--使用版本
     """
-    def __init__(self, data, strategy, account=Account()):
+    def __init__(self, data, strategy, account=Account(), jump_ahead=False, precompute_indicators=False,
+                 indicator_cache=None, profile=False, checkpoint=None, recorder=None):
         self.data = data    # 回测数据
+        self.bars = as_bar_source(data)     # 列式bar游标或bar流
         self.strategy = strategy    # 回测策略
+        self.dispatcher = EventDispatcher(strategy)     # 品种 -> 策略 分发表
+        # 策略共用的指标注册表，数据在内存中时可预计算全序列
+        self.indicators = IndicatorRegistry(self.bars if isinstance(self.bars, BarCursor) else None,
+                                            precompute=precompute_indicators, cache=indicator_cache)
+        for s in strategy:
+            self.indicators.bind(s)
         self.account = account      # 账户信息
-        self.position_list = PositionList()     # 仓位信息
+        self.position_list = PositionBook()     # 仓位信息
 
         self.current_data = None
-        self.open_order_flow = []   # 策略产生的开仓订单流
-        self.close_order_flow = []      # 策略产生的平仓订单流
-
-        self.account_dict = []
+        # 策略产生的订单流，按品种存放：品种名称 -> 订单列表，在该品种的下一个bar成交
+        self.open_order_flow = {}   # 开仓订单流
+        self.close_order_flow = {}      # 平仓订单流
+        self.trade_list = []    # 已平仓的仓位
+
+        # 账户资金记录，流式回测可传入Account.SpillEquityRecorder使内存与bar数目无关
+        self.recorder = EquityRecorder() if recorder is None else recorder
+        self.metrics = None     # 绩效指标
+        self.report_future = None   # 后台生成报告的Future
+        self.profiler = PhaseProfiler(enabled=profile)  # 分阶段计时，profiler.enabled可在运行中切换
+        self._bar_end = None    # 计时：上一个bar处理结束的时刻，到下一个bar开始之间为取数据的耗时
+        self.position = 0   # 已处理的bar数目，从断点恢复后由此继续
+        self.checkpoint = checkpoint    # Checkpoint.Checkpointer，定期保存断点
+
+        self.jump_ahead = jump_ahead    # 跳跃模式：跳过所有策略都不会发出订单的bar
+        if jump_ahead:
+            if not isinstance(self.bars, BarCursor):
+                raise Exception('jump ahead mode needs in-memory data (DataFrame or BarCursor)')
+            symbol_names = self.bars.columns.get('symbol_name')
+            if symbol_names is not None and len(symbol_names) and np.any(symbol_names != symbol_names[0]):
+                raise Exception('jump ahead mode supports single symbol data only')
 
     def update_engine(self):
         """
@@ -164,21 +196,37 @@ class BackTestEngine:
             资金账户更新
         :return:
         """
-        for pos in self.position_list.pl:
-            if pos.symbol.symbol_name == self.current_data.symbol_name:
-                pos.update(close_time=self.current_data.date_time, close_price=self.current_data.open)
-                self.account.update(profit_increased=pos.profit, margin_increased=pos.margin[1] - pos.margin[0],
-                                    event_type=EVENT_TYPE_TICK_CHANGE)
+        # 当前品种的全部仓位一次性向量化盯市，账户每个bar只更新一次
+        marked = self.position_list.mark_to_market(symbol_name=self.current_data.symbol_name,
+                                                    close_time=self.current_data.date_time,
+                                                    close_price=self.current_data.open)
+        if marked is not None:
+            profit, margin_increased = marked
+            self.account.update(profit_increased=profit, margin_increased=margin_increased,
+                                event_type=EVENT_TYPE_TICK_CHANGE)
+
+    def send_orders(self, open_orders, close_orders):
+        """
+        策略发出的订单按品种放入订单流
+        :param open_orders: 开仓订单列表
+        :param close_orders: 平仓订单列表
+        :return:
+        """
+        for order in open_orders:
+            self.open_order_flow.setdefault(order.symbol.symbol_name, []).append(order)
+        for order in close_orders:
+            self.close_order_flow.setdefault(order.symbol.symbol_name, []).append(order)
 
     def handle_orders(self):
         """
-        订单流处理
+        订单流处理：只成交当前bar品种的订单，其他品种的订单保留到该品种的下一个bar
         :return:
         """
+        symbol_name = self.current_data.symbol_name
+        time = self.current_data.date_time
+        price = self.current_data.open
         # 开仓订单流处理---只处理期货市价订单
-        for order in self.open_order_flow:
-            time = self.current_data.date_time
-            price = self.current_data.open
+        for order in self.open_order_flow.pop(symbol_name, ()):
             # 开仓--买多 处理
             if order.order_type == ORDER_TYPE_BUY:
                 open_price = price + order.symbol.slip_point
@@ -192,94 +240,231 @@ class BackTestEngine:
 
             new_pos = Position(strategy_id=order.strategy_id, symbol=order.symbol, position_type=position_type,
                                open_time=time, open_price=open_price, lots=order.lots)
-            self.position_list.add(new_pos)
-            self.account.update(profit_increased=-new_pos.commission, margin_increased=new_pos.margin[0],
+            new_pos = self.position_list.add(new_pos)
+            self.account.update(profit_increased=-new_pos.commission, margin_increased=new_pos.margin,
                                 event_type=EVENT_TYPE_OPEN)
-        # 开仓订单流清空
-        self.open_order_flow = []
 
         # 平仓订单流处理
-        for order in self.close_order_flow:
-            for pos in self.position_list.pl:
-                if pos.symbol == order.symbol and pos.strategy_id == order.strategy_id:
+        for order in self.close_order_flow.pop(symbol_name, ()):
+            for pos in self.position_list.get_position(order.strategy_id):
+                if pos.symbol == order.symbol:
                     if order.lots == pos.lots:
                         b1 = order.order_type == ORDER_TYPE_BUY and pos.position_type == POSITION_TYPE_SHORT
                         b2 = order.order_type == ORDER_TYPE_SELL and pos.position_type == POSITION_TYPE_LONG
                         order_match_position = b1 or b2
                         if order_match_position:
-                            self.account.update(profit_increased=pos.profit, margin_increased=-pos.margin[0],
+                            self.account.update(profit_increased=pos.profit, margin_increased=-pos.margin,
                                                 event_type=EVENT_TYPE_CLOSE)
                             self.position_list.remove(pos)
+                            self.trade_list.append(pos)
                         else:
                             raise Exception('order and position direction does not match! ')  # 订单和仓位的方向不匹配
                     else:
                         raise Exception('order lots and position lots does not match!')  # 订单和仓位的手数不一致
 
-        self.close_order_flow = []
+    def on_bar(self, bar):
+        """
+        处理单根bar数据；profiler启用时按阶段累计耗时：
+            data_fetch, update_engine, handle_orders, indicators, strategy[id], account_record
+        :param bar:
+        :return:
+        """
+        profiler = self.profiler if self.profiler.enabled else None
+        if profiler is not None:
+            t = timer.perf_counter_ns()
+            if self._bar_end is not None:
+                profiler.add('data_fetch', t - self._bar_end)
+        # 将当前数据存入到回测引擎中
+        self.current_data = bar
+        # 更新回测引擎中的状态--仓位信息和资金账户
+        self.update_engine()
+        if profiler is not None:
+            t = profiler.lap('update_engine', t)
+        # 处理回测引擎中的订单流信息
+        self.handle_orders()
+        if profiler is not None:
+            t = profiler.lap('handle_orders', t)
+        # 更新共享指标
+        self.indicators.on_bar(bar)
+        if profiler is not None:
+            t = profiler.lap('indicators', t)
+        # 运行订阅了当前品种的策略
+        for s in self.dispatcher.subscribers(bar.symbol_name):
+            pos_to_strategy = self.position_list.get_position(s.strategy_id)
+            # 传递新数据和策略相关的仓位至指定策略，返回开仓订单和平仓订单
+            open_orders, close_orders = s.run(bar, pos_to_strategy)
+            self.send_orders(open_orders, close_orders)
+            if profiler is not None:
+                t = profiler.lap('strategy[%s]' % s.strategy_id, t)
+        # 记录账户资金变动
+        self.account.record(self.recorder, bar.date_time)
+        if profiler is not None:
+            self._bar_end = profiler.lap('account_record', t)
+
+    def is_flat(self):
+        """
+        当前没有持仓和待成交的订单：此后的回测结果只取决于策略状态(指标)和之后的数据
+        :return:
+        """
+        return not (self.open_order_flow or self.close_order_flow or len(self.position_list))
+
+    def warm_up(self, end):
+        """
+        分段回测：用前end个bar预热指标，策略不运行、不发出订单、不记录资金
+        :param end:
+        :return:
+        """
+        if end <= 0:
+            return
+        symbol_name = self.bars.columns['symbol_name'][0]
+        self.indicators.skip_bars(self.bars, 0, end, symbol_name)
+        for s in self.strategy:
+            s.skip_bars(self.bars, 0, end)
+
+    def next_action_index(self, index):
+        """
+        跳跃模式：第index个bar处理完后，下一个需要逐bar处理的位置
+        :param index:
+        :return:
+        """
+        # 有待成交的订单时必须处理下一个bar
+        if self.open_order_flow or self.close_order_flow:
+            return index + 1
+        target = len(self.bars)
+        for s in self.strategy:
+            target = min(target, s.next_action_index(self.bars, index, self.position_list.get_position(s.strategy_id)))
+            if target <= index + 1:
+                return index + 1
+        return target
+
+    def skip_bars(self, begin, end):
+        """
+        跳跃模式：跳过[begin, end)的bar，策略批量更新状态，资金按仓位账本的线性系数向量化记录
+        :param begin:
+        :param end:
+        :return:
+        """
+        self.indicators.skip_bars(self.bars, begin, end, self.current_data.symbol_name)
+        for s in self.strategy:
+            s.skip_bars(self.bars, begin, end)
+        price = np.asarray(self.bars.columns['open'][begin:end], dtype=np.float64)
+        n = len(price)
+        curve = self.position_list.mark_curve(self.current_data.symbol_name, price)
+        if curve is None:
+            equity = np.full(n, float(self.account.equity))
+            margin_used = np.full(n, float(self.account.margin_used))
+        else:
+            profit, margin_increased = curve
+            equity = self.account.balance + profit
+            margin_used = self.account.margin_used + margin_increased
+        values = np.column_stack((equity, np.full(n, float(self.account.balance)), margin_used, equity - margin_used,
+                                  margin_used / equity, np.full(n, float(self.account.commission))))
+        self.recorder.extend(self.bars.columns['date_time'][begin:end], values)
 
     def run(self):
         print('back test begin...')
-        for index, row in self.data.iterrows():
-            # 将当前数据存入到回测引擎中
-            self.current_data = row
-            # 更新回测引擎中的状态--仓位信息和资金账户
-            self.update_engine()
-            # 处理回测引擎中的订单流信息
-            self.handle_orders()
-            # 运行每个策略
-            for i, s in enumerate(self.strategy):
-                pos_to_strategy = self.position_list.get_position(s.strategy_id)
-                # 传递新数据和策略相关的仓位至指定策略，返回开仓订单和平仓订单
-                open_orders, close_orders = s.run(row, pos_to_strategy)
-                self.open_order_flow.extend(open_orders)
-                self.close_order_flow.extend(close_orders)
-            # 记录账户资金变动
-            self.account_dict.append(dict(copy.deepcopy(self.account.__dict__), **{'time': row.date_time}))
-
-        day_num = (self.account_dict[-1].get('time') - self.account_dict[0].get('time')) / np.timedelta64(1, 'D')
+        self._bar_end = None
+        if self.jump_ahead:
+            self.run_jump_ahead()
+        else:
+            if self.position:
+                print('resume from bar', self.position)
+            for bar in self.iter_bars_from(self.position):
+                self.on_bar(bar)
+                self.position += 1
+                if self.checkpoint is not None:
+                    self.checkpoint.step(self)
+
+        day_num = (self.recorder['time'][-1] - self.recorder['time'][0]) / np.timedelta64(1, 'D')
         total_rate = (self.account.equity / self.account.initial_capital) - 1
         annualized_rate = (self.account.equity / self.account.initial_capital) ** (365 / day_num) - 1
         print('back test OK!')
         # print('测试周期(days)', day_num, '总收益:', total_rate, '年化收益：', annualized_rate)
+        if self.profiler.total_ns:
+            print(self.profiler.report())
         return day_num, total_rate, annualized_rate
 
-    def result_analysis(self, need_plot=False):
-        res_account = pd.DataFrame(self.account_dict).set_index('time')
-        equity_array = np.array(res_account['equity'])
-        res_account['max_draw_down'] = [(equity_array[i:].min()-equity_array[i])/equity_array[i] for i in range(len(equity_array)) ]
-        capital = res_account[['balance', 'equity']]
+    def iter_bars_from(self, start):
+        """
+        从第start个bar开始迭代(断点恢复)，bar流只能从头读取并丢弃前start个bar
+        """
+        if isinstance(self.bars, BarCursor):
+            return self.bars.iter_bars(start)
+        return itertools.islice(iter(self.bars), start, None)
+
+    def run_jump_ahead(self):
+        """
+        跳跃模式的回测主循环：逐bar处理，所有策略都声明之后若干bar不会行动时直接跳到下一个行动点
+        :return:
+        """
+        n = len(self.bars)
+        index = self.position
+        bars = self.bars.iter_bars(index, chunk_size=1024)
+        while index < n:
+            self.on_bar(next(bars))
+            target = min(self.next_action_index(index), n)
+            if target > index + 1:
+                begin = timer.perf_counter_ns()
+                self.skip_bars(index + 1, target)
+                if self.profiler.enabled:
+                    self.profiler.add('skip_bars', timer.perf_counter_ns() - begin)
+                    self._bar_end = None
+                bars = self.bars.iter_bars(target, chunk_size=1024)
+            index = self.position = target
+            if self.checkpoint is not None:
+                self.checkpoint.step(self)
+
+    def result_analysis(self, need_plot=False, report=None, plot_path='test.png'):
+        """
+        :param need_plot: 是否在本进程画资金曲线(plot_path)
+        :param report: ReportWriter，给定时在后台进程生成报告，结果(Future)保存在report_future
+        :param plot_path: 资金曲线图的路径
+        :return: (年化收益, 最大回撤)
+        """
+        equity_array = self.recorder['equity']
+        self.metrics = performance_metrics(equity_array, self.recorder['time'], self.trade_list)
         if need_plot:
-            plt.figure(1)
-            ax1 = plt.subplot(211)
-            ax2 = plt.subplot(212)
-            # plt.figure(1)
-            plt.sca(ax1)
-            plt.plot(capital)
-            plt.sca(ax2)
-            plt.plot(res_account['max_draw_down'])
-            plt.savefig('test.png')
-            plt.show()
-
-        day_num = (self.account_dict[-1].get('time') - self.account_dict[0].get('time')) / np.timedelta64(1, 'D')
-        rate = res_account['equity'][-1]/res_account['equity'][0]-1     # 总收益
-        annualized_rate = (rate + 1) ** (365 / day_num) - 1     # 年化收益
-        max_draw_down = min(res_account['max_draw_down'])   # 最大回测
-
-        print('Days', day_num, 'equity at last:', res_account['equity'][-1], 'equity at begin:', res_account['equity'][0],
-              'Total Rate:', rate, 'Annualized Rate:', annualized_rate, 'Max-Draw down:', max_draw_down)
+            # 报告模块(matplotlib)只在需要时导入
+            from core.Report import plot_equity
+            plot_equity(self.recorder, plot_path)
+        if report is not None:
+            self.report_future = report.submit(self.recorder, self.trade_list, self.metrics)
+
+        day_num = self.metrics['days']
+        rate = self.metrics['total_rate']     # 总收益
+        annualized_rate = self.metrics['annualized_rate']     # 年化收益
+        max_draw_down = self.metrics['max_draw_down']   # 最大回测
+
+        print('Days', day_num, 'equity at last:', equity_array[-1], 'equity at begin:', equity_array[0],
+              'Total Rate:', rate, 'Annualized Rate:', annualized_rate, 'Max-Draw down:', max_draw_down,
+              'Sharpe:', self.metrics['sharpe_ratio'], 'Win Rate:', self.metrics['win_rate'])
         return annualized_rate, max_draw_down
 
 
 class BackTestOptEngine(BackTestEngine):
     """
-    优化迭代的回测引擎
+    优化迭代的回测引擎(walk-forward)：
+        到达优化点时，在样本内窗口[opt_begin, 当前bar)上用进程池后台搜索参数空间，主回测不等待；
+        搜索完成后热替换策略参数，此后的资金曲线为样本外结果；策略有持仓时推迟到空仓后替换
     """
     def __init__(self, data, strategy, account=Account(),
-                 init_opt_tau=(1000,), opt_frequency=(1000,)):
-        super().__init__(data, strategy, account)
+                 init_opt_tau=(1000,), opt_frequency=(1000,), parameter_space=((),),
+                 opt_target='annualized_rate', processes=None, background=True, profile=False):
+        super().__init__(data, strategy, account, profile=profile)
+        if not isinstance(self.bars, BarCursor):
+            raise Exception('opt back test needs in-memory data (DataFrame or BarCursor), not a bar stream')
+        if len(parameter_space) < len(self.strategy) or any(len(space) == 0 for space in parameter_space):
+            raise Exception('opt back test needs a non-empty parameter space for every strategy')
         self.init_opt_tau = init_opt_tau
         self.opt_frequency = opt_frequency
         self.opt_count = [0] * len(self.opt_frequency)
+        self.parameter_space = parameter_space  # 每个策略的候选参数列表
+        self.opt_target = opt_target    # 优化目标，performance_metrics中的指标名称
+        self.processes = processes  # 参数搜索的进程数
+        self.background = background    # False时在优化点等待搜索完成，结果可复现
+        self.pool = None
+        self.opt_log = []   # 每次参数替换的记录
+        self.oos_begin = None   # 样本外起点(第一次参数替换的bar)
 
     def init_strategy(self):
         """
@@ -292,43 +477,128 @@ class BackTestOptEngine(BackTestEngine):
             s.opt_count = self.opt_count[i]  # 优化计数器
             s.init_flag = False  # 参数是否初始化标志
             s.opt_begin = 0  # 优化数据的起点
+            s.parameter_space = self.parameter_space[i]     # 候选参数
+            s.opt_search = None     # 进行中的后台参数搜索
+            s.opt_ready = False     # 是否已使用优化后的参数
 
     def run(self):
+        from core.Optimizer import WindowSearch, start_worker_pool
         print('opt back test begin...')
         self.init_strategy()
-        # 遍历回测数据集
-        for index, row in self.data.iterrows():
-            self.current_data = row
-            self.update_engine()
-            self.handle_orders()
-            # 遍历策略集
-            for i, s in enumerate(self.strategy):
-                if row.symbol_name == s.symbol.symbol_name:
+        shared, self.pool = start_worker_pool(self.bars, self.processes)
+        try:
+            # 遍历回测数据集，profiler启用时按阶段累计耗时(阶段同on_bar，另有swap_parameter)
+            profiler = self.profiler if self.profiler.enabled else None
+            t = timer.perf_counter_ns()
+            for index, row in enumerate(self.bars):
+                if profiler is not None:
+                    t = profiler.lap('data_fetch', t)
+                self.current_data = row
+                self.update_engine()
+                if profiler is not None:
+                    t = profiler.lap('update_engine', t)
+                self.handle_orders()
+                if profiler is not None:
+                    t = profiler.lap('handle_orders', t)
+                self.indicators.on_bar(row)
+                if profiler is not None:
+                    t = profiler.lap('indicators', t)
+                # 遍历订阅了当前品种的策略
+                for s in self.dispatcher.subscribers(row.symbol_name):
+                    swap = False
                     # 当前策略参数有效 -- 使用原参数进行回测
                     if self.check_strategy_valid(s):
                         # 传递新数据和策略相关的仓位至指定策略，返回开仓订单和平仓订单
                         pos_to_strategy = self.position_list.get_position(s.strategy_id)
                         open_orders, close_orders = s.run(row, pos_to_strategy)
-                        self.open_order_flow.extend(open_orders)
-                        self.close_order_flow.extend(close_orders)
+                        self.send_orders(open_orders, close_orders)
 
                     # 当前策略参数无效 -- 需要进行参数优化
                     else:
-                        # 具备优化条件
-                        if self.check_condition_for_opt(s):
-                            # 对策略进行重新优化参数
-                            data_for_opt = self.data.iloc[s.opt_begin:index, :]
+                        # 没有进行中的搜索且具备优化条件
+                        if s.opt_search is None and self.check_condition_for_opt(s):
+                            # 在样本内数据上后台搜索参数
+                            s.opt_search = WindowSearch(self.pool, type(s), s.parameter_space, s.symbol,
+                                                        begin=s.opt_begin, end=index,
+                                                        initial_capital=self.account.initial_capital,
+                                                        target=self.opt_target)
                             s.opt_begin = index     # 重置下次优化数据的起点为当前点
-                            pass
+                            s.opt_count = 0
+                            swap = not self.background  # 同步模式：在优化点等待搜索完成并替换参数
+                    if profiler is not None:
+                        t = profiler.lap('strategy[%s]' % s.strategy_id, t)
+
+                    # 后台参数搜索已完成且策略空仓 -- 在策略处理完当前bar后热替换参数，下一个bar起使用新参数
+                    # (有持仓或待成交订单时推迟，持仓按原参数平仓)
+                    if swap or s.opt_search is not None and s.opt_search.done() and self.strategy_is_flat(s):
+                        self.swap_parameter(s, index, row.date_time)
+                        if profiler is not None:
+                            t = profiler.lap('swap_parameter', t)
+
+                # 记录账户资金变动
+                self.account.record(self.recorder, row.date_time)
+                if profiler is not None:
+                    t = profiler.lap('account_record', t)
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+            shared.close()
+
+        day_num = (self.recorder['time'][-1] - self.recorder['time'][0]) / np.timedelta64(1, 'D')
+        total_rate = (self.account.equity / self.account.initial_capital) - 1
+        annualized_rate = (self.account.equity / self.account.initial_capital) ** (365 / day_num) - 1
+        print('back test OK!')
+        # print('测试周期(days)', day_num, '总收益:', total_rate, '年化收益：', annualized_rate)
+        if self.profiler.total_ns:
+            print(self.profiler.report())
+        return day_num, total_rate, annualized_rate
+
+    def strategy_is_flat(self, strategy):
+        """
+        策略没有持仓，也没有待成交的订单
+        """
+        if not self.position_list.is_empty(strategy.strategy_id):
+            return False
+        for flow in (self.open_order_flow, self.close_order_flow):
+            for orders in flow.values():
+                if any(order.strategy_id == strategy.strategy_id for order in orders):
+                    return False
+        return True
 
-            # 记录账户资金变动
-            self.account_dict.append(dict(copy.deepcopy(self.account.__dict__), **{'time': row.date_time}))
-            day_num = (self.account_dict[-1].get('time') - self.account_dict[0].get('time')) / np.timedelta64(1, 'D')
-            total_rate = (self.account.equity / self.account.initial_capital) - 1
-            annualized_rate = (self.account.equity / self.account.initial_capital) ** (365 / day_num) - 1
-            print('back test OK!')
-            # print('测试周期(days)', day_num, '总收益:', total_rate, '年化收益：', annualized_rate)
-            return day_num, total_rate, annualized_rate
+    def swap_parameter(self, strategy, index, time):
+        """
+        使用后台搜索的最优参数替换策略参数，并用截至当前bar(包含)的最近历史数据预热新参数下的指标：
+            只使用策略订阅品种的bar，取最后warm_up_bars个，与使用新参数从头回测时的指标一致
+        :param strategy:
+        :param index: 当前bar位置，策略已处理完(或跳过)该bar
+        :param time: 当前bar时间
+        :return:
+        """
+        search = strategy.opt_search
+        parameter, metrics = search.best()
+        strategy.set_parameter(parameter)
+        own = np.flatnonzero(np.isin(self.bars.columns['symbol_name'][:index + 1], strategy.symbols))
+        own = own[max(len(own) - strategy.warm_up_bars(), 0):] if strategy.warm_up_bars() else own[:0]
+        if len(own):
+            for bar in self.bars.iter_bars(int(own[0]), index + 1):
+                if bar.symbol_name in strategy.symbols:
+                    strategy.update_indicators(bar)
+        strategy.opt_search = None
+        strategy.opt_ready = True
+        if self.oos_begin is None:
+            self.oos_begin = index
+        self.opt_log.append({'strategy_id': strategy.strategy_id, 'opt_begin': search.begin, 'opt_end': search.end,
+                             'swap_index': index, 'swap_time': time, 'parameter': parameter, 'in_sample': metrics})
+
+    def out_of_sample(self):
+        """
+        样本外资金曲线及其绩效指标
+        :return: (time, equity, metrics)
+        """
+        if self.oos_begin is None:
+            raise Exception('no parameter has been optimized yet!')
+        time = self.recorder['time'][self.oos_begin:]
+        equity = self.recorder['equity'][self.oos_begin:]
+        return time, equity, performance_metrics(equity, time)
 
     def check_strategy_valid(self, strategy):
         """
@@ -337,8 +607,8 @@ class BackTestOptEngine(BackTestEngine):
         :param strategy:
         :return:
         """
-        # 策略尚未冷启动，未进行第一次参数优化
-        if not strategy.init_flag:
+        # 策略尚未冷启动，或第一次参数优化尚未完成
+        if not strategy.init_flag or not strategy.opt_ready:
             return False
 
         # 达到再次优化的时间且空仓时，参数无效
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from functools import wraps
 import datetime
+import json
+import time
 
 
 def fn_timer(function):
@@ -18,3 +20,73 @@ def fn_timer(function):
         print("Total time running %s: %s seconds" % (function.__name__, str((end_time-begin_time))))
         return result
     return function_timer
+
+
+class PhaseProfiler:
+    """
+    分阶段计时器：
+        按阶段名称累计perf_counter_ns耗时和调用次数，不逐次打印；enabled为False时调用方跳过计时，可在运行中切换
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.total_ns = {}  # 阶段 -> 累计纳秒
+        self.calls = {}     # 阶段 -> 调用次数
+
+    def reset(self):
+        self.total_ns = {}
+        self.calls = {}
+
+    def add(self, phase, ns, calls=1):
+        """
+        累计一次计时
+        :param phase: 阶段名称
+        :param ns: 耗时(纳秒)
+        :param calls: 调用次数
+        :return:
+        """
+        self.total_ns[phase] = self.total_ns.get(phase, 0) + ns
+        self.calls[phase] = self.calls.get(phase, 0) + calls
+
+    def lap(self, phase, begin):
+        """
+        将begin到现在的耗时计入phase
+        :param phase: 阶段名称
+        :param begin: 起始时刻(perf_counter_ns)
+        :return: 现在的时刻，作为下一阶段的起始时刻
+        """
+        now = time.perf_counter_ns()
+        self.add(phase, now - begin)
+        return now
+
+    def summary(self):
+        """
+        :return: 按累计耗时降序的[{phase, calls, total_ms, mean_us, share}]
+        """
+        total = sum(self.total_ns.values()) or 1
+        rows = [{'phase': phase, 'calls': self.calls[phase], 'total_ms': ns / 1e6,
+                 'mean_us': ns / 1e3 / max(self.calls[phase], 1), 'share': ns / total}
+                for phase, ns in self.total_ns.items()]
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+    def report(self):
+        """
+        汇总表的文本
+        """
+        lines = ['%-24s %10s %12s %10s %7s' % ('phase', 'calls', 'total(ms)', 'mean(us)', 'share')]
+        for row in self.summary():
+            lines.append('%-24s %10d %12.1f %10.2f %6.1f%%' % (row['phase'], row['calls'], row['total_ms'],
+                                                                row['mean_us'], row['share'] * 100))
+        return '\n'.join(lines)
+
+    def to_json(self, path=None, **meta):
+        """
+        导出为json，用于不同版本之间对比各阶段耗时
+        :param path: 文件路径，None时只返回字符串
+        :param meta: 附加信息(如bar数目、数据名称)
+        :return: json字符串
+        """
+        text = json.dumps({'meta': meta, 'phases': self.summary()}, indent=2)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict, deque
+import math
+import numpy as np
+
+# 增量指标：每个bar调用update(x)，均为O(1)(最大/最小值为均摊O(1))
+
+
+class IndicatorBase(object):
+    shared = False  # 是否为引擎注册表中的共享实例(由注册表更新)
+    share_key = None    # 可共享指标的(指标类, 窗口, 其他参数)，由StrategyBase.use_indicator设置
+
+    def __init__(self, window):
+        self.window = window    # 窗口长度
+        self.count = 0  # 已输入的数据个数
+        self.value = None   # 当前指标值
+
+    @property
+    def ready(self):
+        """
+        窗口是否已填满
+        """
+        return self.count >= self.window
+
+    def __len__(self):
+        return min(self.count, self.window)
+
+    def update(self, x):
+        pass
+
+    def update_many(self, values):
+        """
+        依次输入多个数据(跳跃模式下跳过的bar)
+        :param values: 数据列表
+        :return: 最后的指标值
+        """
+        for x in values:
+            self.update(x)
+        return self.value
+
+
+class RollingMean(IndicatorBase):
+    """
+    滑动均值
+    """
+    resync_period = 8192    # 每隔若干次更新按窗口重新精确计算，消除累计舍入误差
+
+    def __init__(self, window):
+        super().__init__(window)
+        self.buffer = deque(maxlen=window)
+        self.mean = 0.0
+
+    def _push(self, x):
+        """
+        放入新值并返回被移出窗口的旧值(窗口未满时为None)
+        """
+        x_old = self.buffer[0] if len(self.buffer) == self.window else None
+        self.buffer.append(x)
+        self.count += 1
+        if x_old is None:
+            self.mean += (x - self.mean) / len(self.buffer)
+        else:
+            self.mean += (x - x_old) / self.window
+        if self.count % self.resync_period == 0:
+            self._resync()
+        return x_old
+
+    def _resync(self):
+        self.mean = math.fsum(self.buffer) / len(self.buffer)
+
+    def update(self, x):
+        self._push(x)
+        self.value = self.mean
+        return self.value
+
+    def update_many(self, values):
+        """
+        数据多于窗口时只有最后window个数据影响指标：直接放入窗口并精确重算，最后一个数据按update输入
+        """
+        if len(values) <= self.window:
+            return super().update_many(values)
+        self.buffer.extend(values[-self.window - 1:-1])
+        self.count += len(values) - 1
+        self._resync()
+        return self.update(values[-1])
+
+
+class RollingVar(RollingMean):
+    """
+    滑动方差(总体方差，与np.var一致)：滑动窗口版Welford算法
+    """
+    def __init__(self, window):
+        super().__init__(window)
+        self.m2 = 0.0   # 离差平方和
+
+    def _resync(self):
+        super()._resync()
+        self.m2 = math.fsum((v - self.mean) ** 2 for v in self.buffer)
+
+    def update(self, x):
+        old_mean = self.mean
+        x_old = self._push(x)
+        if self.count % self.resync_period == 0:
+            pass    # _push已按窗口精确重算(包含x)
+        elif x_old is None:
+            self.m2 += (x - old_mean) * (x - self.mean)
+        else:
+            self.m2 += (x - x_old) * (x - self.mean + x_old - old_mean)
+        self.value = max(self.m2, 0.0) / len(self.buffer)
+        return self.value
+
+
+class RollingStd(RollingVar):
+    """
+    滑动标准差(与np.std一致)
+    """
+    def update(self, x):
+        self.value = math.sqrt(super().update(x))
+        return self.value
+
+
+class RollingBias(RollingMean):
+    """
+    乖离率：(x - 均值) / 均值
+    """
+    def update(self, x):
+        self._push(x)
+        self.value = (x - self.mean) / self.mean
+        return self.value
+
+
+class RollingMax(IndicatorBase):
+    """
+    滑动最大值：单调递减队列
+    """
+    def __init__(self, window):
+        super().__init__(window)
+        self.queue = deque()    # (序号, 值)
+
+    def _better(self, a, b):
+        return a >= b
+
+    def update(self, x):
+        while self.queue and self._better(x, self.queue[-1][1]):
+            self.queue.pop()
+        self.queue.append((self.count, x))
+        if self.queue[0][0] <= self.count - self.window:
+            self.queue.popleft()
+        self.count += 1
+        self.value = self.queue[0][1]
+        return self.value
+
+
+class RollingMin(RollingMax):
+    """
+    滑动最小值：单调递增队列
+    """
+    def _better(self, a, b):
+        return a <= b
+
+
+class EMA(IndicatorBase):
+    """
+    指数移动平均：alpha = 2 / (window + 1)，以第一个值作为初始值
+    """
+    def __init__(self, window, alpha=None):
+        super().__init__(window)
+        self.alpha = 2 / (window + 1) if alpha is None else alpha
+
+    def update(self, x):
+        if self.count == 0:
+            self.value = x
+        else:
+            self.value += self.alpha * (x - self.value)
+        self.count += 1
+        return self.value
+
+
+# 向量化指标：一次计算整个价格序列，窗口未满的位置为nan，用于向量化回测
+
+
+def rolling_mean(x, window):
+    """
+    滑动均值(与RollingMean一致)
+    :param x: 一维数组
+    :param window: 窗口长度
+    :return:
+    """
+    x = np.asarray(x, dtype=np.float64)
+    result = np.full(len(x), np.nan)
+    if len(x) < window:
+        return result
+    shift = x[0]    # 平移后再累加，减小累计和的舍入误差
+    c = np.concatenate(([0.0], np.cumsum(x - shift)))
+    result[window - 1:] = (c[window:] - c[:-window]) / window + shift
+    return result
+
+
+def rolling_std(x, window):
+    """
+    滑动标准差(总体标准差，与RollingStd一致)
+    :param x: 一维数组
+    :param window: 窗口长度
+    :return:
+    """
+    x = np.asarray(x, dtype=np.float64)
+    result = np.full(len(x), np.nan)
+    if len(x) < window:
+        return result
+    y = x - x[0]
+    c1 = np.concatenate(([0.0], np.cumsum(y)))
+    c2 = np.concatenate(([0.0], np.cumsum(y * y)))
+    mean = (c1[window:] - c1[:-window]) / window
+    var = (c2[window:] - c2[:-window]) / window - mean * mean
+    result[window - 1:] = np.sqrt(np.maximum(var, 0.0))
+    return result
+
+
+def rolling_var(x, window):
+    """
+    滑动方差(总体方差，与RollingVar一致)
+    """
+    return rolling_std(x, window) ** 2
+
+
+def rolling_bias(x, window):
+    """
+    乖离率(与RollingBias一致)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    mean = rolling_mean(x, window)
+    return (x - mean) / mean
+
+
+# 可整体预计算的指标：指标类 -> 计算函数，返回 属性名 -> 数组
+VECTOR_INDICATORS = {
+    RollingMean: lambda x, window: {'value': rolling_mean(x, window), 'mean': rolling_mean(x, window)},
+    RollingVar: lambda x, window: {'value': rolling_var(x, window), 'mean': rolling_mean(x, window)},
+    RollingStd: lambda x, window: {'value': rolling_std(x, window), 'mean': rolling_mean(x, window)},
+    RollingBias: lambda x, window: {'value': rolling_bias(x, window), 'mean': rolling_mean(x, window)},
+}
+
+
+class PrecomputedIndicator(IndicatorBase):
+    """
+    预计算的指标：全序列的指标数组已经算好，每个bar只移动位置(窗口未满时为nan)
+    """
+    def __init__(self, window, arrays):
+        """
+        :param window:
+        :param arrays: 属性名 -> 数组，如{'value': std, 'mean': mean}
+        """
+        super().__init__(window)
+        self.arrays = arrays
+        for name in arrays:
+            setattr(self, name, None)
+
+    def _seek(self):
+        for name, values in self.arrays.items():
+            setattr(self, name, float(values[self.count - 1]))
+
+    def update(self, x):
+        self.count += 1
+        self._seek()
+        return self.value
+
+    def update_many(self, values):
+        if len(values):
+            self.count += len(values)
+            self._seek()
+        return self.value
+
+
+class IndicatorCache:
+    """
+    预计算指标数组的LRU缓存，可在多次回测(参数扫描)之间共用，超过max_size项时淘汰最久未使用的
+    """
+    def __init__(self, max_size=64):
+        self.max_size = max_size
+        self.entries = OrderedDict()    # key -> (bars, arrays)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, bars, key, build):
+        """
+        :param bars: 数据对象，同一数据对象上的相同指标才复用
+        :param key: 指标的键
+        :param build: 未命中时计算数组的函数
+        :return:
+        """
+        key = (id(bars),) + key
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] is bars:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        arrays = build()
+        self.entries[key] = (bars, arrays)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return arrays
+
+
+class IndicatorRegistry:
+    """
+    引擎持有的指标注册表：相同(品种, 指标, 窗口, 字段)的指标只有一个实例，每个bar只计算一次，供所有策略共用
+        precompute=True且数据在内存中时，可整体计算的指标(VECTOR_INDICATORS)一次算出全序列
+    """
+    def __init__(self, bars=None, precompute=False, cache=None):
+        """
+        :param bars: BarCursor，预计算时使用
+        :param precompute: 是否预计算
+        :param cache: IndicatorCache，多次回测共用预计算结果时传入
+        """
+        self.bars = bars
+        self.precompute = precompute and bars is not None
+        self.cache = cache if cache is not None else IndicatorCache()
+        self.live = {}  # key -> 指标实例
+        self.by_symbol = {}     # symbol_name -> [(指标实例, 字段)]
+
+    def _series(self, symbol_name, field):
+        values = np.asarray(self.bars.columns[field], dtype=np.float64)
+        symbol_names = self.bars.columns.get('symbol_name')
+        if symbol_names is not None and np.any(symbol_names != symbol_name):
+            values = values[symbol_names == symbol_name]
+        return values
+
+    def get(self, symbol_name, indicator_class, window, field='open', **kwargs):
+        """
+        取得共享指标实例，不存在时创建
+        :return:
+        """
+        key = (symbol_name, indicator_class.__name__, window, field, tuple(sorted(kwargs.items())))
+        indicator = self.live.get(key)
+        if indicator is None:
+            if self.precompute and indicator_class in VECTOR_INDICATORS and not kwargs:
+                arrays = self.cache.get(self.bars, key, lambda: VECTOR_INDICATORS[indicator_class](
+                    self._series(symbol_name, field), window))
+                indicator = PrecomputedIndicator(window, arrays)
+            else:
+                indicator = indicator_class(window, **kwargs)
+            indicator.shared = True
+            self.live[key] = indicator
+            self.by_symbol.setdefault(symbol_name, []).append((indicator, field))
+        return indicator
+
+    def bind(self, strategy):
+        """
+        将只订阅一个品种的策略通过use_indicator声明的指标替换为共享实例(策略的属性引用一并替换)
+        :param strategy: StrategyBase
+        :return:
+        """
+        if len(strategy.symbols) != 1:
+            return
+        for i, (indicator, field) in enumerate(strategy.indicators):
+            if indicator.share_key is None or indicator.shared:
+                continue
+            indicator_class, window, kwargs = indicator.share_key
+            shared = self.get(strategy.symbols[0], indicator_class, window, field, **dict(kwargs))
+            strategy.indicators[i] = (shared, field)
+            for name, value in list(vars(strategy).items()):
+                if value is indicator:
+                    setattr(strategy, name, shared)
+
+    def on_bar(self, bar):
+        """
+        用新bar更新该品种的共享指标
+        """
+        for indicator, field in self.by_symbol.get(bar.symbol_name, ()):
+            indicator.update(getattr(bar, field))
+
+    def skip_bars(self, bars, begin, end, symbol_name):
+        """
+        跳跃模式下批量更新该品种的共享指标
+        """
+        for indicator, field in self.by_symbol.get(symbol_name, ()):
+            indicator.update_many(bars.columns[field][begin:end].tolist())
+
+
+if __name__ == '__main__':
+    # 与numpy参考实现对比
+    prices = 3000 * np.exp(np.cumsum(np.random.default_rng(0).normal(0, 0.001, 20000)))
+    tau = 120
+    indicators = {'mean': RollingMean(tau), 'var': RollingVar(tau), 'std': RollingStd(tau),
+                  'bias': RollingBias(tau), 'max': RollingMax(tau), 'min': RollingMin(tau)}
+    for i, p in enumerate(prices):
+        window = prices[max(0, i - tau + 1):i + 1]
+        reference = {'mean': np.mean(window), 'var': np.var(window), 'std': np.std(window),
+                     'bias': (p - np.mean(window)) / np.mean(window), 'max': window.max(), 'min': window.min()}
+        for name, indicator in indicators.items():
+            indicator.update(p)
+            assert abs(indicator.value - reference[name]) <= 1e-6 * max(1.0, abs(reference[name])), (name, i)
+    assert np.allclose(rolling_mean(prices, tau)[tau - 1:], [np.mean(prices[i - tau + 1:i + 1])
+                                                             for i in range(tau - 1, len(prices))])
+    assert np.allclose(rolling_std(prices, tau)[tau - 1:], [np.std(prices[i - tau + 1:i + 1])
+                                                            for i in range(tau - 1, len(prices))])
+    for name, indicator in indicators.items():
+        batch = type(indicator)(tau)
+        batch.update_many(prices[:5000].tolist())
+        batch.update_many(prices[5000:].tolist())
+        assert abs(batch.value - indicator.value) <= 1e-6 * max(1.0, abs(indicator.value)), name
+    print('indicators OK!')
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+# 绩效指标：全部基于累计最大值/累计和等numpy向量运算，复杂度O(n)
+
+
+def draw_down_series(equity):
+    """
+    回撤序列：当前净值相对历史最高净值的回撤比例(<=0)
+    :param equity: 净值数组
+    :return:
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    running_max = np.maximum.accumulate(equity)
+    return equity / running_max - 1
+
+
+def max_draw_down(equity):
+    """
+    最大回撤
+    :param equity:
+    :return:
+    """
+    if len(equity) == 0:
+        return 0.0
+    return float(draw_down_series(equity).min())
+
+
+def draw_down_duration(equity, time=None):
+    """
+    最长回撤持续期：净值低于历史最高点的最长区间
+    :param equity: 净值数组
+    :param time: datetime64时间数组，给定时同时返回持续时间
+    :return: (持续bar数, 持续时间)
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    if len(equity) == 0:
+        return 0, None
+    index = np.arange(len(equity))
+    # 每个bar之前(含)最近一次创新高的位置
+    last_peak = np.maximum.accumulate(np.where(equity >= np.maximum.accumulate(equity), index, 0))
+    bars = index - last_peak
+    longest = int(bars.argmax())
+    if time is None:
+        return int(bars[longest]), None
+    time = np.asarray(time)
+    return int(bars[longest]), time[longest] - time[last_peak[longest]]
+
+
+def period_days(time):
+    """
+    回测周期(天)
+    """
+    return (time[-1] - time[0]) / np.timedelta64(1, 'D')
+
+
+def annualized_return(equity, time):
+    """
+    年化收益
+    :param equity: 净值数组
+    :param time: datetime64时间数组
+    :return:
+    """
+    rate = equity[-1] / equity[0] - 1
+    return float((rate + 1) ** (365 / period_days(time)) - 1)
+
+
+def periods_per_year(time):
+    """
+    按回测数据的bar密度估算每年的bar数目
+    """
+    return (len(time) - 1) / (period_days(time) / 365)
+
+
+def sharpe_ratio(equity, time, risk_free=0.0):
+    """
+    夏普比率：按每bar收益率计算并年化
+    :param equity:
+    :param time:
+    :param risk_free: 年化无风险收益率
+    :return:
+    """
+    ppy = periods_per_year(time)
+    returns = np.diff(equity) / equity[:-1] - risk_free / ppy
+    std = returns.std()
+    if std == 0:
+        return 0.0
+    return float(returns.mean() / std * np.sqrt(ppy))
+
+
+def sortino_ratio(equity, time, risk_free=0.0):
+    """
+    索提诺比率：只使用下行波动
+    :param equity:
+    :param time:
+    :param risk_free: 年化无风险收益率
+    :return:
+    """
+    ppy = periods_per_year(time)
+    returns = np.diff(equity) / equity[:-1] - risk_free / ppy
+    downside = np.sqrt(np.mean(np.minimum(returns, 0) ** 2))
+    if downside == 0:
+        return 0.0
+    return float(returns.mean() / downside * np.sqrt(ppy))
+
+
+def calmar_ratio(equity, time):
+    """
+    卡玛比率：年化收益/最大回撤
+    """
+    mdd = max_draw_down(equity)
+    if mdd == 0:
+        return 0.0
+    return annualized_return(equity, time) / abs(mdd)
+
+
+def trade_arrays(trade_list):
+    """
+    将已平仓的仓位(或订单)列表转换为交易数组
+        单笔盈亏 = 平仓获利(已扣平仓手续费) - 开仓手续费
+    :param trade_list: 已平仓的Position/FutureMarketOrder列表
+    :return: (盈亏数组, 持仓时间数组)
+    """
+    profit = np.array([pos.profit - pos.lots * pos.symbol.tons_per_lots * pos.open_price * pos.symbol.commission_ratio
+                       for pos in trade_list], dtype=np.float64)
+    hold_time = np.array([np.timedelta64(pos.cal_hold_time(), 'ns') for pos in trade_list], dtype='timedelta64[ns]')
+    return profit, hold_time
+
+
+def trade_statistics(profit, hold_time):
+    """
+    交易统计
+    :param profit: 单笔盈亏数组
+    :param hold_time: 单笔持仓时间数组(timedelta64)
+    :return:
+    """
+    profit = np.asarray(profit, dtype=np.float64)
+    if len(profit) == 0:
+        return {'trade_num': 0, 'win_rate': 0.0, 'profit_factor': 0.0, 'average_hold_time': None}
+    gross_profit = profit[profit > 0].sum()
+    gross_loss = -profit[profit < 0].sum()
+    return {
+        'trade_num': len(profit),
+        'win_rate': float((profit > 0).mean()),
+        'profit_factor': float(gross_profit / gross_loss) if gross_loss > 0 else np.inf,
+        'average_hold_time': np.asarray(hold_time).mean(),
+    }
+
+
+def performance_metrics(equity, time, trade_list=None):
+    """
+    汇总绩效指标
+    :param equity: 净值数组
+    :param time: datetime64时间数组
+    :param trade_list: 已平仓的仓位列表
+    :return:
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    time = np.asarray(time)
+    duration_bars, duration_time = draw_down_duration(equity, time)
+    metrics = {
+        'days': float(period_days(time)),
+        'total_rate': float(equity[-1] / equity[0] - 1),
+        'annualized_rate': annualized_return(equity, time),
+        'max_draw_down': max_draw_down(equity),
+        'draw_down_bars': duration_bars,
+        'draw_down_time': duration_time,
+        'sharpe_ratio': sharpe_ratio(equity, time),
+        'sortino_ratio': sortino_ratio(equity, time),
+        'calmar_ratio': calmar_ratio(equity, time),
+    }
+    if trade_list is not None:
+        metrics.update(trade_statistics(*trade_arrays(trade_list)))
+    return metrics
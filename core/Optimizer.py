@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import contextlib
+import itertools
+import os
+import numpy as np
+from core.Account import Account
+from core.Bar import BarCursor, as_bar_cursor
+from core.Engine import BackTestEngine
+from core.Indicator import IndicatorCache
+from core.Metrics import performance_metrics
+from core.Report import trade_table
+
+
+def parameter_grid(parameter_class, **ranges):
+    """
+    生成参数网格
+        parameter_grid(ParameterBoll, tau=[60, 120], delta=[1.5, 2]) -> 4个ParameterBoll
+    :param parameter_class: 参数类
+    :param ranges: 参数名 -> 取值列表，未给出的参数使用参数类的默认值
+    :return:
+    """
+    names = list(ranges)
+    return [parameter_class(**dict(zip(names, values))) for values in itertools.product(*ranges.values())]
+
+
+class SharedBarData:
+    """
+    共享内存中的bar数据：
+        各列(时间为int64纳秒，品种名称为编码)放入同一块SharedMemory，子进程按名称挂载，数据不随任务pickle
+    """
+    def __init__(self, data):
+        columns = as_bar_cursor(data).columns
+        self.layout = []    # (列名, dtype, 偏移, 长度)
+        self.categories = {}    # 字符串列 -> 取值列表
+        arrays = []
+        offset = 0
+        for name, values in columns.items():
+            if values.dtype == object:
+                categories, codes = np.unique(values.astype(str), return_inverse=True)
+                self.categories[name] = categories.tolist()
+                values = codes.astype(np.int32)
+            values = np.ascontiguousarray(values)
+            self.layout.append((name, values.dtype.str, offset, len(values)))
+            arrays.append(values)
+            offset += values.nbytes
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for (name, dtype, begin, length), values in zip(self.layout, arrays):
+            np.ndarray(length, dtype=dtype, buffer=self.shm.buf, offset=begin)[:] = values
+
+    @property
+    def spec(self):
+        """
+        子进程挂载所需的信息
+        """
+        return self.shm.name, self.layout, self.categories
+
+    @staticmethod
+    def attach(spec):
+        """
+        子进程中挂载共享内存并构建BarCursor
+        :param spec: SharedBarData.spec
+        :return: (SharedMemory, BarCursor)
+        """
+        name, layout, categories = spec
+        shm = shared_memory.SharedMemory(name=name)
+        columns = {}
+        for column, dtype, begin, length in layout:
+            values = np.ndarray(length, dtype=dtype, buffer=shm.buf, offset=begin)
+            if column in categories:
+                values = np.array(categories[column], dtype=object)[values]
+            columns[column] = values
+        return shm, BarCursor(columns)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+_worker_shm = None
+_worker_bars = None
+_worker_indicator_cache = IndicatorCache()  # 同一子进程内各次回测共用的预计算指标
+
+
+def _init_worker(spec):
+    global _worker_shm, _worker_bars
+    _worker_shm, _worker_bars = SharedBarData.attach(spec)
+
+
+def worker_bars():
+    """
+    子进程中挂载的共享bar数据(在start_worker_pool启动的进程池的任务中调用)
+    :return: BarCursor
+    """
+    return _worker_bars
+
+
+def backtest_result(bars, strategy_class, parameter, symbol, initial_capital=100000, strategy_id=1,
+                    precompute_indicators=False, indicator_cache=None, result_cache=None, data_hash=None):
+    """
+    使用给定参数运行一次回测
+    :param bars: DataFrame或BarCursor
+    :param strategy_class: 策略类，构造参数为(strategy_id, parameter, symbol)
+    :param parameter: 参数对象
+    :param symbol: 品种
+    :param initial_capital: 初始资金
+    :param strategy_id:
+    :param precompute_indicators: 是否预计算共享指标
+    :param indicator_cache: IndicatorCache，多次回测共用预计算指标
+    :param result_cache: ResultCache，相同(数据, 策略, 参数, 品种, 资金)的回测直接读取磁盘上的结果
+    :param data_hash: 数据的内容哈希(result_cache.data_hash(bars))，多次调用时预先算好
+    :return: {'recorder': EquityRecorder, 'metrics': 绩效指标, 'trades': 交易数组(Report.trade_table)}
+    """
+    key = None
+    if result_cache is not None:
+        key = result_cache.key(data_hash or result_cache.data_hash(bars), strategy_class, parameter, symbol,
+                               initial_capital, {'precompute_indicators': precompute_indicators})
+        result = result_cache.get(key)
+        if result is not None:
+            return result
+    s = strategy_class(strategy_id=strategy_id, parameter=parameter, symbol=symbol)
+    bt = BackTestEngine(data=bars, strategy=[s], account=Account(initial_capital=initial_capital),
+                        precompute_indicators=precompute_indicators, indicator_cache=indicator_cache)
+    # 参数扫描时屏蔽策略的逐单打印
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        bt.run()
+    result = {'recorder': bt.recorder,
+              'metrics': performance_metrics(bt.recorder['equity'], bt.recorder['time'], bt.trade_list),
+              'trades': trade_table(bt.trade_list)}
+    if key is not None:
+        result_cache.put(key, result)
+    return result
+
+
+def run_backtest(bars, strategy_class, parameter, symbol, initial_capital=100000, strategy_id=1,
+                 precompute_indicators=False, indicator_cache=None, result_cache=None, data_hash=None):
+    """
+    使用给定参数运行一次回测，返回绩效指标，参数同backtest_result
+    """
+    return backtest_result(bars, strategy_class, parameter, symbol, initial_capital, strategy_id,
+                           precompute_indicators, indicator_cache, result_cache, data_hash)['metrics']
+
+
+def _run_task(strategy_class, parameter, symbol, initial_capital, precompute_indicators=False, result_cache=None,
+              data_hash=None, full=False):
+    # full=True时返回完整结果(资金记录和交易数组)，用于生成报告
+    result = backtest_result(_worker_bars, strategy_class, parameter, symbol, initial_capital,
+                             precompute_indicators=precompute_indicators, indicator_cache=_worker_indicator_cache,
+                             result_cache=result_cache, data_hash=data_hash)
+    return result if full else result['metrics']
+
+
+def _run_window_task(strategy_class, parameter, symbol, initial_capital, begin, end):
+    return run_backtest(_worker_bars.slice(begin, end), strategy_class, parameter, symbol, initial_capital)
+
+
+def start_worker_pool(data, processes=None):
+    """
+    启动挂载了共享bar数据的进程池
+    :param data: DataFrame或BarCursor
+    :param processes: 进程数
+    :return: (SharedBarData, ProcessPoolExecutor)，使用完毕后需关闭进程池并释放共享内存
+    """
+    shared = SharedBarData(data)
+    pool = ProcessPoolExecutor(max_workers=processes or os.cpu_count(), initializer=_init_worker,
+                               initargs=(shared.spec,))
+    return shared, pool
+
+
+class WindowSearch:
+    """
+    样本内窗口的后台参数搜索：参数空间中每组参数在进程池中回测[begin, end)区间，不阻塞主回测
+    """
+    def __init__(self, pool, strategy_class, parameter_list, symbol, begin, end,
+                 initial_capital=100000, target='annualized_rate'):
+        if len(parameter_list) == 0:
+            raise Exception('window search needs at least one candidate parameter')
+        self.parameter_list = parameter_list
+        self.begin = begin
+        self.end = end
+        self.target = target    # 优化目标，performance_metrics中的指标名称
+        self.futures = [pool.submit(_run_window_task, strategy_class, p, symbol, initial_capital, begin, end)
+                        for p in parameter_list]
+
+    def done(self):
+        return all(f.done() for f in self.futures)
+
+    def best(self):
+        """
+        返回优化目标最大的参数及其样本内指标
+        :return: (parameter, metrics)
+        """
+        metrics = [f.result() for f in self.futures]
+        score = np.array([m[self.target] for m in metrics], dtype=np.float64)
+        if np.isnan(score).all():
+            i = 0
+        else:
+            i = int(np.nanargmax(score))
+        return self.parameter_list[i], metrics[i]
+
+    def cancel(self):
+        for f in self.futures:
+            f.cancel()
+
+
+class ParameterSweep:
+    """
+    参数扫描：每组参数在进程池中独立回测(各自构建Account和策略)，bar数据通过共享内存传递
+        precompute_indicators=True时各子进程预计算指标，窗口相同的参数组复用同一份结果(LRU缓存)
+        给定result_cache时已缓存的参数组直接读取结果，只有未命中的参数组提交到进程池
+        给定report(ReportWriter)时每组参数的报告提交到报告进程池，文件名带参数序号，扫描不等待报告完成
+    """
+    def __init__(self, strategy_class, parameter_list, data, symbol, initial_capital=100000, processes=None,
+                 precompute_indicators=False, result_cache=None, report=None):
+        self.strategy_class = strategy_class
+        self.parameter_list = parameter_list
+        self.data = data
+        self.symbol = symbol
+        self.initial_capital = initial_capital
+        self.processes = processes or os.cpu_count()
+        self.precompute_indicators = precompute_indicators
+        self.result_cache = result_cache    # ResultCache
+        self.report = report    # ReportWriter
+        self.report_futures = []    # 各组参数报告的Future
+        self.results = []
+
+    def run(self):
+        """
+        :return: DataFrame，每行为一组参数及其年化收益、最大回撤等指标
+        """
+        self.results = [None] * len(self.parameter_list)
+        self.report_futures = [None] * len(self.parameter_list)
+        data_hash = None
+        if self.result_cache is not None:
+            data_hash = self.result_cache.data_hash(self.data)
+            for i, p in enumerate(self.parameter_list):
+                key = self.result_cache.key(data_hash, self.strategy_class, p, self.symbol, self.initial_capital,
+                                            {'precompute_indicators': self.precompute_indicators})
+                result = self.result_cache.get(key)
+                if result is not None:
+                    self.results[i] = result['metrics']
+                    self.submit_report(i, result)
+        pending = [i for i, metrics in enumerate(self.results) if metrics is None]
+        if pending:
+            shared, pool = start_worker_pool(self.data, self.processes)
+            try:
+                with pool:
+                    futures = {i: pool.submit(_run_task, self.strategy_class, self.parameter_list[i], self.symbol,
+                                              self.initial_capital, self.precompute_indicators, self.result_cache,
+                                              data_hash, self.report is not None) for i in pending}
+                    for i, f in futures.items():
+                        if self.report is None:
+                            self.results[i] = f.result()
+                        else:
+                            result = f.result()
+                            self.results[i] = result['metrics']
+                            self.submit_report(i, result)
+            finally:
+                shared.close()
+        return self.result_table()
+
+    def submit_report(self, index, result):
+        if self.report is None:
+            return
+        recorder = result['recorder']
+        self.report_futures[index] = self.report.submit_arrays(
+            recorder['time'], recorder['balance'], recorder['equity'], result.get('trades'), result['metrics'],
+            name='sweep-%s-%04d' % (self.report.run_id, index))
+
+    def result_table(self):
+        import pandas as pd
+        rows = []
+        for parameter, metrics in zip(self.parameter_list, self.results):
+            row = dict(vars(parameter))
+            row.update({name: metrics[name] for name in ('annualized_rate', 'max_draw_down', 'sharpe_ratio',
+                                                         'calmar_ratio', 'trade_num', 'win_rate')})
+            rows.append(row)
+        return pd.DataFrame(rows)
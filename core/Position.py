@@ -70,18 +70,51 @@ class Position:
         self.cal_position_margin()
 
 
-class OrderList:
+class IndexedList:
     """
-    使用order列表作为仓位列表
+    带二级索引的仓位容器：
+        按策略id和品种名称维护索引，查询/判空/删除均为O(1)，遍历时保持加入顺序
     """
     def __init__(self):
-        self.ol = []
-
-    def add(self, order):
-        self.ol.append(order)
-
-    def remove(self, order):
-        self.ol.remove(order)
+        self._items = {}    # id(item) -> item
+        self._by_strategy = {}  # strategy_id -> {id(item): item}
+        self._by_symbol = {}    # symbol_name -> {id(item): item}
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getstate__(self):
+        # 索引以id(item)为键，pickle时只保存元素序列，恢复时按新对象的id重建
+        state = dict(self.__dict__)
+        state['_items'] = list(self._items.values())
+        for name in ('_by_strategy', '_by_symbol'):
+            state[name] = {key: list(bucket.values()) for key, bucket in state[name].items()}
+        return state
+
+    def __setstate__(self, state):
+        state['_items'] = {id(item): item for item in state['_items']}
+        for name in ('_by_strategy', '_by_symbol'):
+            state[name] = {key: {id(item): item for item in items} for key, items in state[name].items()}
+        self.__dict__.update(state)
+
+    def __iter__(self):
+        return iter(list(self._items.values()))
+
+    def add(self, item):
+        key = id(item)
+        self._items[key] = item
+        self._by_strategy.setdefault(item.strategy_id, {})[key] = item
+        self._by_symbol.setdefault(item.symbol.symbol_name, {})[key] = item
+
+    def remove(self, item):
+        key = id(item)
+        if self._items.pop(key, None) is None:
+            raise ValueError('item not in list')
+        for index, index_key in ((self._by_strategy, item.strategy_id), (self._by_symbol, item.symbol.symbol_name)):
+            bucket = index[index_key]
+            del bucket[key]
+            if not bucket:
+                del index[index_key]
 
     def is_empty(self, strategy_id='all'):
         """
@@ -90,50 +123,59 @@ class OrderList:
         :return:
         """
         if strategy_id == 'all':
-            return True if len(self.ol) == 0 else False
-        else:
-            return True if len(self.get_orders(strategy_id)) == 0 else False
+            return len(self._items) == 0
+        if type(strategy_id) == list:
+            return not any(sid in self._by_strategy for sid in strategy_id)
+        return strategy_id not in self._by_strategy
 
-    def get_orders(self, strategy_id):
+    def get_by_strategy(self, strategy_id):
         """
-        返回给定对应策略id的订单列表
+        返回给定策略id(或策略id列表)对应的列表
         :param strategy_id:
         :return:
         """
-        ol_ls = []
-        for order in self.ol:
-            if type(strategy_id) == list:   # 计算多个策略的订单持仓
-                if order.strategy_id in strategy_id:
-                    ol_ls.append(order)
-            else:   # 计算单个策略的订单持仓
-                if order.strategy_id == strategy_id:
-                    ol_ls.append(order)
-        return ol_ls
+        if type(strategy_id) == list:   # 计算多个策略的持仓
+            items = []
+            for sid in strategy_id:
+                items.extend(self._by_strategy.get(sid, {}).values())
+            return items
+        bucket = self._by_strategy.get(strategy_id)
+        return list(bucket.values()) if bucket else []
+
+    def get_by_symbol(self, symbol_name):
+        """
+        返回给定品种对应的列表
+        :param symbol_name:
+        :return:
+        """
+        bucket = self._by_symbol.get(symbol_name)
+        return list(bucket.values()) if bucket else []
 
 
-class PositionList:
+class OrderList(IndexedList):
     """
-    仓位列表
+    使用order列表作为仓位列表
     """
-    def __init__(self):
-        self.pl = []
-
-    def add(self, pos):
-        self.pl.append(pos)
+    @property
+    def ol(self):
+        return list(self._items.values())
 
-    def remove(self, pos):
-        self.pl.remove(pos)
-
-    def is_empty(self, strategy_id='all'):
+    def get_orders(self, strategy_id):
         """
-        判断仓位是否为空
-        :param strategy_id:'all', [1,2,3]
+        返回给定对应策略id的订单列表
+        :param strategy_id:
         :return:
         """
-        if strategy_id == 'all':
-            return True if len(self.pl) == 0 else False
-        else:
-            return True if len(self.get_position(strategy_id)) == 0 else False
+        return self.get_by_strategy(strategy_id)
+
+
+class PositionList(IndexedList):
+    """
+    仓位列表
+    """
+    @property
+    def pl(self):
+        return list(self._items.values())
 
     def get_position(self, strategy_id):
         """
@@ -141,12 +183,4 @@ class PositionList:
         :param strategy_id:
         :return:
         """
-        pos_ls = []
-        for pos in self.pl:
-            if type(strategy_id) == list:   # 计算多个策略的订单持仓
-                if pos.strategy_id in strategy_id:
-                    pos_ls.append(pos)
-            else:   # 计算单个策略的订单持仓
-                if pos.strategy_id == strategy_id:
-                    pos_ls.append(pos)
-        return pos_ls
+        return self.get_by_strategy(strategy_id)
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from core.Position import PositionList
+
+
+class BookPosition:
+    """
+    仓位账本中的一行：
+        对策略可见的接口与Position一致(profit, lots, position_type, cal_hold_time等)，
+        浮动数据由账本数组和品种最新价格计算，平仓移出账本后保留最后的数值
+    """
+    __slots__ = ('book', 'row', 'strategy_id', 'symbol', 'position_type', 'open_time', 'open_price', 'lots',
+                 'commission', '_closed')
+
+    def __init__(self, book, row, pos):
+        self.book = book
+        self.row = row
+        self.strategy_id = pos.strategy_id
+        self.symbol = pos.symbol
+        self.position_type = pos.position_type
+        self.open_time = pos.open_time
+        self.open_price = pos.open_price
+        self.lots = pos.lots
+        self.commission = pos.commission    # 开仓手续费
+        self._closed = None     # 移出账本时的(profit, margin, close_price, close_time)
+
+    @property
+    def profit(self):
+        if self.row is None:
+            return self._closed[0]
+        return self.book.row_profit(self.row)
+
+    @property
+    def margin(self):
+        """
+        当前保证金
+        """
+        if self.row is None:
+            return self._closed[1]
+        return self.book.row_margin(self.row)
+
+    @property
+    def close_price(self):
+        if self.row is None:
+            return self._closed[2]
+        return self.book.row_close(self.row)[0]
+
+    @property
+    def close_time(self):
+        if self.row is None:
+            return self._closed[3]
+        return self.book.row_close(self.row)[1]
+
+    def profit_at(self, close_price):
+        """
+        给定价格(可为价格数组)下的浮动盈亏，与盯市后的profit一致
+        """
+        return self.book.profit_slope[self.row] * close_price + self.book.profit_base[self.row]
+
+    def cal_hold_time(self):
+        """
+        计算持仓时间
+        :return:
+        """
+        return self.close_time - self.open_time
+
+    def detach(self):
+        self._closed = (self.profit, self.margin, self.close_price, self.close_time)
+        self.row = None
+        self.book = None    # 已平仓的仓位不再引用账本(可单独pickle)
+
+
+class PositionBook(PositionList):
+    """
+    结构化数组形式的仓位账本：
+        持仓以平行numpy数组保存(类型、手数、开仓价、每手吨数、保证金比例、手续费率、策略id)
+        单个仓位的浮动盈亏(已扣平仓手续费)和保证金都是价格的线性函数:
+            profit = profit_slope * price + profit_base
+            margin = margin_slope * price
+        按品种汇总系数后，一个品种全部仓位的盯市是一次O(1)计算，与持仓数目无关；
+        逐仓位的数值由profits/margins向量化计算，查询接口沿用PositionList
+    """
+    FLOAT_FIELDS = ('position_type', 'lots', 'open_price', 'tons_per_lot', 'leverage', 'commission_ratio',
+                    'profit_slope', 'profit_base', 'margin_slope')
+    INT_FIELDS = ('symbol_code', 'mark_seq')
+    OBJECT_FIELDS = ('strategy_id', 'open_time')
+
+    def __init__(self, capacity=64):
+        super().__init__()
+        self.size = 0
+        self.capacity = capacity
+        for field in self.FLOAT_FIELDS:
+            setattr(self, field, np.zeros(capacity))
+        for field in self.INT_FIELDS:
+            setattr(self, field, np.zeros(capacity, dtype=np.int64))
+        for field in self.OBJECT_FIELDS:
+            setattr(self, field, np.empty(capacity, dtype=object))
+        self._views = []    # 行号 -> BookPosition
+
+        # 按品种编号保存的汇总量
+        self._symbol_codes = {}     # symbol_name -> 品种编号
+        self.symbol_profit_slope = []
+        self.symbol_profit_base = []
+        self.symbol_margin_slope = []
+        self.symbol_price = []  # 最近一次盯市价格
+        self.symbol_time = []   # 最近一次盯市时间
+        self.symbol_mark_count = []     # 盯市次数
+        self.symbol_profit = []     # 最近一次盯市的浮动盈亏合计
+        self.symbol_margin = []     # 已计入账户的保证金合计
+
+    def _fields(self):
+        return self.FLOAT_FIELDS + self.INT_FIELDS + self.OBJECT_FIELDS
+
+    def _grow(self):
+        self.capacity *= 2
+        for field in self._fields():
+            old = getattr(self, field)
+            new = np.empty(self.capacity, dtype=object) if old.dtype == object \
+                else np.zeros(self.capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, field, new)
+
+    def _symbol_code(self, symbol_name):
+        code = self._symbol_codes.get(symbol_name)
+        if code is None:
+            code = self._symbol_codes[symbol_name] = len(self._symbol_codes)
+            for summary in (self.symbol_profit_slope, self.symbol_profit_base, self.symbol_margin_slope,
+                            self.symbol_price, self.symbol_profit, self.symbol_margin):
+                summary.append(0.0)
+            self.symbol_time.append(None)
+            self.symbol_mark_count.append(0)
+        return code
+
+    def _is_marked(self, row):
+        """
+        仓位开仓后其品种是否已经盯市过(未盯市的仓位浮动盈亏为0)
+        """
+        return self.mark_seq[row] < self.symbol_mark_count[self.symbol_code[row]]
+
+    def row_profit(self, row):
+        if not self._is_marked(row):
+            return 0.0
+        return float(self.profit_slope[row] * self.symbol_price[self.symbol_code[row]] + self.profit_base[row])
+
+    def row_margin(self, row):
+        price = self.symbol_price[self.symbol_code[row]] if self._is_marked(row) else self.open_price[row]
+        return float(self.margin_slope[row] * price)
+
+    def row_close(self, row):
+        if not self._is_marked(row):
+            return float(self.open_price[row]), self.open_time[row]
+        code = self.symbol_code[row]
+        return self.symbol_price[code], self.symbol_time[code]
+
+    def add(self, pos):
+        """
+        加入新开仓位
+        :param pos: Position
+        :return: BookPosition
+        """
+        if self.size == self.capacity:
+            self._grow()
+        row = self.size
+        symbol = pos.symbol
+        code = self._symbol_code(symbol.symbol_name)
+        tons = pos.lots * symbol.tons_per_lots
+        self.position_type[row] = pos.position_type
+        self.lots[row] = pos.lots
+        self.open_price[row] = pos.open_price
+        self.tons_per_lot[row] = symbol.tons_per_lots
+        self.leverage[row] = symbol.leverage
+        self.commission_ratio[row] = symbol.commission_ratio
+        self.profit_slope[row] = tons * (pos.position_type - symbol.commission_ratio)
+        self.profit_base[row] = -tons * pos.position_type * pos.open_price
+        self.margin_slope[row] = tons * symbol.leverage
+        self.symbol_code[row] = code
+        self.mark_seq[row] = self.symbol_mark_count[code]
+        self.strategy_id[row] = pos.strategy_id
+        self.open_time[row] = pos.open_time
+
+        self.symbol_profit_slope[code] += self.profit_slope[row]
+        self.symbol_profit_base[code] += self.profit_base[row]
+        self.symbol_margin_slope[code] += self.margin_slope[row]
+        self.symbol_margin[code] += self.margin_slope[row] * pos.open_price   # 开仓保证金由引擎计入账户
+
+        view = BookPosition(self, row, pos)
+        self._views.append(view)
+        self.size += 1
+        super().add(view)
+        return view
+
+    def remove(self, view):
+        """
+        移除仓位：用最后一行填补空位
+        :param view: BookPosition
+        :return:
+        """
+        super().remove(view)
+        row, last = view.row, self.size - 1
+        code = self.symbol_code[row]
+        self.symbol_profit[code] -= view.profit
+        self.symbol_margin[code] -= view.margin    # 平仓保证金由引擎从账户释放
+        self.symbol_profit_slope[code] -= self.profit_slope[row]
+        self.symbol_profit_base[code] -= self.profit_base[row]
+        self.symbol_margin_slope[code] -= self.margin_slope[row]
+        if view.symbol.symbol_name not in self._by_symbol:
+            # 该品种已无持仓，清除累计的舍入误差
+            for summary in (self.symbol_profit_slope, self.symbol_profit_base, self.symbol_margin_slope,
+                            self.symbol_profit, self.symbol_margin):
+                summary[code] = 0.0
+        view.detach()
+        if row != last:
+            for field in self._fields():
+                array = getattr(self, field)
+                array[row] = array[last]
+            moved = self._views[last]
+            moved.row = row
+            self._views[row] = moved
+        self._views.pop()
+        self.strategy_id[last] = None
+        self.open_time[last] = None
+        self.size -= 1
+
+    def mark_to_market(self, symbol_name, close_time, close_price):
+        """
+        按最新价格对该品种的全部仓位盯市
+        :param symbol_name:
+        :param close_time:
+        :param close_price:
+        :return: (全部仓位的浮动盈亏合计, 保证金变动) 该品种无仓位时返回None
+        """
+        if symbol_name not in self._by_symbol:
+            return None
+        code = self._symbol_codes[symbol_name]
+        self.symbol_price[code] = close_price
+        self.symbol_time[code] = close_time
+        self.symbol_mark_count[code] += 1
+        # 浮动盈亏扣除平仓手续费(开仓手续费在开仓时已从账户扣除)
+        self.symbol_profit[code] = self.symbol_profit_slope[code] * close_price + self.symbol_profit_base[code]
+        margin = self.symbol_margin_slope[code] * close_price
+        margin_increased = margin - self.symbol_margin[code]
+        self.symbol_margin[code] = margin
+        return sum(self.symbol_profit), margin_increased
+
+    def mark_curve(self, symbol_name, close_price):
+        """
+        按价格数组计算逐个价格盯市的结果，不改变账本状态(跳跃模式下为跳过的bar记录资金)
+        :param symbol_name:
+        :param close_price: 一维价格数组
+        :return: (全部仓位的浮动盈亏合计数组, 相对最近一次盯市的保证金变动数组) 该品种无仓位时返回None
+        """
+        if symbol_name not in self._by_symbol:
+            return None
+        code = self._symbol_codes[symbol_name]
+        others = sum(self.symbol_profit) - self.symbol_profit[code]
+        profit = self.symbol_profit_slope[code] * close_price + self.symbol_profit_base[code]
+        margin_increased = self.symbol_margin_slope[code] * close_price - self.symbol_margin[code]
+        return others + profit, margin_increased
+
+    def rows(self, symbol_name):
+        """
+        该品种仓位所在的行号
+        """
+        code = self._symbol_codes.get(symbol_name)
+        if code is None:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(self.symbol_code[:self.size] == code)
+
+    def profits(self, symbol_name, close_price):
+        """
+        向量化计算该品种每个仓位在给定价格(可为价格数组)下的浮动盈亏
+        :param symbol_name:
+        :param close_price: 标量或一维价格数组
+        :return: 形状为(仓位数,)或(价格数, 仓位数)
+        """
+        rows = self.rows(symbol_name)
+        return np.multiply.outer(close_price, self.profit_slope[rows]) + self.profit_base[rows]
+
+    def margins(self, symbol_name, close_price):
+        """
+        向量化计算该品种每个仓位在给定价格(可为价格数组)下的保证金
+        """
+        rows = self.rows(symbol_name)
+        return np.multiply.outer(close_price, self.margin_slope[rows])
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import ProcessPoolExecutor
+import base64
+import datetime
+import html
+import io
+import os
+import uuid
+import numpy as np
+from core.Metrics import draw_down_series, trade_arrays
+
+# 回测报告：
+#   绘图使用matplotlib的Figure和Agg画布直接写文件，不经过pyplot，不会选择或启动交互式的GUI后端，
+#   matplotlib只在实际绘图时导入；ReportWriter在后台进程中生成报告，不阻塞回测
+
+
+def equity_figure(time, balance, equity):
+    """
+    资金曲线(余额、净值)和回撤两幅子图
+    :param time: datetime64时间数组
+    :param balance: 余额数组
+    :param equity: 净值数组
+    :return: Figure
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    figure = Figure(figsize=(10, 6))
+    FigureCanvasAgg(figure)
+    ax1, ax2 = figure.subplots(2, 1, sharex=True)
+    ax1.plot(time, balance, label='balance')
+    ax1.plot(time, equity, label='equity')
+    ax1.legend(loc='upper left')
+    ax2.plot(time, draw_down_series(equity), color='tab:red')
+    ax2.set_ylabel('draw down')
+    figure.autofmt_xdate()
+    return figure
+
+
+def plot_equity(recorder, path='test.png', dpi=100):
+    """
+    将资金记录画成图片
+    :param recorder: EquityRecorder
+    :param path: 图片路径
+    :param dpi:
+    :return: path
+    """
+    figure = equity_figure(recorder['time'], np.asarray(recorder['balance']), np.asarray(recorder['equity']))
+    figure.savefig(path, dpi=dpi)
+    return path
+
+
+def trade_table(trade_list):
+    """
+    已平仓的仓位转换为交易数组(传给后台进程时不携带仓位对象)
+    :param trade_list: 已平仓的仓位列表
+    :return: 字段名 -> 数组
+    """
+    profit, hold_time = trade_arrays(trade_list)
+    return {
+        'open_time': np.array([np.datetime64(pos.open_time, 'ns') for pos in trade_list], dtype='datetime64[ns]'),
+        'close_time': np.array([np.datetime64(pos.close_time, 'ns') for pos in trade_list], dtype='datetime64[ns]'),
+        'position_type': np.array([pos.position_type for pos in trade_list], dtype=np.int64),
+        'open_price': np.array([pos.open_price for pos in trade_list], dtype=np.float64),
+        'close_price': np.array([pos.close_price for pos in trade_list], dtype=np.float64),
+        'profit': profit,
+        'hold_time': hold_time,
+    }
+
+
+def _html_table(header, rows):
+    lines = ['<table>', '<tr>' + ''.join('<th>%s</th>' % html.escape(str(h)) for h in header) + '</tr>']
+    for row in rows:
+        lines.append('<tr>' + ''.join('<td>%s</td>' % html.escape(str(v)) for v in row) + '</tr>')
+    lines.append('</table>')
+    return '\n'.join(lines)
+
+
+def render_report(path, time, balance, equity, trades=None, metrics=None, formats=('png', 'html'), dpi=100):
+    """
+    生成报告文件
+    :param path: 不含扩展名的输出路径，生成path.png/path.html
+    :param time: datetime64时间数组
+    :param balance: 余额数组
+    :param equity: 净值数组
+    :param trades: trade_table的结果
+    :param metrics: 绩效指标
+    :param formats: 'png'(资金曲线图)和/或'html'(指标、交易列表和内嵌的资金曲线图)
+    :param dpi:
+    :return: 生成的文件路径列表
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    buffer = io.BytesIO()
+    equity_figure(time, balance, equity).savefig(buffer, format='png', dpi=dpi)
+    paths = []
+    if 'png' in formats:
+        with open(path + '.png', 'wb') as f:
+            f.write(buffer.getvalue())
+        paths.append(path + '.png')
+    if 'html' in formats:
+        parts = ['<html><head><meta charset="utf-8"><title>%s</title>' % html.escape(os.path.basename(path)),
+                 '<style>table{border-collapse:collapse}td,th{border:1px solid #ccc;padding:2px 6px}</style>',
+                 '</head><body>', '<h2>%s</h2>' % html.escape(os.path.basename(path))]
+        if metrics:
+            parts.append(_html_table(('metric', 'value'), sorted(metrics.items())))
+        parts.append('<img src="data:image/png;base64,%s">' % base64.b64encode(buffer.getvalue()).decode('ascii'))
+        if trades is not None and len(trades['profit']):
+            names = list(trades)
+            parts.append('<h3>trades: %d</h3>' % len(trades['profit']))
+            parts.append(_html_table(names, zip(*(trades[name] for name in names))))
+        parts.append('</body></html>')
+        with open(path + '.html', 'w', encoding='utf-8') as f:
+            f.write('\n'.join(parts))
+        paths.append(path + '.html')
+    return paths
+
+
+class ReportWriter:
+    """
+    后台进程生成回测报告：
+        submit只复制资金和交易数组并提交任务，立即返回Future；
+        每个报告的文件名为 前缀-运行标识-序号，运行标识包含时间、进程号和随机串，多次运行和并发回测互不覆盖
+    """
+    def __init__(self, report_dir='reports', processes=1, formats=('png', 'html'), dpi=100):
+        """
+        :param report_dir: 报告目录
+        :param processes: 后台进程数
+        :param formats: 报告格式
+        :param dpi:
+        """
+        self.report_dir = report_dir
+        self.formats = formats
+        self.dpi = dpi
+        self.run_id = '%s-%d-%s' % (datetime.datetime.now().strftime('%Y%m%d%H%M%S'), os.getpid(), uuid.uuid4().hex[:6])
+        self.count = 0
+        self.futures = []
+        self.pool = ProcessPoolExecutor(max_workers=processes)
+
+    def next_path(self, prefix='report'):
+        """
+        不重复的输出路径(不含扩展名)
+        """
+        self.count += 1
+        return os.path.join(self.report_dir, '%s-%s-%04d' % (prefix, self.run_id, self.count))
+
+    def submit(self, recorder, trade_list=(), metrics=None, name=None, prefix='report'):
+        """
+        提交一个报告
+        :param recorder: EquityRecorder
+        :param trade_list: 已平仓的仓位列表
+        :param metrics: 绩效指标
+        :param name: 报告名称(不含扩展名)，None时自动生成不重复的名称
+        :param prefix: 自动生成名称的前缀
+        :return: Future，结果为生成的文件路径列表
+        """
+        return self.submit_arrays(recorder['time'], recorder['balance'], recorder['equity'],
+                                  trade_table(list(trade_list)), metrics, name, prefix)
+
+    def submit_arrays(self, time, balance, equity, trades=None, metrics=None, name=None, prefix='report'):
+        """
+        提交一个报告(资金和交易已是数组)，参数同render_report和submit
+        """
+        path = self.next_path(prefix) if name is None else os.path.join(self.report_dir, name)
+        future = self.pool.submit(render_report, path, np.array(time), np.array(balance), np.array(equity), trades,
+                                  metrics, self.formats, self.dpi)
+        self.futures.append(future)
+        return future
+
+    def wait(self):
+        """
+        等待全部报告完成
+        :return: 生成的文件路径列表
+        """
+        return [path for f in self.futures for path in f.result()]
+
+    def close(self, wait=True):
+        self.pool.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+if __name__ == '__main__':
+    import time
+    from core.Account import EquityRecorder
+    # 后台生成多个报告，提交不等待绘图，文件名互不重复
+    n = 10000
+    equity = 100000 + np.cumsum(np.random.default_rng(0).normal(0, 50, n))
+    recorder = EquityRecorder(capacity=n)
+    values = np.zeros((n, len(EquityRecorder.FIELDS)))
+    values[:, 0] = values[:, 1] = equity
+    recorder.extend(np.datetime64('2020-01-01') + np.arange(n) * np.timedelta64(1, 'm'), values)
+    with ReportWriter('reports', processes=2) as writer:
+        begin = time.perf_counter()
+        for i in range(4):
+            writer.submit(recorder)
+        print('submit: %.3fs' % (time.perf_counter() - begin))
+        paths = writer.wait()
+    print(paths)
+    assert len(set(paths)) == len(paths) == 8
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import inspect
+import json
+import os
+import pickle
+
+# 回测结果的磁盘缓存：
+#   键由bar数据内容、策略类源码(及version属性)、参数对象的字段、品种的成本字段、初始资金和引擎选项共同决定，
+#   值为资金记录和绩效指标，每个结果一个pickle文件；总大小超过上限时按最近使用时间(文件修改时间)淘汰
+
+SYMBOL_COST_FIELDS = ('symbol_name', 'leverage', 'commission_ratio', 'tons_per_lots', 'slip_point')
+
+
+def strategy_source(strategy_class):
+    """
+    策略类及其基类的源码，取不到源码(交互环境中定义)时只用类名；
+        策略依赖类外的函数时，修改后需更新策略类的version属性使缓存失效
+    """
+    parts = [str(getattr(strategy_class, 'version', ''))]
+    for cls in strategy_class.__mro__:
+        if cls is object:
+            continue
+        try:
+            parts.append(inspect.getsource(cls))
+        except (OSError, TypeError):
+            parts.append('%s.%s' % (cls.__module__, cls.__qualname__))
+    return '\n'.join(parts)
+
+
+class ResultCache:
+    """
+    磁盘上的回测结果缓存，进程间可共用同一目录(写入时先写临时文件再改名)
+    """
+    def __init__(self, cache_dir='.result_cache', max_bytes=512 * 2 ** 20):
+        """
+        :param cache_dir: 缓存目录
+        :param max_bytes: 缓存总大小上限
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def data_hash(data):
+        """
+        bar数据的内容哈希：每次调用都重新计算，数据被原地修改后哈希随之变化；
+            多次回测共用同一份数据时由调用方算一次后传入(如ParameterSweep每次run计算一次)
+        :param data: DataFrame或BarCursor
+        :return:
+        """
+        from core.Checkpoint import data_fingerprint
+        return data_fingerprint(data, len(data))
+
+    @staticmethod
+    def key(data_hash, strategy_class, parameter, symbol, initial_capital, options=None):
+        """
+        :param data_hash: data_hash(data)
+        :param strategy_class: 策略类
+        :param parameter: 参数对象
+        :param symbol: FutureSymbol
+        :param initial_capital: 初始资金
+        :param options: 影响结果的引擎选项(字典)，如{'precompute_indicators': True}
+        :return: 缓存键
+        """
+        text = json.dumps({
+            'data': data_hash,
+            'strategy': hashlib.sha1(strategy_source(strategy_class).encode('utf-8')).hexdigest(),
+            'parameter': [type(parameter).__name__, vars(parameter)],
+            'symbol': {field: getattr(symbol, field, None) for field in SYMBOL_COST_FIELDS},
+            'initial_capital': initial_capital,
+            'options': options or {},
+        }, sort_keys=True, default=repr)
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.pkl')
+
+    def get(self, key):
+        """
+        :return: 缓存的结果，不存在时返回None
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                result = pickle.load(f)
+            os.utime(path)  # 更新最近使用时间
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """
+        写入结果并淘汰最久未使用的结果
+        :param key:
+        :param result: {'recorder': EquityRecorder, 'metrics': 绩效指标}
+        :return:
+        """
+        path = self._path(key)
+        tmp = '%s.tmp-%d' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.evict()
+
+    def entries(self):
+        """
+        :return: [(最近使用时间, 大小, 路径)]，按使用时间从旧到新
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries[:-1]:  # 至少保留最新的结果
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
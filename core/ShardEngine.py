@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import copy
+import os
+import numpy as np
+from core.Account import Account, EquityRecorder
+from core.Bar import as_bar_cursor
+from core.Engine import BackTestEngine
+from core.Metrics import performance_metrics
+from core.Optimizer import start_worker_pool, worker_bars
+
+
+class Segment:
+    """
+    一段回测的结果：全局位置[begin, end)上每个bar的账户记录、处理完该bar后是否空仓、累计平仓数目
+        段首空仓，账户从initial_capital开始；拼接时从中间位置截取的部分按两段在该处的余额之差平移
+    """
+    def __init__(self, begin, initial_capital):
+        self.begin = begin
+        self.end = begin
+        self.initial_capital = initial_capital
+        self.values = None  # (bar数, len(EquityRecorder.FIELDS))
+        self.flat = []  # 第i个bar处理完后没有持仓和待成交订单
+        self.trade_count = []   # 第i个bar处理完后的累计平仓数目
+        self.trade_list = []
+
+    def record(self, engine):
+        self.flat.append(engine.is_flat())
+        self.trade_count.append(len(engine.trade_list))
+        self.end += 1
+
+    def finish(self, engine):
+        """
+        结束记录，取出资金记录和已平仓的仓位(只保留结果，不引用引擎)
+        """
+        self.values = engine.recorder.values[:engine.recorder.size].copy()
+        self.flat = np.array(self.flat, dtype=bool)
+        self.trade_count = np.array(self.trade_count, dtype=np.int64)
+        self.trade_list = list(engine.trade_list)
+        return self
+
+    def flat_at(self, index):
+        """
+        第index个bar开始前是否空仓(段首为空仓)
+        """
+        if index == self.begin:
+            return True
+        return bool(self.flat[index - 1 - self.begin])
+
+    def last_flat(self, begin, end):
+        """
+        [begin, end]中最后一个开始前空仓的位置，begin须为空仓位置
+        """
+        hit = np.flatnonzero(self.flat[begin - self.begin:end - self.begin])
+        return begin + int(hit[-1]) + 1 if len(hit) else begin
+
+    def state_before(self, index):
+        """
+        第index个bar开始前本段的(余额, 手续费合计)
+        """
+        if index == self.begin:
+            return self.initial_capital, 0.0
+        return float(self.values[index - 1 - self.begin, 1]), float(self.values[index - 1 - self.begin, 5])
+
+    def trades(self, begin, end):
+        """
+        在[begin, end)的bar上平仓的仓位
+        """
+        first = self.trade_count[begin - 1 - self.begin] if begin > self.begin else 0
+        return self.trade_list[first:self.trade_count[end - 1 - self.begin]]
+
+
+def segment_engine(bars, strategy, initial_capital, begin, warm_up, end=None):
+    """
+    构建从第begin个bar开始的分段回测引擎：前warm_up个bar只用来预热指标
+    :param bars: BarCursor
+    :param strategy: 策略列表(使用其副本)
+    :param initial_capital: 段首资金
+    :param begin: 段首位置
+    :param warm_up: 预热的bar数目
+    :param end: 段尾位置(不包含)，None为数据末尾
+    :return: (引擎, 从段首开始的bar迭代器)
+    """
+    lo = max(begin - warm_up, 0)
+    engine = BackTestEngine(bars.slice(lo, len(bars) if end is None else end), copy.deepcopy(strategy),
+                            Account(initial_capital=initial_capital))
+    engine.warm_up(begin - lo)
+    return engine, engine.bars.iter_bars(begin - lo)
+
+
+def _run_shard(strategy, initial_capital, begin, end, warm_up):
+    engine, bars = segment_engine(worker_bars(), strategy, initial_capital, begin, warm_up, end)
+    segment = Segment(begin, initial_capital)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for bar in bars:
+            engine.on_bar(bar)
+            segment.record(engine)
+    return segment.finish(engine)
+
+
+class ShardedBackTestEngine:
+    """
+    按时间分段的并行回测(单品种)：
+        历史数据切分为shards段，每段在进程池中独立回测，段首之前的warm_up个bar只预热指标；
+        前一段在段首空仓(无持仓、无待成交订单)时，串行回测在该处的状态与分段回测的初始状态一致
+        (策略状态只有指标)，两段直接拼接，资金按前一段的余额平移；
+        段首有持仓时，从前一段最后的空仓位置在本进程串行重放，直到与之后某段在同一位置都空仓再拼接
+    策略在指标之外还有随bar变化的状态时，须重写skip_bars使预热后的状态与串行回测一致
+    """
+    def __init__(self, data, strategy, account=Account(), shards=None, processes=None, warm_up=None):
+        """
+        :param data: DataFrame或BarCursor，单品种数据
+        :param strategy: 策略列表，各段使用其副本
+        :param account: 账户(只使用初始资金，回测结束后更新为拼接结果的最终状态)
+        :param shards: 分段数目，默认为进程数
+        :param processes: 进程数，默认为cpu数目
+        :param warm_up: 每段预热的bar数目，默认为策略指标的最大窗口(tau)
+        """
+        self.bars = as_bar_cursor(data)
+        self.strategy = strategy
+        self.account = account
+        self.processes = processes or os.cpu_count()
+        self.shards = max(1, min(shards or self.processes, len(self.bars)))
+        self.warm_up = max(s.warm_up_bars() for s in strategy) if warm_up is None else warm_up
+        self.segments = []
+        self.pieces = []    # 拼接结果的组成：(起点, 终点, Segment)
+        self.trade_list = []
+        self.recorder = EquityRecorder(capacity=max(len(self.bars), 1))
+        self.metrics = None
+
+        symbol_names = self.bars.columns.get('symbol_name')
+        if symbol_names is None or (len(symbol_names) and np.any(symbol_names != symbol_names[0])):
+            raise Exception('sharded back test supports single symbol data only')
+
+    def boundaries(self):
+        """
+        各段的起点，末尾为数据长度
+        """
+        return np.linspace(0, len(self.bars), self.shards + 1).astype(np.int64).tolist()
+
+    def run_shards(self):
+        """
+        在进程池中回测各段，只有一段时在本进程回测
+        """
+        bounds = self.boundaries()
+        tasks = [(self.strategy, self.account.initial_capital, begin, end, self.warm_up)
+                 for begin, end in zip(bounds[:-1], bounds[1:])]
+        if self.shards == 1:
+            return [self.replay(0, [], 0)[0]]
+        shared, pool = start_worker_pool(self.bars, min(self.processes, self.shards))
+        try:
+            with pool:
+                futures = [pool.submit(_run_shard, *task) for task in tasks]
+                return [f.result() for f in futures]
+        finally:
+            shared.close()
+
+    def replay(self, begin, segments, k):
+        """
+        从空仓位置begin开始在本进程串行回测，直到与segments[k:]中某段在同一位置都空仓
+        :return: (串行回测的Segment, 汇合段的序号, 汇合位置)，一直未汇合时返回(Segment, len(segments), 数据长度)
+        """
+        n = len(self.bars)
+        engine, bars = segment_engine(self.bars, self.strategy, self.account.initial_capital, begin, self.warm_up)
+        segment = Segment(begin, self.account.initial_capital)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for index, bar in zip(range(begin, n), bars):
+                engine.on_bar(bar)
+                segment.record(engine)
+                join = index + 1
+                while k + 1 < len(segments) and segments[k + 1].begin <= join:
+                    k += 1
+                if k < len(segments) and segments[k].begin <= join < n and engine.is_flat() \
+                        and segments[k].flat_at(join):
+                    return segment.finish(engine), k, join
+        return segment.finish(engine), len(segments), n
+
+    def stitch(self, segments):
+        """
+        将各段结果拼接为串行回测的结果
+        :return: [(起点, 终点, Segment)]
+        """
+        pieces = []
+        current, begin, k = segments[0], 0, 1
+        while k <= len(segments):
+            end = segments[k].begin if k < len(segments) else len(self.bars)
+            if k == len(segments) or current.flat_at(end):
+                pieces.append((begin, end, current))
+                if k < len(segments):
+                    current, begin = segments[k], end
+                k += 1
+                continue
+            # 段首有持仓：从前一段最后的空仓位置串行重放
+            restart = current.last_flat(begin, end)
+            if restart > begin:
+                pieces.append((begin, restart, current))
+            replayed, k, join = self.replay(restart, segments, k)
+            pieces.append((restart, join, replayed))
+            if k == len(segments):
+                break
+            current, begin = segments[k], join
+            k += 1
+        return pieces
+
+    def run(self):
+        print('sharded back test begin...')
+        self.segments = self.run_shards()
+        self.pieces = self.stitch(self.segments)
+
+        # 按前一段结束时的余额平移各段的资金记录
+        time = self.bars.columns['date_time']
+        balance = self.account.initial_capital
+        commission = 0.0
+        self.trade_list = []
+        for begin, end, segment in self.pieces:
+            values = segment.values[begin - segment.begin:end - segment.begin].copy()
+            base_balance, base_commission = segment.state_before(begin)
+            offset = balance - base_balance
+            equity, seg_balance, margin_used, margin_free, capital_ratio, seg_commission = values.T
+            equity += offset
+            seg_balance += offset
+            margin_free += offset
+            np.divide(margin_used, equity, out=capital_ratio)
+            seg_commission += commission - base_commission
+            self.recorder.extend(time[begin:end], values)
+            self.trade_list.extend(segment.trades(begin, end))
+            balance, commission = float(values[-1, 1]), float(values[-1, 5])
+
+        last = self.recorder.values[self.recorder.size - 1]
+        self.account.equity, self.account.balance, self.account.margin_used, self.account.margin_free, \
+            self.account.capital_ratio, self.account.commission = last.tolist()
+        day_num = (self.recorder['time'][-1] - self.recorder['time'][0]) / np.timedelta64(1, 'D')
+        total_rate = (self.account.equity / self.account.initial_capital) - 1
+        annualized_rate = (self.account.equity / self.account.initial_capital) ** (365 / day_num) - 1
+        print('sharded back test OK! shards:', len(self.segments), 'serial replayed bars:',
+              sum(end - begin for begin, end, segment in self.pieces if segment not in self.segments))
+        return day_num, total_rate, annualized_rate
+
+    def result_analysis(self):
+        self.metrics = performance_metrics(self.recorder['equity'], self.recorder['time'], self.trade_list)
+        return self.metrics['annualized_rate'], self.metrics['max_draw_down']
+
+
+if __name__ == '__main__':
+    import io
+    import time as timer
+    from benchmark.SyntheticData import make_bar_data
+    from core.Symbol import SymbolRB
+    from BackTestBoll import ParameterBoll, StrategyBoll
+    # 与串行回测对比资金曲线和交易
+    data = make_bar_data(100000, seed=1)
+    for parameter in (ParameterBoll(take_profit=500, stop_days=0.5), ParameterBoll(take_profit=5000, stop_days=14)):
+        serial = BackTestEngine(data, [StrategyBoll(1, parameter, SymbolRB())], Account(100000))
+        begin = timer.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            serial.run()
+        cost = timer.perf_counter() - begin
+        sharded = ShardedBackTestEngine(data, [StrategyBoll(1, parameter, SymbolRB())], Account(100000), shards=4)
+        begin = timer.perf_counter()
+        sharded.run()
+        difference = np.abs(serial.recorder['equity'] - sharded.recorder['equity']).max()
+        print('max equity difference:', difference, 'trades:', len(serial.trade_list), len(sharded.trade_list),
+              'serial %.1fs sharded %.1fs' % (cost, timer.perf_counter() - begin))
+        assert difference < 1e-6 and len(serial.trade_list) == len(sharded.trade_list)
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import numpy as np
 
 
 class StrategyBase(object):
@@ -9,6 +10,108 @@ class StrategyBase(object):
         self.strategy_id = strategy_id
         self.parameter = parameter
         self.symbol = symbol
+        self.symbols = []   # 订阅的品种名称，回测引擎只向策略分发这些品种的bar
+        if symbol is not None:
+            self.subscribe(symbol)
+        self.indicators = []    # 策略声明的增量指标: (指标, 数据字段)
+
+    def subscribe(self, *symbols):
+        """
+        订阅品种(默认订阅self.symbol)，跨品种策略可订阅多个品种
+        :param symbols: FutureSymbol或品种名称
+        :return:
+        """
+        for symbol in symbols:
+            symbol_name = getattr(symbol, 'symbol_name', symbol)
+            if symbol_name not in self.symbols:
+                self.symbols.append(symbol_name)
+
+    def add_indicator(self, indicator, field='open'):
+        """
+        声明增量指标，每个bar由update_indicators统一更新，替代原始的deque价格窗口
+        :param indicator: core.Indicator中的指标对象
+        :param field: 指标使用的bar字段
+        :return: indicator
+        """
+        self.indicators.append((indicator, field))
+        return indicator
+
+    def use_indicator(self, indicator_class, window, field='open', **kwargs):
+        """
+        声明可共享的指标：回测引擎将其替换为注册表中的共享实例，相同(品种, 指标, 窗口, 字段)只计算一次；
+            不在BackTestEngine中运行时即为策略私有的指标
+        :param indicator_class: core.Indicator中的指标类
+        :param window: 窗口长度
+        :param field: 指标使用的bar字段
+        :param kwargs: 指标的其他参数
+        :return: 指标对象
+        """
+        indicator = indicator_class(window, **kwargs)
+        indicator.share_key = (indicator_class, window, tuple(sorted(kwargs.items())))
+        return self.add_indicator(indicator, field)
+
+    def set_parameter(self, parameter):
+        """
+        热替换策略参数(walk-forward优化后调用)，依赖参数的指标需在子类中重建
+        :param parameter:
+        :return:
+        """
+        self.parameter = parameter
+
+    def warm_up_bars(self):
+        """
+        指标达到可用状态所需的bar数目
+        """
+        return max([indicator.window for indicator, field in self.indicators] + [0])
+
+    def update_indicators(self, data):
+        """
+        使用新的bar数据更新全部指标
+        :param data:
+        :return:
+        """
+        for indicator, field in self.indicators:
+            # 共享指标由引擎的指标注册表更新
+            if not indicator.shared:
+                indicator.update(getattr(data, field))
+
+    def vector_signals(self, bars):
+        """
+        向量化回测接口：一次计算全部bar上的开仓信号(策略空仓时在该bar发出的开仓订单)
+        :param bars: BarCursor
+        :return: 与bar等长的数组，ORDER_TYPE_BUY开多，ORDER_TYPE_SELL开空，0不开仓
+        """
+        raise Exception('strategy %s does not support vectorized back test' % type(self).__name__)
+
+    def vector_exits(self):
+        """
+        向量化回测接口：平仓条件
+        :return: (take_profit, stop_time) 浮动盈亏超过take_profit或持仓时间超过stop_time时平仓，None表示不使用该条件
+        """
+        raise Exception('strategy %s does not support vectorized back test' % type(self).__name__)
+
+    def next_action_index(self, bars, index, pos_ls):
+        """
+        跳跃模式接口：第index个bar运行之后，返回策略下一个可能发出订单的bar位置，
+            两者之间的bar上策略必定不发出订单，引擎跳过这些bar(只记录资金)
+        :param bars: BarCursor
+        :param index: 当前bar位置
+        :param pos_ls: 策略的仓位
+        :return: 默认index + 1，即不跳跃
+        """
+        return index + 1
+
+    def skip_bars(self, bars, begin, end):
+        """
+        跳跃模式接口：引擎跳过[begin, end)的bar时更新策略状态，默认批量更新指标
+        :param bars: BarCursor
+        :param begin:
+        :param end:
+        :return:
+        """
+        for indicator, field in self.indicators:
+            if not indicator.shared:
+                indicator.update_many(bars.columns[field][begin:end].tolist())
 
     def open_condition(self):
         """
@@ -26,3 +129,60 @@ class StrategyBase(object):
 
     def run(self, data, pos_ls):
         pass
+
+
+class BatchStrategyBase(object):
+    """
+    批量策略：一组(参数, 品种)共用一个策略对象，指标和信号都是该轴上的数组
+        同一品种的多组参数 -- BatchBackTestEngine
+        多个品种(各自的参数) -- CrossSymbolEngine
+    """
+    def __init__(self, strategy_id, parameter_list, symbol):
+        """
+        :param strategy_id:
+        :param parameter_list: 参数列表
+        :param symbol: FutureSymbol，或与parameter_list等长的FutureSymbol列表
+        """
+        self.strategy_id = strategy_id
+        self.parameter_list = list(parameter_list)
+        self.symbol = symbol
+        self.size = len(self.parameter_list)    # 参数组数
+        self.symbol_list = list(symbol) if isinstance(symbol, (list, tuple)) else [symbol] * self.size
+        if len(self.symbol_list) != self.size:
+            raise Exception('symbol list and parameter list do not match!')
+
+    def parameter_array(self, name, dtype=np.float64):
+        """
+        参数轴上的参数值数组
+        :param name: 参数名
+        :param dtype:
+        :return:
+        """
+        return np.array([getattr(p, name) for p in self.parameter_list], dtype=dtype)
+
+    def cost_array(self, name):
+        """
+        各组对应品种的合约参数数组
+        :param name: FutureSymbol的字段名，如commission_ratio
+        :return:
+        """
+        return np.array([getattr(s, name) for s in self.symbol_list], dtype=np.float64)
+
+    def prepare(self, bars):
+        """
+        回测开始前初始化指标状态
+        :param bars: BarCursor(BatchBackTestEngine)或SymbolPanel(CrossSymbolEngine)
+        :return:
+        """
+        pass
+
+    def run(self, index, price, time, positions):
+        """
+        处理第index个bar
+        :param index: bar位置
+        :param price: 开盘价(CrossSymbolEngine中为各品种的开盘价数组)
+        :param time: 纳秒时间戳
+        :param positions: BatchPositions
+        :return: (开仓方向数组, 平仓标记数组)，只对空仓/持仓的参数组生效
+        """
+        pass
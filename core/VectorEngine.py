@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from core.Account import Account, EquityRecorder
+from core.Bar import as_bar_cursor
+from core.Metrics import performance_metrics, trade_statistics
+
+
+def first_true(condition, begin, end, chunk=256):
+    """
+    在[begin, end)中查找condition首次成立的位置，按倍增的块向量化计算，找到即停止
+    :param condition: condition(b, e) -> [b, e)区间上的布尔数组
+    :return: 位置，未找到时返回end
+    """
+    while begin < end:
+        stop = min(begin + chunk, end)
+        hit = np.flatnonzero(condition(begin, stop))
+        if len(hit):
+            return begin + int(hit[0])
+        begin = stop
+        chunk *= 2
+    return end
+
+
+class VectorBackTestEngine:
+    """
+    向量化回测引擎(快速通道)：
+        适用于开仓信号只依赖价格历史、平仓条件为获利/持仓时间的单品种单策略(如StrategyBoll)，
+        信号由策略的vector_signals一次算出，逐笔交易用数组查找确定平仓bar，资金曲线整体计算；
+        成交时序、滑点、手续费、保证金与BackTestEngine一致：
+            第k个bar发出的订单在第k+1个bar的开盘价成交，新仓在开仓bar不盯市(浮动盈亏为0)
+    """
+    def __init__(self, data, strategy, account=Account(), lots=1):
+        """
+        :param data: DataFrame或BarCursor，只含策略品种的数据
+        :param strategy: 实现了vector_signals/vector_exits的策略
+        :param account: 账户(只使用初始资金)
+        :param lots: 每笔交易的手数
+        """
+        self.bars = as_bar_cursor(data)
+        self.strategy = strategy
+        self.account = account
+        self.lots = lots
+        self.trades = None  # 交易记录：字段名 -> 数组
+        self.recorder = EquityRecorder(capacity=max(len(self.bars), 1))
+        self.metrics = None
+
+        symbol_names = self.bars.columns.get('symbol_name')
+        if symbol_names is not None and len(symbol_names) and np.any(symbol_names != strategy.symbol.symbol_name):
+            raise Exception('vectorized back test needs data of the strategy symbol only')
+
+    def find_trades(self, price, time, signal):
+        """
+        逐笔确定开平仓位置
+        :return: 交易列表[(开仓bar, 平仓bar, 方向, 开仓价)]，平仓bar为len(price)表示回测结束时仍持仓
+        """
+        n = len(price)
+        symbol = self.strategy.symbol
+        tons = self.lots * symbol.tons_per_lots
+        take_profit, stop_time = self.strategy.vector_exits()
+        stop_ns = None if stop_time is None else int(np.timedelta64(stop_time, 'ns').astype(np.int64))
+        entries = np.flatnonzero(signal)
+        trades = []
+        k = 0
+        while True:
+            i = np.searchsorted(entries, k)
+            if i == len(entries) or entries[i] + 1 >= n:
+                break
+            k = int(entries[i])
+            j = k + 1   # 开仓bar
+            position_type = int(signal[k])
+            open_price = price[j] + position_type * symbol.slip_point
+            profit_slope = tons * (position_type - symbol.commission_ratio)
+            profit_base = -tons * position_type * open_price
+
+            # 开仓bar上仓位未盯市：浮动盈亏和持仓时间都为0
+            if (take_profit is not None and 0 > take_profit) or (stop_ns is not None and 0 > stop_ns):
+                m = j
+            else:
+                m_stop = n if stop_ns is None else int(np.searchsorted(time, time[j] + stop_ns, side='right'))
+                m_stop = max(m_stop, j + 1)
+                if take_profit is None:
+                    m = m_stop
+                else:
+                    m = first_true(lambda b, e: profit_slope * price[b:e] + profit_base > take_profit, j + 1, m_stop)
+            close = min(m + 1, n)   # 第m个bar发出平仓订单，下一个bar成交
+            trades.append((j, close, position_type, open_price))
+            if close >= n:
+                break
+            k = close
+        return trades
+
+    def run(self):
+        print('vector back test begin...')
+        price = np.asarray(self.bars.columns['open'], dtype=np.float64)
+        time = self.bars.columns['date_time'].view(np.int64)
+        n = len(price)
+        signal = np.asarray(self.strategy.vector_signals(self.bars))
+        symbol = self.strategy.symbol
+        tons = self.lots * symbol.tons_per_lots
+        trades = self.find_trades(price, time, signal)
+
+        # 余额的逐bar变动：开仓扣除开仓手续费，平仓计入平仓获利(已扣平仓手续费)
+        delta = np.zeros(n)
+        delta[0] = self.account.initial_capital
+        floating = np.zeros(n)
+        margin = np.zeros(n)
+        columns = {name: [] for name in ('open_index', 'close_index', 'position_type', 'open_price', 'close_price',
+                                         'profit', 'commission')}
+        for j, close, position_type, open_price in trades:
+            profit_slope = tons * (position_type - symbol.commission_ratio)
+            profit_base = -tons * position_type * open_price
+            commission = self.lots * symbol.tons_per_lots * open_price * symbol.commission_ratio
+            delta[j] -= commission
+            floating[j + 1:close] = profit_slope * price[j + 1:close] + profit_base
+            margin[j] = tons * symbol.leverage * open_price
+            margin[j + 1:close] = tons * symbol.leverage * price[j + 1:close]
+            if close < n:
+                delta[close] += profit_slope * price[close] + profit_base
+                columns['close_index'].append(close)
+                columns['close_price'].append(price[close])
+                columns['profit'].append(profit_slope * price[close] + profit_base)
+                columns['open_index'].append(j)
+                columns['position_type'].append(position_type)
+                columns['open_price'].append(open_price)
+                columns['commission'].append(commission)
+        self.trades = {name: np.array(values) for name, values in columns.items()}
+
+        values = np.empty((n, len(EquityRecorder.FIELDS)))
+        equity, balance, margin_used, margin_free, capital_ratio, commission = values.T
+        np.cumsum(delta, out=balance)
+        np.add(balance, floating, out=equity)
+        margin_used[:] = margin
+        np.subtract(equity, margin, out=margin_free)
+        np.divide(margin, equity, out=capital_ratio)
+        commission[:] = 0.0
+        self.recorder.extend(time, values)
+        self.account.balance = float(balance[-1])
+        self.account.equity = float(equity[-1])
+        self.account.margin_used = float(margin[-1])
+        self.account.margin_free = self.account.equity - self.account.margin_used
+        self.account.capital_ratio = self.account.margin_used / self.account.equity
+
+        day_num = (time[-1] - time[0]) / 86400e9
+        total_rate = (self.account.equity / self.account.initial_capital) - 1
+        annualized_rate = (self.account.equity / self.account.initial_capital) ** (365 / day_num) - 1
+        print('vector back test OK!')
+        return day_num, total_rate, annualized_rate
+
+    def trade_arrays(self):
+        """
+        已平仓交易的单笔盈亏(扣除开平仓手续费)和持仓时间，与Metrics.trade_arrays一致
+        """
+        time = self.recorder['time']
+        if len(self.trades['open_index']) == 0:
+            return np.zeros(0), np.zeros(0, dtype='timedelta64[ns]')
+        hold_time = time[self.trades['close_index']] - time[self.trades['open_index']]
+        return self.trades['profit'] - self.trades['commission'], hold_time
+
+    def result_analysis(self):
+        self.metrics = performance_metrics(self.recorder['equity'], self.recorder['time'])
+        self.metrics.update(trade_statistics(*self.trade_arrays()))
+        return self.metrics['annualized_rate'], self.metrics['max_draw_down']
+
+
+if __name__ == '__main__':
+    import contextlib
+    import io
+    import time as timer
+    from benchmark.SyntheticData import make_bar_data
+    from core.Engine import BackTestEngine
+    from core.Symbol import SymbolRB
+    from BackTestBoll import ParameterBoll, StrategyBoll
+    # 与逐bar回测引擎对比资金曲线和速度
+    data = make_bar_data(100000, seed=1)
+    parameter = ParameterBoll(take_profit=500, stop_days=0.5)
+    engines = [BackTestEngine(data, [StrategyBoll(1, parameter, SymbolRB())], Account(100000)),
+               VectorBackTestEngine(data, StrategyBoll(1, parameter, SymbolRB()), Account(100000))]
+    cost = []
+    for engine in engines:
+        begin = timer.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine.run()
+        cost.append(timer.perf_counter() - begin)
+    difference = np.abs(engines[0].recorder['equity'] - engines[1].recorder['equity']).max()
+    print('max equity difference:', difference, 'speed up: %.1fx' % (cost[0] / cost[1]))
+    assert difference < 1e-6
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from core.common import *
+
+# csv的二进制列式缓存：
+#   每个csv首次读取时转换为每列一个.npy文件(时间为int64纳秒)，之后以内存映射方式加载
+#   缓存以(文件路径, 修改时间, 文件大小)为键，源文件变化后自动失效并重建
+
+CACHE_DIR_NAME = '.bar_cache'
+
+
+def cache_key(csv_path):
+    """
+    缓存键：文件绝对路径 + 修改时间 + 文件大小
+    """
+    st = os.stat(csv_path)
+    text = '%s|%d|%d' % (os.path.abspath(csv_path), st.st_mtime_ns, st.st_size)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def _entry_dir(csv_path, cache_dir):
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(csv_path)), CACHE_DIR_NAME)
+    return cache_dir, os.path.join(cache_dir, '%s-%s' % (os.path.basename(csv_path), cache_key(csv_path)))
+
+
+def build_cache(csv_path, entry):
+    """
+    解析csv并写入缓存目录(先写临时目录再改名，避免并发读取到不完整的缓存)
+    """
+    import pandas as pd
+    data = pd.read_csv(csv_path, parse_dates=[0])
+    names = BAR_DATA_COLUMN_NAMES_10[:len(data.columns)]
+    tmp = '%s.tmp-%d' % (entry, os.getpid())
+    os.makedirs(tmp, exist_ok=True)
+    for name, column in zip(names, data.columns):
+        values = data[column].to_numpy()
+        if name == 'date_time':
+            values = values.astype('datetime64[ns]').view(np.int64)
+        np.save(os.path.join(tmp, name + '.npy'), np.ascontiguousarray(values))
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump({'source': os.path.abspath(csv_path), 'columns': names, 'rows': len(data)}, f)
+    try:
+        os.replace(tmp, entry)
+    except OSError:
+        # 其他进程已经写好了同一份缓存
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _remove_stale(cache_dir, csv_path, entry):
+    """
+    删除同一csv的过期缓存：按缓存记录的源文件绝对路径匹配，共用缓存目录的其他目录中的同名csv不受影响
+    """
+    prefix = os.path.basename(csv_path) + '-'
+    source = os.path.abspath(csv_path)
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if not name.startswith(prefix) or path == entry or '.tmp-' in name:
+            continue
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                if json.load(f).get('source') != source:
+                    continue
+        except (OSError, ValueError):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def load_columns(csv_path, cache_dir=None, nrows=None):
+    """
+    读取csv的列数据，优先使用缓存
+    :param csv_path: csv文件路径
+    :param cache_dir: 缓存目录，默认为csv所在目录下的.bar_cache
+    :param nrows: 只取前nrows行
+    :return: 列名 -> 只读的内存映射数组(date_time为datetime64[ns])
+    """
+    cache_dir, entry = _entry_dir(csv_path, cache_dir)
+    if not os.path.exists(os.path.join(entry, 'meta.json')):
+        os.makedirs(cache_dir, exist_ok=True)
+        build_cache(csv_path, entry)
+        _remove_stale(cache_dir, csv_path, entry)
+    with open(os.path.join(entry, 'meta.json')) as f:
+        meta = json.load(f)
+    columns = {}
+    for name in meta['columns']:
+        values = np.load(os.path.join(entry, name + '.npy'), mmap_mode='r')
+        if name == 'date_time':
+            values = values.view('datetime64[ns]')
+        columns[name] = values[:nrows]
+    return columns
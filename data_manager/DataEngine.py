@@ -1,15 +1,53 @@
-import pandas as pd
+import numpy as np
 from core.common import *
+from core.Bar import BarCursor
+from data_manager.DataCache import load_columns
+from data_manager.DataStream import BarStream, MultiFeedStream
 import os
 
 
 # 获取测试数据
-def get_future_data(file_name='rb-SHF_min.csv', symbol_name='rb-SHF', path='../../Data/FutureData/', nrows=10000):
-    _data = pd.read_csv(path+file_name, nrows=nrows, parse_dates=[0])
+def get_future_data(file_name='rb-SHF_min.csv', symbol_name='rb-SHF', path='../../Data/FutureData/', nrows=10000,
+                    use_cache=True):
+    import pandas as pd     # 只在读取数据时导入
+    if not use_cache:
+        _data = pd.read_csv(path+file_name, nrows=nrows, parse_dates=[0])
+        _data['symbol_name'] = symbol_name
+        _data.columns = BAR_DATA_COLUMN_NAMES_10
+        return _data
+    _data = pd.DataFrame(load_columns(path+file_name, nrows=nrows))
     _data['symbol_name'] = symbol_name
     _data.columns = BAR_DATA_COLUMN_NAMES_10
     return _data
 
+
+def get_future_bars(file_name='rb-SHF_min.csv', symbol_name='rb-SHF', path='../../Data/FutureData/', nrows=None):
+    """
+    从缓存直接构建BarCursor，数值列为内存映射数组，不经过DataFrame
+    """
+    columns = load_columns(path+file_name, nrows=nrows)
+    columns['symbol_name'] = np.full(len(columns['date_time']), symbol_name, dtype=object)
+    return BarCursor(columns)
+
+
+def get_future_stream(file_name='rb-SHF_min.csv', symbol_name='rb-SHF', path='../../Data/FutureData/',
+                      chunk_size=65536, prefetch=2):
+    """
+    流式读取全部数据，数据占用的内存与数据长度无关，可直接作为BackTestEngine的data；
+        资金记录同样有界时，BackTestEngine传入recorder=Account.SpillEquityRecorder(...)
+    """
+    return BarStream(file_name, symbol_name, path, chunk_size=chunk_size, prefetch=prefetch)
+
+
+def get_future_feeds(files=(('rb-SHF_min.csv', 'rb-SHF'), ('i-DCE_min.csv', 'i-DCE')), path='../../Data/FutureData/',
+                     chunk_size=65536, prefetch=2):
+    """
+    多品种数据按时间归并为一个流，同一时刻按files的顺序处理
+    :param files: (文件名, 品种名称)列表
+    """
+    return MultiFeedStream([BarStream(file_name, symbol_name, path, chunk_size=chunk_size, prefetch=prefetch)
+                            for file_name, symbol_name in files])
+
 if __name__ == '__main__':
     # data = pd.read_csv('..\\..\\Data\\FutureData\\' + 'rb-SHF_min.csv', nrows=10000, parse_dates=[0])
     get_future_data()
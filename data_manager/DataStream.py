@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import heapq
+import queue
+import threading
+import numpy as np
+from core.common import *
+from core.Bar import BarCursor
+
+_END = object()     # 数据读取结束的标记
+
+
+class BarStream:
+    """
+    分块流式读取的bar数据：
+        后台线程按chunk_size分块读取csv并转换为列数组，通过有界队列预取后续的块，
+        回测引擎逐bar消费当前块；内存中最多保留(prefetch + 1)个块，与数据总长度无关
+        (数据部分有界；引擎默认的EquityRecorder每个bar一条记录，需有界时使用Account.SpillEquityRecorder)
+    """
+    def __init__(self, file_name='rb-SHF_min.csv', symbol_name='rb-SHF', path='../../Data/FutureData/',
+                 chunk_size=65536, prefetch=2, nrows=None):
+        """
+        :param file_name: csv文件名
+        :param symbol_name: 品种名称
+        :param path: 文件路径
+        :param chunk_size: 每块的bar数目
+        :param prefetch: 预取的块数
+        :param nrows: 只读取前nrows行，None为全部
+        """
+        self.file_name = path + file_name
+        self.symbol_name = symbol_name
+        self.chunk_size = chunk_size
+        self.prefetch = prefetch
+        self.nrows = nrows
+
+    def iter_chunks(self):
+        """
+        逐块产生BarCursor
+        """
+        import pandas as pd
+        with pd.read_csv(self.file_name, parse_dates=[0], chunksize=self.chunk_size, nrows=self.nrows) as reader:
+            for chunk in reader:
+                columns = {name: chunk[column].to_numpy()
+                           for name, column in zip(BAR_DATA_COLUMN_NAMES_10, chunk.columns)}
+                columns['symbol_name'] = np.full(len(chunk), self.symbol_name, dtype=object)
+                yield BarCursor(columns, chunk_size=self.chunk_size)
+
+    @staticmethod
+    def _put(chunks, item, stop):
+        """
+        放入队列，消费者已停止时放弃
+        """
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce(self, chunks, stop):
+        try:
+            for cursor in self.iter_chunks():
+                if not self._put(chunks, cursor, stop):
+                    return
+            self._put(chunks, _END, stop)
+        except BaseException as e:
+            self._put(chunks, e, stop)
+
+    def __iter__(self):
+        chunks = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        reader = threading.Thread(target=self._produce, args=(chunks, stop), daemon=True)
+        reader.start()
+        try:
+            while True:
+                cursor = chunks.get()
+                if cursor is _END:
+                    break
+                if isinstance(cursor, BaseException):
+                    raise cursor
+                yield from cursor
+        finally:
+            # 提前结束迭代时通知读取线程退出
+            stop.set()
+            reader.join()
+
+
+def merge_bar_streams(*feeds):
+    """
+    按date_time惰性归并多个各自有序的bar流(k路堆归并)，不构建合并后的整体数据
+        时间相同时按feeds的先后顺序产生，同一个流内保持原顺序，结果确定
+    :param feeds: 多个按时间有序的bar流(BarStream、BarCursor或Bar的可迭代对象)
+    :return: 按时间有序的Bar生成器
+    """
+    iterators = [iter(feed) for feed in feeds]
+    heap = []   # (时间, 流序号, bar)：每个流在堆中至多一项，(时间, 流序号)唯一，不会比较到bar
+    for rank, it in enumerate(iterators):
+        bar = next(it, None)
+        if bar is not None:
+            heap.append((bar.date_time, rank, bar))
+    heapq.heapify(heap)
+    while heap:
+        _, rank, bar = heap[0]
+        yield bar
+        bar = next(iterators[rank], None)
+        if bar is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (bar.date_time, rank, bar))
+
+
+class MultiFeedStream:
+    """
+    多品种数据流：每次迭代重新打开各品种的流并按时间归并，可直接作为BackTestEngine的data
+    """
+    def __init__(self, feeds):
+        """
+        :param feeds: 各品种的bar流列表，列表顺序即同一时刻的处理顺序
+        """
+        self.feeds = list(feeds)
+
+    def __iter__(self):
+        return merge_bar_streams(*self.feeds)
+
+
+if __name__ == '__main__':
+    n = 0
+    for bar in BarStream(chunk_size=4096):
+        n += 1
+    print('stream bars:', n)
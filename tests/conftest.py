@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import io
+import pytest
+from benchmark.SyntheticData import make_bar_data
+from core.Account import Account
+from core.Engine import BackTestEngine
+from core.Symbol import SymbolRB
+from BackTestBoll import ParameterBoll, StrategyBoll
+
+# 回测引擎的对比测试共用：合成数据和逐bar串行回测的结果
+
+# 短持仓(频繁交易)和长持仓(跨越分段边界)两组参数
+PARAMETERS = [ParameterBoll(tau=60, take_profit=500, stop_days=0.5),
+              ParameterBoll(tau=120, take_profit=5000, stop_days=7)]
+
+
+def run_quiet(run, *args, **kwargs):
+    """
+    屏蔽回测中的逐单打印
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return run(*args, **kwargs)
+
+
+@pytest.fixture(scope='session')
+def bar_data():
+    return make_bar_data(20000, seed=1)
+
+
+@pytest.fixture(scope='session')
+def serial_engine(bar_data):
+    """
+    :return: 函数，参数 -> 已运行的BackTestEngine(同一参数只回测一次)
+    """
+    engines = {}
+
+    def get(parameter):
+        key = tuple(sorted(vars(parameter).items()))
+        if key not in engines:
+            engine = BackTestEngine(bar_data, [StrategyBoll(1, parameter, SymbolRB())], Account(100000))
+            run_quiet(engine.run)
+            engines[key] = engine
+        return engines[key]
+    return get
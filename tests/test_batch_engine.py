@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from core.Account import Account
+from core.BatchEngine import BatchBackTestEngine
+from core.Symbol import SymbolRB
+from BackTestBoll import BatchStrategyBoll, ParameterBoll
+from conftest import PARAMETERS, run_quiet
+
+BATCH_PARAMETERS = PARAMETERS + [ParameterBoll(tau=240, delta=1.5, take_profit=3000, stop_days=3)]
+
+
+@pytest.mark.parametrize('resync_period', [None, 1000])
+def test_matches_serial_engine(bar_data, serial_engine, resync_period):
+    strategy = BatchStrategyBoll(1, BATCH_PARAMETERS, SymbolRB())
+    if resync_period is not None:
+        strategy.resync_period = resync_period
+    batch = BatchBackTestEngine(bar_data, strategy, Account(100000))
+    run_quiet(batch.run)
+    assert batch.equity.shape == (len(bar_data), len(BATCH_PARAMETERS))
+    for i, parameter in enumerate(BATCH_PARAMETERS):
+        serial = serial_engine(parameter)
+        assert batch.trade_num[i] == len(serial.trade_list) > 0
+        np.testing.assert_allclose(batch.equity[:, i], serial.recorder['equity'], rtol=0, atol=1e-6)
+
+
+def test_result_table(bar_data):
+    batch = BatchBackTestEngine(bar_data, BatchStrategyBoll(1, BATCH_PARAMETERS, SymbolRB()), Account(100000))
+    run_quiet(batch.run)
+    table = batch.result_table()
+    assert len(table) == len(BATCH_PARAMETERS)
+    assert table['trade_num'].tolist() == batch.trade_num.tolist()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from benchmark.SyntheticData import make_bar_data
+from core.Account import Account
+from core.Bar import BarCursor
+from core.Checkpoint import (Checkpointer, dump_engine, extend_backtest, load_engine, load_engine_bytes,
+                             save_incremental)
+from core.Engine import BackTestEngine
+from core.Symbol import SymbolRB
+from data_manager.DataStream import MultiFeedStream
+from BackTestBoll import StrategyBoll
+from conftest import PARAMETERS, run_quiet
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptingCheckpointer(Checkpointer):
+    """
+    保存断点后在stop_at处中断回测，模拟进程被杀死
+    """
+    def __init__(self, path, every_bars, stop_at):
+        super().__init__(path, every_bars=every_bars)
+        self.stop_at = stop_at
+
+    def step(self, engine):
+        super().step(engine)
+        if engine.position >= self.stop_at:
+            raise Interrupted()
+
+
+def strategies():
+    return [StrategyBoll(i + 1, p, SymbolRB()) for i, p in enumerate(PARAMETERS)]
+
+
+def assert_same_result(engine, reference):
+    assert engine.position == reference.position
+    assert len(engine.trade_list) == len(reference.trade_list)
+    np.testing.assert_array_equal(engine.recorder['time'], reference.recorder['time'])
+    np.testing.assert_array_equal(engine.recorder['equity'], reference.recorder['equity'])
+    assert engine.account.equity == reference.account.equity
+
+
+@pytest.mark.parametrize('options', [{}, {'jump_ahead': True}, {'precompute_indicators': True}],
+                         ids=['plain', 'jump_ahead', 'precompute'])
+def test_resume_after_interrupt(bar_data, tmp_path, options):
+    reference = BackTestEngine(bar_data, strategies(), Account(100000), **options)
+    run_quiet(reference.run)
+    path = str(tmp_path / 'run.ckpt')
+    engine = BackTestEngine(bar_data, strategies(), Account(100000),
+                            checkpoint=InterruptingCheckpointer(path, every_bars=3000, stop_at=11111), **options)
+    with pytest.raises(Interrupted):
+        run_quiet(engine.run)
+    resumed = load_engine(path, bar_data)
+    assert 0 < resumed.position <= 11111
+    resumed.checkpoint = None
+    run_quiet(resumed.run)
+    assert_same_result(resumed, reference)
+
+
+def test_resume_multi_feed_stream(tmp_path):
+    feeds = [BarCursor.from_frame(make_bar_data(8000, seed=5)),
+             BarCursor.from_frame(make_bar_data(8000, seed=6, symbol_name='i-DCE'))]
+    stream = MultiFeedStream(feeds)
+    reference = BackTestEngine(stream, strategies(), Account(100000))
+    run_quiet(reference.run)
+    path = str(tmp_path / 'run.ckpt')
+    engine = BackTestEngine(stream, strategies(), Account(100000),
+                            checkpoint=InterruptingCheckpointer(path, every_bars=2000, stop_at=7000))
+    with pytest.raises(Interrupted):
+        run_quiet(engine.run)
+    resumed = load_engine(path, stream)
+    resumed.checkpoint = None
+    run_quiet(resumed.run)
+    assert_same_result(resumed, reference)
+
+
+def test_dump_and_load_bytes(bar_data):
+    engine = BackTestEngine(bar_data, strategies(), Account(100000))
+    run_quiet(engine.run)
+    meta, loaded = load_engine_bytes(dump_engine(engine, meta={'tag': 1}), bar_data)
+    assert meta == {'tag': 1}
+    assert loaded.data is bar_data
+    assert_same_result(loaded, engine)
+
+
+def test_rejects_other_files():
+    with pytest.raises(Exception, match='not a back test checkpoint'):
+        load_engine_bytes(b'not a checkpoint', None)
+
+
+@pytest.mark.parametrize('options', [{}, {'jump_ahead': True}], ids=['plain', 'jump_ahead'])
+def test_extend_appended_bars(bar_data, tmp_path, options):
+    reference = BackTestEngine(bar_data, strategies(), Account(100000), **options)
+    run_quiet(reference.run)
+    path = str(tmp_path / 'incremental.state')
+    engine = BackTestEngine(bar_data.iloc[:12000].copy(), strategies(), Account(100000), **options)
+    run_quiet(engine.run)
+    save_incremental(engine, path)
+    # 分两次追加，第二次从第一次保存的状态继续
+    run_quiet(extend_backtest, path, bar_data.iloc[:15000].copy())
+    extended = run_quiet(extend_backtest, path, bar_data)
+    assert_same_result(extended, reference)
+
+
+@pytest.fixture
+def incremental_state(bar_data, tmp_path):
+    path = str(tmp_path / 'incremental.state')
+    engine = BackTestEngine(bar_data.iloc[:12000].copy(), strategies(), Account(100000))
+    run_quiet(engine.run)
+    save_incremental(engine, path)
+    return path
+
+
+def test_extend_rejects_changed_history(bar_data, incremental_state):
+    changed = bar_data.copy()
+    changed.loc[changed.index[100], 'open'] += 1
+    with pytest.raises(Exception, match='historical data has changed'):
+        extend_backtest(incremental_state, changed)
+
+
+def test_extend_rejects_shorter_data(bar_data, incremental_state):
+    with pytest.raises(Exception, match='fewer than'):
+        extend_backtest(incremental_state, bar_data.iloc[:100])
+
+
+def test_extend_rejects_precomputed_indicators(bar_data, tmp_path):
+    path = str(tmp_path / 'incremental.state')
+    engine = BackTestEngine(bar_data.iloc[:12000].copy(), strategies(), Account(100000), precompute_indicators=True)
+    run_quiet(engine.run)
+    save_incremental(engine, path)
+    with pytest.raises(Exception, match='precomputed'):
+        extend_backtest(path, bar_data)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from benchmark.SyntheticData import make_bar_data
+from core.Account import Account
+from core.BatchEngine import CrossSymbolEngine, SymbolPanel
+from core.Engine import BacKTestEngine2
+from core.Symbol import SymbolI, SymbolRB
+from TradeTestBias import BatchStrategyBias, MyTradeTest, ParameterBias, StrategyBias
+from conftest import run_quiet
+
+PARAMETER = ParameterBias(tau=60, bias_buy_open=-0.002, bias_buy_close=0, bias_sell_open=0.002, bias_sell_close=0,
+                          stop_days=0.2, take_profit=300)
+
+
+@pytest.fixture(scope='module')
+def feeds():
+    rb = make_bar_data(3000, seed=1)
+    # 铁矿石时间错开半分钟，并缺少一段bar
+    i_dce = make_bar_data(3000, symbol_name='i-DCE', start='2015-01-05 09:00:30', start_price=500, seed=2)
+    i_dce = i_dce.drop(i_dce.index[1000:1400]).reset_index(drop=True)
+    return rb, i_dce
+
+
+def test_matches_per_symbol_serial_runs(feeds):
+    symbols = [SymbolRB(), SymbolI()]
+    cross = CrossSymbolEngine(list(feeds), BatchStrategyBias(1, PARAMETER, symbols), Account(100000))
+    run_quiet(cross.run)
+    for j, (data, symbol) in enumerate(zip(feeds, symbols)):
+        serial = MyTradeTest(data, [StrategyBias(1, PARAMETER, symbol)], BacKTestEngine2(Account(100000)))
+        run_quiet(serial.back_test)
+        assert cross.trade_num[j] == len(serial.engine.trade_list) > 0
+        # 只比较该品种自身bar上的资金记录
+        np.testing.assert_allclose(cross.equity[cross.panel.rows[j], j], serial.recorder['equity'], rtol=0, atol=1e-6)
+    assert len(cross.result_table()) == len(symbols) + 1
+
+
+def test_panel_forward_fills_missing_bars(feeds):
+    rb, i_dce = feeds
+    panel = SymbolPanel([rb, i_dce], ['rb-SHF', 'i-DCE'])
+    assert len(panel.time) == len(rb) + len(i_dce)
+    assert panel.valid[:, 0].sum() == len(rb) and panel.valid[:, 1].sum() == len(i_dce)
+    missing = np.flatnonzero(~panel.valid[:, 1])
+    # 缺少bar的时间沿用之前最近一个bar的价格
+    for k in missing[missing > panel.rows[1][0]][:50]:
+        last = panel.rows[1][panel.rows[1] < k][-1]
+        assert panel.price[k, 1] == panel.price[last, 1]
+
+
+def test_rejects_mismatched_symbols(feeds):
+    with pytest.raises(Exception, match='do not match'):
+        CrossSymbolEngine(SymbolPanel(list(feeds), ['rb-SHF', 'i-DCE']),
+                          BatchStrategyBias(1, PARAMETER, [SymbolI(), SymbolRB()]), Account(100000))
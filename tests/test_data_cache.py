@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+import pytest
+import data_manager.DataCache as DataCache
+from benchmark.SyntheticData import write_bar_csv
+from data_manager.DataCache import CACHE_DIR_NAME, load_columns
+from data_manager.DataEngine import get_future_data
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """
+    记录重建缓存的csv路径
+    """
+    paths = []
+    build_cache = DataCache.build_cache
+
+    def recording(csv_path, entry):
+        paths.append(csv_path)
+        return build_cache(csv_path, entry)
+    monkeypatch.setattr(DataCache, 'build_cache', recording)
+    return paths
+
+
+def entries(cache_dir):
+    return sorted(os.listdir(cache_dir))
+
+
+def test_cached_columns_match_csv(tmp_path, builds):
+    path = write_bar_csv(str(tmp_path / 'rb.csv'), 500, seed=1)
+    expected = get_future_data('rb.csv', path=str(tmp_path) + '/', nrows=None, use_cache=False)
+    for _ in range(2):
+        cached = get_future_data('rb.csv', path=str(tmp_path) + '/', nrows=None)
+        assert (cached == expected).all().all()
+    assert builds == [path]
+    columns = load_columns(path, nrows=100)
+    assert isinstance(columns['open'], np.memmap) and len(columns['open']) == 100
+    assert columns['date_time'].dtype == np.dtype('datetime64[ns]')
+
+
+def test_rebuilds_when_mtime_changes(tmp_path, builds):
+    path = write_bar_csv(str(tmp_path / 'rb.csv'), 500, seed=1)
+    first = np.array(load_columns(path)['open'])
+    cache_dir = str(tmp_path / CACHE_DIR_NAME)
+    old_entries = entries(cache_dir)
+    # 同样大小的新内容，只有修改时间不同
+    write_bar_csv(path, 500, seed=1, start_price=3001.0)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    second = np.array(load_columns(path)['open'])
+    assert len(builds) == 2 and second[0] == 3001.0 and first[0] == 3000.0
+    # 过期的缓存被删除
+    assert len(entries(cache_dir)) == 1 and entries(cache_dir) != old_entries
+
+
+def test_rebuilds_when_size_changes(tmp_path, builds):
+    path = write_bar_csv(str(tmp_path / 'rb.csv'), 500, seed=1)
+    mtime = os.stat(path).st_mtime_ns
+    assert len(load_columns(path)['open']) == 500
+    write_bar_csv(path, 800, seed=1)
+    os.utime(path, ns=(mtime, mtime))
+    assert len(load_columns(path)['open']) == 800
+    assert len(builds) == 2 and len(entries(str(tmp_path / CACHE_DIR_NAME))) == 1
+
+
+def test_same_name_in_different_directories(tmp_path, builds):
+    cache_dir = str(tmp_path / 'cache')
+    os.makedirs(str(tmp_path / 'a'))
+    os.makedirs(str(tmp_path / 'b'))
+    path_a = write_bar_csv(str(tmp_path / 'a' / 'rb.csv'), 500, seed=1)
+    path_b = write_bar_csv(str(tmp_path / 'b' / 'rb.csv'), 500, seed=2, start_price=4000.0)
+    assert load_columns(path_a, cache_dir)['open'][0] == 3000.0
+    assert load_columns(path_b, cache_dir)['open'][0] == 4000.0
+    assert len(entries(cache_dir)) == 2
+    # 更新其中一个文件只删除它自己的过期缓存
+    write_bar_csv(path_a, 600, seed=1, start_price=3500.0)
+    assert load_columns(path_a, cache_dir)['open'][0] == 3500.0
+    assert len(entries(cache_dir)) == 2
+    assert load_columns(path_b, cache_dir)['open'][0] == 4000.0
+    assert len(builds) == 3
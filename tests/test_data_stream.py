@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import datetime
+import pytest
+from benchmark.SyntheticData import make_bar_data, write_bar_csv
+from core.Account import Account
+from core.Bar import Bar, BarCursor
+from core.Engine import BackTestEngine
+from core.Symbol import SymbolI, SymbolRB
+from data_manager.DataEngine import get_future_feeds, get_future_stream
+from data_manager.DataStream import BarStream, MultiFeedStream, merge_bar_streams
+from BackTestBoll import ParameterBoll, StrategyBoll
+from conftest import run_quiet
+
+
+def bars_at(symbol_name, minutes):
+    start = datetime.datetime(2015, 1, 5, 9)
+    return [Bar(start + datetime.timedelta(minutes=m), 1.0, 1.0, 1.0, 1.0, 1.0, symbol_name=symbol_name)
+            for m in minutes]
+
+
+def test_merge_orders_by_time():
+    merged = list(merge_bar_streams(bars_at('a', [0, 3, 5, 9]), bars_at('b', [1, 2, 6]), bars_at('c', [4, 10])))
+    times = [bar.date_time for bar in merged]
+    assert times == sorted(times)
+    assert [bar.symbol_name for bar in merged] == ['a', 'b', 'b', 'a', 'c', 'a', 'b', 'a', 'c']
+
+
+def test_merge_equal_times_follow_feed_rank():
+    # 同一时刻按流的先后顺序，同一流内保持原顺序
+    merged = list(merge_bar_streams(bars_at('b', [0, 1, 1]), bars_at('a', [1, 2]), bars_at('c', [0, 1])))
+    assert [bar.symbol_name for bar in merged] == ['b', 'c', 'b', 'b', 'a', 'c', 'a']
+
+
+def test_merge_empty_feeds():
+    assert list(merge_bar_streams()) == []
+    assert len(list(merge_bar_streams([], bars_at('a', [0, 1]), []))) == 2
+
+
+def test_merge_is_lazy():
+    consumed = []
+
+    def feed(symbol_name, minutes):
+        for bar in bars_at(symbol_name, minutes):
+            consumed.append(symbol_name)
+            yield bar
+
+    merged = merge_bar_streams(feed('a', range(1000)), feed('b', range(1000)))
+    assert consumed == []
+    first = [next(merged) for _ in range(3)]
+    assert [bar.symbol_name for bar in first] == ['a', 'b', 'a']
+    # 每个流只多读一个bar
+    assert len(consumed) == 4
+
+
+def test_multi_feed_stream_can_be_iterated_again():
+    stream = MultiFeedStream([BarCursor.from_frame(make_bar_data(100, seed=1)),
+                              BarCursor.from_frame(make_bar_data(100, symbol_name='i-DCE', seed=2))])
+    assert len(list(stream)) == len(list(stream)) == 200
+
+
+def test_bar_stream_reads_chunks(tmp_path):
+    write_bar_csv(str(tmp_path / 'rb.csv'), 1000, seed=3)
+    expected = make_bar_data(1000, seed=3)
+    bars = list(BarStream('rb.csv', 'rb-SHF', str(tmp_path) + '/', chunk_size=64, prefetch=1))
+    assert len(bars) == 1000
+    assert [bar.open for bar in bars] == expected['open'].tolist()
+    assert all(bar.symbol_name == 'rb-SHF' for bar in bars)
+    # 提前结束迭代时读取线程退出
+    for i, bar in enumerate(get_future_stream('rb.csv', path=str(tmp_path) + '/', chunk_size=64)):
+        if i == 10:
+            break
+
+
+def test_back_test_on_merged_feeds(tmp_path):
+    path = str(tmp_path) + '/'
+    write_bar_csv(path + 'rb.csv', 6000, seed=1)
+    write_bar_csv(path + 'i.csv', 6000, seed=2, start_price=500, start='2015-01-05 09:00:30', symbol_name='i-DCE')
+    parameter = ParameterBoll(tau=60, take_profit=500, stop_days=0.5)
+    single = []
+    for file_name, symbol in (('rb.csv', SymbolRB()), ('i.csv', SymbolI())):
+        engine = BackTestEngine(get_future_stream(file_name, symbol.symbol_name, path, chunk_size=512),
+                                [StrategyBoll(1, parameter, symbol)], Account(100000))
+        run_quiet(engine.run)
+        single.append(engine)
+    merged = BackTestEngine(get_future_feeds((('rb.csv', 'rb-SHF'), ('i.csv', 'i-DCE')), path, chunk_size=512),
+                            [StrategyBoll(1, parameter, SymbolRB()), StrategyBoll(2, parameter, SymbolI())],
+                            Account(100000))
+    run_quiet(merged.run)
+    assert len(merged.recorder) == 12000
+    times = merged.recorder['time']
+    assert (times[1:] >= times[:-1]).all()
+    assert all(len(engine.trade_list) > 0 for engine in single)
+    assert len(merged.trade_list) == sum(len(engine.trade_list) for engine in single)
+    assert merged.account.balance == pytest.approx(sum(e.account.balance for e in single) - 100000, abs=1e-6)
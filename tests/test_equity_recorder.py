@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import pickle
+import numpy as np
+from core.Account import Account, EquityRecorder, SpillEquityRecorder
+from core.Bar import BarCursor
+from core.Engine import BackTestEngine
+from core.Metrics import performance_metrics
+from core.Symbol import SymbolRB
+from BackTestBoll import StrategyBoll
+from conftest import PARAMETERS, run_quiet
+
+
+def random_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    time = np.datetime64('2020-01-01', 'ns') + np.arange(n) * np.timedelta64(1, 'm')
+    return time, rng.normal(size=(n, len(EquityRecorder.FIELDS)))
+
+
+def assert_same_records(recorder, expected):
+    assert len(recorder) == len(expected)
+    for field in ('time',) + EquityRecorder.FIELDS:
+        np.testing.assert_array_equal(recorder[field], expected[field])
+
+
+def test_spill_matches_in_memory(tmp_path):
+    time, values = random_rows(2500)
+    expected = EquityRecorder()
+    spill = SpillEquityRecorder(str(tmp_path / 'equity'), buffer_size=100)
+    for recorder in (expected, spill):
+        for t, row in zip(time[:777], values[:777]):
+            recorder.append(t, *row)
+        recorder.extend(time[777:800], values[777:800])
+        recorder.extend(time[800:], values[800:])     # 多于缓冲区的批量追加
+    assert spill.capacity == 100
+    assert_same_records(spill, expected)
+    assert spill.to_frame().shape == (2500, len(EquityRecorder.FIELDS))
+
+
+def test_spill_pickle_discards_later_rows(tmp_path):
+    time, values = random_rows(500)
+    spill = SpillEquityRecorder(str(tmp_path / 'equity'), buffer_size=64)
+    spill.extend(time[:300], values[:300])
+    state = pickle.dumps(spill)
+    spill.extend(time[300:], values[300:])
+    spill.flush()
+    # 从断点恢复：断点之后写入的记录被截断
+    restored = pickle.loads(state)
+    assert len(restored) == 300
+    restored.extend(time[300:], values[300:])
+    assert_same_records(restored, spill)
+
+
+def test_streaming_back_test_with_spill(bar_data, serial_engine, tmp_path):
+    stream = BarCursor.from_frame(bar_data)
+    engine = BackTestEngine(iter(stream), [StrategyBoll(1, PARAMETERS[0], SymbolRB())], Account(100000),
+                            recorder=SpillEquityRecorder(str(tmp_path / 'equity'), buffer_size=1024))
+    run_quiet(engine.run)
+    run_quiet(engine.result_analysis)
+    serial = serial_engine(PARAMETERS[0])
+    assert engine.recorder.capacity == 1024
+    assert_same_records(engine.recorder, serial.recorder)
+    expected = performance_metrics(serial.recorder['equity'], serial.recorder['time'], serial.trade_list)
+    assert engine.metrics['max_draw_down'] == expected['max_draw_down']
+    assert engine.metrics['annualized_rate'] == expected['annualized_rate']
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from core.Indicator import (RollingBias, RollingMax, RollingMean, RollingMin, RollingStd, RollingVar,
+                            rolling_mean, rolling_std)
+
+TAU = 50
+INDICATORS = {'mean': RollingMean, 'var': RollingVar, 'std': RollingStd, 'bias': RollingBias,
+              'max': RollingMax, 'min': RollingMin}
+
+
+def make_prices(n, seed=0):
+    return 3000 * np.exp(np.cumsum(np.random.default_rng(seed).normal(0, 0.001, n)))
+
+
+def reference(name, window):
+    """
+    numpy参考值
+    """
+    if name == 'mean':
+        return np.mean(window)
+    if name == 'var':
+        return np.var(window)
+    if name == 'std':
+        return np.std(window)
+    if name == 'bias':
+        return (window[-1] - np.mean(window)) / np.mean(window)
+    if name == 'max':
+        return window.max()
+    return window.min()
+
+
+def assert_close(value, expected):
+    assert abs(value - expected) <= 1e-6 * max(1.0, abs(expected))
+
+
+@pytest.mark.parametrize('name', sorted(INDICATORS))
+def test_update_matches_numpy(name):
+    prices = make_prices(2000)
+    indicator = INDICATORS[name](TAU)
+    for i, p in enumerate(prices):
+        indicator.update(p)
+        assert_close(indicator.value, reference(name, prices[max(0, i - TAU + 1):i + 1]))
+    assert indicator.ready and len(indicator) == TAU
+
+
+@pytest.mark.parametrize('name', sorted(INDICATORS))
+@pytest.mark.parametrize('split', [10, TAU, 700])
+def test_update_many_matches_update(name, split):
+    prices = make_prices(1500, seed=1)
+    incremental = INDICATORS[name](TAU)
+    for p in prices:
+        incremental.update(p)
+    batch = INDICATORS[name](TAU)
+    batch.update_many(prices[:split].tolist())
+    batch.update_many(prices[split:].tolist())
+    assert batch.count == incremental.count
+    assert_close(batch.value, incremental.value)
+    # 跳过之后继续增量更新
+    for p in make_prices(200, seed=2):
+        incremental.update(p)
+        batch.update(p)
+        assert_close(batch.value, incremental.value)
+
+
+@pytest.mark.parametrize('name', ['mean', 'var', 'std', 'bias'])
+def test_periodic_resync(name):
+    prices = make_prices(3000, seed=3)
+    indicator = INDICATORS[name](TAU)
+    indicator.resync_period = 64
+    for i, p in enumerate(prices):
+        indicator.update(p)
+        assert_close(indicator.value, reference(name, prices[max(0, i - TAU + 1):i + 1]))
+
+
+def test_long_run_drift():
+    # 默认重算周期下，长序列的累计舍入误差保持在容差内
+    prices = make_prices(50000, seed=4)
+    mean, std = RollingMean(TAU), RollingStd(TAU)
+    for p in prices:
+        mean.update(p)
+        std.update(p)
+    assert_close(mean.value, np.mean(prices[-TAU:]))
+    assert_close(std.value, np.std(prices[-TAU:]))
+
+
+def test_vectorized_rolling_functions():
+    prices = make_prices(2000, seed=5)
+    windows = np.lib.stride_tricks.sliding_window_view(prices, TAU)
+    np.testing.assert_allclose(rolling_mean(prices, TAU)[TAU - 1:], windows.mean(axis=1), rtol=1e-9)
+    np.testing.assert_allclose(rolling_std(prices, TAU)[TAU - 1:], windows.std(axis=1), rtol=1e-6)
+
+
+@pytest.mark.parametrize('name', ['var', 'std'])
+@pytest.mark.parametrize('head', [0, 30, TAU - 1])
+def test_update_many_longer_than_window(name, head):
+    prices = make_prices(head + 3 * TAU + 7, seed=6)
+    indicator = INDICATORS[name](TAU)
+    for p in prices[:head]:
+        indicator.update(p)
+    # 一次跳过的数据多于窗口：窗口精确重算后最后一个数据增量更新
+    indicator.update_many(prices[head:].tolist())
+    assert indicator.count == len(prices)
+    assert_close(indicator.value, reference(name, prices[-TAU:]))
+    assert_close(indicator.m2, np.var(prices[-TAU:]) * TAU)
+    for p in make_prices(100, seed=7):
+        indicator.update(p)
+        prices = np.append(prices, p)
+        assert_close(indicator.value, reference(name, prices[-TAU:]))
+
+
+def test_update_many_resync_on_last_value():
+    # 最后一个数据恰好触发周期重算
+    prices = make_prices(200, seed=8)
+    indicator = RollingVar(TAU)
+    indicator.resync_period = 200
+    indicator.update_many(prices.tolist())
+    assert_close(indicator.value, np.var(prices[-TAU:]))
+    indicator.update(prices[0])
+    assert_close(indicator.value, np.var(np.append(prices[-TAU + 1:], prices[0])))
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from core.Account import Account
+from core.Bar import BarCursor
+from core.Engine import BackTestEngine
+from core.Indicator import IndicatorCache, PrecomputedIndicator, RollingStd
+from core.Symbol import SymbolRB
+from BackTestBoll import ParameterBoll, StrategyBoll
+from conftest import PARAMETERS, run_quiet
+
+# 与PARAMETERS[0]窗口相同、止盈止损不同的参数
+SAME_WINDOW = ParameterBoll(tau=60, take_profit=2000, stop_days=2)
+
+
+def trades(engine, strategy_id):
+    return [(pos.open_time, pos.close_time, pos.position_type, pos.open_price, pos.close_price)
+            for pos in engine.trade_list if pos.strategy_id == strategy_id]
+
+
+def test_strategies_share_one_indicator_per_window(bar_data):
+    strategies = [StrategyBoll(1, PARAMETERS[0], SymbolRB()), StrategyBoll(2, SAME_WINDOW, SymbolRB()),
+                  StrategyBoll(3, PARAMETERS[1], SymbolRB())]
+    engine = BackTestEngine(bar_data, strategies, Account(10 ** 7))
+    assert strategies[0].boll is strategies[1].boll and strategies[0].boll.shared
+    assert strategies[2].boll is not strategies[0].boll
+    assert len(engine.indicators.live) == 2
+    run_quiet(engine.run)
+    # 共用指标后每个策略的交易与单独回测一致
+    for strategy_id, parameter in enumerate([PARAMETERS[0], SAME_WINDOW, PARAMETERS[1]], 1):
+        alone = BackTestEngine(bar_data, [StrategyBoll(strategy_id, parameter, SymbolRB())], Account(10 ** 7))
+        run_quiet(alone.run)
+        assert trades(engine, strategy_id) == trades(alone, strategy_id)
+        assert len(trades(alone, strategy_id)) > 0
+
+
+@pytest.mark.parametrize('parameter', PARAMETERS)
+def test_precomputed_matches_incremental(bar_data, serial_engine, parameter):
+    strategy = StrategyBoll(1, parameter, SymbolRB())
+    engine = BackTestEngine(bar_data, [strategy], Account(100000), precompute_indicators=True)
+    assert isinstance(strategy.boll, PrecomputedIndicator)
+    run_quiet(engine.run)
+    serial = serial_engine(parameter)
+    assert isinstance(serial.strategy[0].boll, RollingStd)
+    assert trades(engine, 1) == trades(serial, 1)
+    np.testing.assert_allclose(engine.recorder['equity'], serial.recorder['equity'], rtol=0, atol=1e-6)
+
+
+def test_precomputed_arrays_reused_across_engines(bar_data):
+    # 参数扫描的子进程中各次回测共用同一个BarCursor和缓存
+    bars, cache = BarCursor.from_frame(bar_data), IndicatorCache()
+    for _ in range(2):
+        BackTestEngine(bars, [StrategyBoll(1, PARAMETERS[0], SymbolRB())], Account(100000),
+                       precompute_indicators=True, indicator_cache=cache)
+    assert (cache.misses, cache.hits) == (1, 1)
+
+
+def test_cache_evicts_least_recently_used():
+    cache = IndicatorCache(max_size=2)
+    bars = object()
+    built = []
+
+    def get(key):
+        return cache.get(bars, (key,), lambda: built.append(key) or {'value': key})
+    assert get('a') == {'value': 'a'}
+    get('b')
+    get('a')    # a变为最近使用
+    get('c')    # 淘汰b
+    assert len(cache.entries) == 2
+    get('a')
+    get('b')
+    assert built == ['a', 'b', 'c', 'b']
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_cache_keys_on_data_object():
+    cache = IndicatorCache()
+    first, second = object(), object()
+    cache.get(first, ('k',), lambda: {'value': 1})
+    assert cache.get(second, ('k',), lambda: {'value': 2}) == {'value': 2}
+    assert cache.misses == 2
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from core.Account import Account
+from core.Engine import BackTestEngine
+from core.Symbol import SymbolRB
+from BackTestBoll import StrategyBoll
+from conftest import PARAMETERS, run_quiet
+
+
+def assert_same_result(engine, serial):
+    assert len(engine.trade_list) == len(serial.trade_list)
+    np.testing.assert_array_equal(engine.recorder['time'], serial.recorder['time'])
+    np.testing.assert_allclose(engine.recorder['equity'], serial.recorder['equity'], rtol=0, atol=1e-6)
+
+
+@pytest.mark.parametrize('parameter', PARAMETERS)
+def test_matches_serial_engine(bar_data, serial_engine, parameter):
+    engine = BackTestEngine(bar_data, [StrategyBoll(1, parameter, SymbolRB())], Account(100000), jump_ahead=True,
+                            profile=True)
+    run_quiet(engine.run)
+    assert_same_result(engine, serial_engine(parameter))
+    # 确实跳过了一部分bar
+    assert engine.profiler.calls.get('skip_bars', 0) > 0
+    assert engine.profiler.calls['update_engine'] < len(bar_data)
+
+
+def test_multiple_strategies(bar_data):
+    strategies = [StrategyBoll(i + 1, p, SymbolRB()) for i, p in enumerate(PARAMETERS)]
+    serial = BackTestEngine(bar_data, strategies, Account(100000))
+    run_quiet(serial.run)
+    strategies = [StrategyBoll(i + 1, p, SymbolRB()) for i, p in enumerate(PARAMETERS)]
+    engine = BackTestEngine(bar_data, strategies, Account(100000), jump_ahead=True)
+    run_quiet(engine.run)
+    assert_same_result(engine, serial)
+
+
+def test_needs_in_memory_data(bar_data):
+    with pytest.raises(Exception, match='in-memory'):
+        BackTestEngine(iter([]), [StrategyBoll(1, PARAMETERS[0], SymbolRB())], Account(100000), jump_ahead=True)
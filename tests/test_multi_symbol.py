@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import pytest
+from benchmark.SyntheticData import make_bar_data
+from core.Account import Account
+from core.Bar import BarCursor
+from core.Engine import BackTestEngine
+from core.Symbol import SymbolI, SymbolRB
+from data_manager.DataStream import MultiFeedStream
+from BackTestBoll import ParameterBoll, StrategyBoll
+from conftest import PARAMETERS, run_quiet
+
+
+@pytest.fixture(scope='module')
+def feeds():
+    rb = make_bar_data(8000, seed=1)
+    # 铁矿石价格量级不同、时间错开半分钟，并缺少一段bar
+    i_dce = make_bar_data(8000, symbol_name='i-DCE', start='2015-01-05 09:00:30', start_price=500, seed=2)
+    i_dce = i_dce.drop(i_dce.index[3000:3500]).reset_index(drop=True)
+    return rb, i_dce
+
+
+def run_engine(data, strategies):
+    engine = BackTestEngine(data, strategies, Account(100000))
+    run_quiet(engine.run)
+    return engine
+
+
+def trade_keys(trade_list):
+    return [(pos.symbol.symbol_name, pos.open_time, pos.open_price, pos.close_time, pos.close_price)
+            for pos in trade_list]
+
+
+@pytest.mark.parametrize('parameter', [PARAMETERS[0], ParameterBoll(tau=120, take_profit=2000, stop_days=2)])
+def test_merged_stream_matches_single_symbol_runs(feeds, parameter):
+    rb, i_dce = feeds
+    single = [run_engine(rb, [StrategyBoll(1, parameter, SymbolRB())]),
+              run_engine(i_dce, [StrategyBoll(2, parameter, SymbolI())])]
+    merged = run_engine(MultiFeedStream([BarCursor.from_frame(rb), BarCursor.from_frame(i_dce)]),
+                        [StrategyBoll(1, parameter, SymbolRB()), StrategyBoll(2, parameter, SymbolI())])
+    assert all(len(engine.trade_list) > 0 for engine in single)
+    # 每个品种的订单只在本品种的bar上成交
+    for strategy_id, engine in ((1, single[0]), (2, single[1])):
+        trades = [pos for pos in merged.trade_list if pos.strategy_id == strategy_id]
+        assert sorted(trade_keys(trades)) == sorted(trade_keys(engine.trade_list))
+    assert merged.account.balance == pytest.approx(sum(e.account.balance for e in single) - 100000, abs=1e-6)
+    assert len(merged.recorder) == len(rb) + len(i_dce)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+from benchmark.SyntheticData import make_bar_data
+from core.Account import Account
+from core.Engine import BackTestOptEngine
+from core.Symbol import SymbolI, SymbolRB
+from BackTestBoll import ParameterBoll, StrategyBoll
+from conftest import run_quiet
+
+SPACE = [ParameterBoll(tau=tau, take_profit=500, stop_days=1) for tau in (30, 90)]
+
+
+class RecordingOptEngine(BackTestOptEngine):
+    """
+    每次参数替换后记录策略的指标值和用numpy按策略自身品种的最后tau个bar(包含当前bar)计算的参考值
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.swaps = []
+
+    def swap_parameter(self, strategy, index, time):
+        flat = self.strategy_is_flat(strategy)
+        super().swap_parameter(strategy, index, time)
+        own = self.bars.columns['symbol_name'][:index + 1] == strategy.symbol.symbol_name
+        prices = np.asarray(self.bars.columns['open'][:index + 1], dtype=np.float64)[own]
+        window = prices[-strategy.parameter.tau:]
+        self.swaps.append((flat, strategy.boll.mean, strategy.boll.value, np.mean(window), np.std(window)))
+
+
+def run_opt(data, strategies, space, profile=False):
+    engine = RecordingOptEngine(data, strategies, Account(100000), init_opt_tau=(2000,) * len(strategies),
+                                opt_frequency=(2000,) * len(strategies), parameter_space=space, processes=1,
+                                background=False, profile=profile)
+    run_quiet(engine.run)
+    return engine
+
+
+def assert_warm_up(engine):
+    assert engine.swaps
+    for flat, mean, std, expected_mean, expected_std in engine.swaps:
+        assert flat
+        assert mean == pytest.approx(expected_mean, rel=1e-9)
+        assert std == pytest.approx(expected_std, rel=1e-6)
+
+
+def test_walk_forward():
+    data = make_bar_data(12000, seed=1)
+    engine = run_opt(data, [StrategyBoll(1, ParameterBoll(), SymbolRB())], [SPACE])
+    assert_warm_up(engine)
+    assert len(engine.opt_log) == len(engine.swaps) >= 2
+    assert engine.oos_begin == engine.opt_log[0]['swap_index']
+    for log in engine.opt_log:
+        assert log['parameter'] in SPACE
+        assert log['opt_end'] == log['swap_index']
+    time, equity, metrics = engine.out_of_sample()
+    assert len(equity) == len(data) - engine.oos_begin
+    assert metrics['days'] > 0
+    # background=False时结果可复现
+    again = run_opt(data, [StrategyBoll(1, ParameterBoll(), SymbolRB())], [SPACE])
+    np.testing.assert_array_equal(again.recorder['equity'], engine.recorder['equity'])
+    assert [log['parameter'] for log in again.opt_log] == [log['parameter'] for log in engine.opt_log]
+
+
+def test_warm_up_uses_own_symbol_bars():
+    # 两个品种交替出现，策略的预热窗口只计入自身品种的bar
+    rb = make_bar_data(8000, seed=1)
+    i_dce = make_bar_data(8000, symbol_name='i-DCE', start='2015-01-05 09:00:30', start_price=500, seed=2)
+    data = pd.concat([rb, i_dce]).sort_values('date_time', kind='stable').reset_index(drop=True)
+    space = [ParameterBoll(tau=tau, take_profit=5000, stop_days=1) for tau in (30, 90)]
+    engine = run_opt(data, [StrategyBoll(1, ParameterBoll(), SymbolRB()), StrategyBoll(2, ParameterBoll(), SymbolI())],
+                     [SPACE, space])
+    assert_warm_up(engine)
+    assert {log['strategy_id'] for log in engine.opt_log} == {1, 2}
+
+
+def test_profile_times_phases():
+    data = make_bar_data(6000, seed=1)
+    engine = run_opt(data, [StrategyBoll(1, ParameterBoll(), SymbolRB())], [SPACE], profile=True)
+    calls = engine.profiler.calls
+    for phase in ('data_fetch', 'update_engine', 'handle_orders', 'indicators', 'strategy[1]', 'account_record'):
+        assert calls[phase] == len(data)
+    assert calls['swap_parameter'] == len(engine.opt_log) > 0
+    assert sum(engine.profiler.total_ns.values()) > 0
+    # 计时不改变回测结果
+    plain = run_opt(data, [StrategyBoll(1, ParameterBoll(), SymbolRB())], [SPACE])
+    np.testing.assert_array_equal(plain.recorder['equity'], engine.recorder['equity'])
+    assert not plain.profiler.calls
+
+
+def test_rejects_empty_parameter_space():
+    with pytest.raises(Exception, match='non-empty parameter space'):
+        BackTestOptEngine(make_bar_data(100), [StrategyBoll(1, ParameterBoll(), SymbolRB())], Account(100000))
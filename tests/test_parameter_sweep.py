@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from multiprocessing import shared_memory
+import numpy as np
+import pytest
+import core.Optimizer as Optimizer
+from core.Optimizer import ParameterSweep, run_backtest
+from core.Symbol import SymbolRB
+from BackTestBoll import ParameterBoll, StrategyBoll
+from conftest import PARAMETERS
+
+PARAMETER_LIST = PARAMETERS + [ParameterBoll(tau=90, take_profit=2000, stop_days=2)]
+
+
+class FailingStrategy(StrategyBoll):
+    """
+    子进程中回测出错的策略
+    """
+    def run(self, data_new, pos_ls):
+        raise Exception('strategy failed')
+
+
+@pytest.fixture
+def shared_names(monkeypatch):
+    """
+    记录扫描创建的共享内存名称
+    """
+    names = []
+    start_worker_pool = Optimizer.start_worker_pool
+
+    def recording(data, processes=None):
+        shared, pool = start_worker_pool(data, processes)
+        names.append(shared.shm.name)
+        return shared, pool
+    monkeypatch.setattr(Optimizer, 'start_worker_pool', recording)
+    return names
+
+
+def assert_unlinked(names):
+    assert names
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+
+def test_matches_serial_runs(bar_data, shared_names):
+    data = bar_data.iloc[:10000]
+    sweep = ParameterSweep(StrategyBoll, PARAMETER_LIST, data, SymbolRB(), processes=2)
+    table = sweep.run()
+    assert len(table) == len(PARAMETER_LIST)
+    for parameter, metrics in zip(PARAMETER_LIST, sweep.results):
+        serial = run_backtest(data, StrategyBoll, parameter, SymbolRB())
+        assert metrics.keys() == serial.keys()
+        for name in serial:
+            np.testing.assert_allclose(metrics[name], serial[name], rtol=1e-12, err_msg=name)
+    assert table['trade_num'].tolist() == [m['trade_num'] for m in sweep.results]
+    assert min(table['trade_num']) > 0
+    assert_unlinked(shared_names)
+
+
+def test_shared_memory_released_on_error(bar_data, shared_names):
+    sweep = ParameterSweep(FailingStrategy, PARAMETER_LIST[:2], bar_data.iloc[:1000], SymbolRB(), processes=2)
+    with pytest.raises(Exception, match='strategy failed'):
+        sweep.run()
+    assert_unlinked(shared_names)
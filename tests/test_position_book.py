@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from core.Account import Account
+from core.Engine import BackTestEngine
+from core.Order import MarketOrder
+from core.Position import Position
+from core.PositionBook import PositionBook
+from core.Strategy import StrategyBase
+from core.Symbol import SymbolI, SymbolRB
+from core.common import ORDER_TYPE_BUY, ORDER_TYPE_SELL, POSITION_TYPE_LONG, POSITION_TYPE_SHORT
+
+
+def open_positions(rng, n=40):
+    symbols = {'rb-SHF': SymbolRB(), 'i-DCE': SymbolI()}
+    positions = []
+    for k in range(n):
+        symbol = symbols['rb-SHF' if k % 3 else 'i-DCE']
+        position_type = POSITION_TYPE_LONG if rng.random() < 0.5 else POSITION_TYPE_SHORT
+        lots = int(rng.integers(1, 5))
+        positions.append(Position(k % 4, symbol, position_type, k, rng.uniform(400, 4000), lots=lots))
+    return positions
+
+
+def assert_book_matches(book, positions, prices, marked):
+    """
+    账本按品种盯市的合计与逐仓位Position.update的结果一致
+    :param marked: 品种名称 -> 该品种最近一次盯市的浮动盈亏合计，返回值为全部品种的合计
+    """
+    for symbol_name, price in prices.items():
+        mine = [pos for pos in positions if pos.symbol.symbol_name == symbol_name]
+        margin_before = sum(view.margin for view in book.get_by_symbol(symbol_name))
+        profit, margin_increased = book.mark_to_market(symbol_name, 100, price)
+        for pos in mine:
+            pos.update(100, price)
+        marked[symbol_name] = sum(pos.profit for pos in mine)
+        assert profit == pytest.approx(sum(marked.values()), abs=1e-6)
+        assert margin_before + margin_increased == pytest.approx(sum(pos.margin[-1] for pos in mine), abs=1e-6)
+    views = {(view.strategy_id, view.open_time): view for view in book}
+    for pos in positions:
+        view = views[pos.strategy_id, pos.open_time]
+        assert view.profit == pytest.approx(pos.profit, abs=1e-6)
+        assert view.margin == pytest.approx(pos.margin[-1], abs=1e-6)
+        assert view.profit_at(prices[pos.symbol.symbol_name]) == pytest.approx(pos.profit, abs=1e-6)
+
+
+def test_mark_to_market_matches_positions():
+    rng = np.random.default_rng(0)
+    positions = open_positions(rng)
+    book = PositionBook(capacity=4)     # 容量不足时扩容
+    for pos in positions:
+        book.add(Position(pos.strategy_id, pos.symbol, pos.position_type, pos.open_time, pos.open_price, pos.lots))
+    assert len(book) == book.size == len(positions)
+    marked = {}
+    for _ in range(5):
+        assert_book_matches(book, positions, {'rb-SHF': rng.uniform(3000, 4000), 'i-DCE': rng.uniform(400, 600)},
+                            marked)
+    np.testing.assert_allclose(book.profits('rb-SHF', 3500.0),
+                               [view.profit_at(3500.0) for view in book.get_by_symbol('rb-SHF')])
+
+
+def test_remove_moves_last_row():
+    rng = np.random.default_rng(1)
+    positions = open_positions(rng, n=12)
+    book = PositionBook()
+    views = [book.add(Position(pos.strategy_id, pos.symbol, pos.position_type, pos.open_time, pos.open_price,
+                               pos.lots)) for pos in positions]
+    assert_book_matches(book, positions, {'rb-SHF': 3600.0, 'i-DCE': 520.0}, {})
+    last = views[-1]
+    closed_profit = views[2].profit
+    book.remove(views[2])
+    # 最后一行填补被移除的行，被移除的仓位保留平仓时的数值
+    assert last.row == 2 and book.size == 11
+    assert views[2].row is None and views[2].profit == closed_profit
+    del positions[2]
+    for k in (0, 5, 7):
+        book.remove(views[k + (k > 2)])
+    positions = [pos for k, pos in enumerate(positions) if k not in (0, 5, 7)]
+    assert book.size == len(positions) == 8
+    # 移除的仓位从最近一次盯市的合计中扣除
+    marked = {name: sum(pos.profit for pos in positions if pos.symbol.symbol_name == name)
+              for name in ('rb-SHF', 'i-DCE')}
+    assert_book_matches(book, positions, {'rb-SHF': 3400.0, 'i-DCE': 480.0}, marked)
+    for view in list(book):
+        book.remove(view)
+    # 全部平仓后汇总量清零
+    assert book.size == 0 and book.mark_to_market('rb-SHF', 101, 3500.0) is None
+    assert book.symbol_margin == [0.0, 0.0] and book.symbol_profit == [0.0, 0.0]
+
+
+class ScriptedStrategy(StrategyBase):
+    """
+    按bar序号开平仓的测试策略
+    """
+    def __init__(self, strategy_id, open_at, close_at, order_type):
+        super().__init__(strategy_id, None, SymbolRB())
+        self.open_at, self.close_at, self.order_type = open_at, close_at, order_type
+        self.k = -1
+
+    def run(self, data, pos_ls):
+        self.k += 1
+        if self.k == self.open_at:
+            return [MarketOrder(self.strategy_id, self.symbol, self.order_type, data.date_time)], []
+        if self.k == self.close_at:
+            return [], [MarketOrder(self.strategy_id, self.symbol, -self.order_type, data.date_time)]
+        return [], []
+
+
+def test_equity_includes_all_open_positions(bar_data):
+    # 三个仓位在时间上重叠，订单在下一个bar成交
+    schedule = [(10, 50, ORDER_TYPE_BUY), (20, 70, ORDER_TYPE_SELL), (30, 90, ORDER_TYPE_BUY)]
+    data = bar_data.iloc[:120]
+    engine = BackTestEngine(data, [ScriptedStrategy(i + 1, *s) for i, s in enumerate(schedule)], Account(100000))
+    engine.run()
+    assert len(engine.trade_list) == 3 and len(engine.position_list) == 0
+    price, time = data['open'].to_numpy(), data['date_time'].to_numpy()
+    fills = {k + 1 for s in schedule for k in s[:2]}
+    balance = 100000.0
+    for k in range(len(data)):
+        equity, margin = 0.0, 0.0
+        for strategy_id, (open_at, close_at, order_type) in enumerate(schedule, 1):
+            if not open_at < k:
+                continue
+            slip = SymbolRB().slip_point * order_type
+            pos = Position(strategy_id, SymbolRB(), order_type, time[open_at + 1], price[open_at + 1] + slip)
+            if k == open_at + 1:
+                balance -= pos.commission
+            pos.update(time[k], price[k])
+            if k == close_at + 1:
+                balance += pos.profit
+            elif k < close_at + 1:
+                equity += pos.profit
+                margin += pos.margin[-1]
+        assert engine.recorder['balance'][k] == pytest.approx(balance, abs=1e-6)
+        if k not in fills:
+            # 净值包含全部持仓的浮动盈亏，保证金按当前价格计算
+            assert engine.recorder['equity'][k] == pytest.approx(balance + equity, abs=1e-6)
+            assert engine.recorder['margin_used'][k] == pytest.approx(margin, abs=1e-6)
+    # 平仓按当前价格释放保证金，全部平仓后已用保证金回到0
+    assert engine.recorder['margin_used'][-1] == pytest.approx(0, abs=1e-6)
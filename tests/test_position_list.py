@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import pickle
+import pytest
+from core.Position import OrderList, Position, PositionList
+from core.Symbol import SymbolI, SymbolRB
+from core.common import POSITION_TYPE_LONG, POSITION_TYPE_SHORT
+
+
+def make_positions():
+    # 策略1/2/3，两个品种
+    return [Position(strategy_id, symbol, POSITION_TYPE_LONG if k % 2 else POSITION_TYPE_SHORT, k, 3000 + k)
+            for k, (strategy_id, symbol) in enumerate([(1, SymbolRB()), (2, SymbolRB()), (1, SymbolI()),
+                                                       (3, SymbolI()), (2, SymbolRB())])]
+
+
+def filled(cls=PositionList):
+    items = cls()
+    positions = make_positions()
+    for pos in positions:
+        items.add(pos)
+    return items, positions
+
+
+def test_indexes_match_scan():
+    pl, positions = filled()
+    assert len(pl) == 5 and pl.pl == positions
+    for sid in (1, 2, 3, 4):
+        assert pl.get_position(sid) == [p for p in positions if p.strategy_id == sid]
+    for name in ('rb-SHF', 'i-DCE', 'j-DCE'):
+        assert pl.get_by_symbol(name) == [p for p in positions if p.symbol.symbol_name == name]
+    assert pl.get_by_strategy([3, 1]) == [positions[3], positions[0], positions[2]]
+
+
+def test_remove_keeps_order_and_cleans_indexes():
+    pl, positions = filled()
+    pl.remove(positions[1])
+    assert pl.pl == [positions[0], positions[2], positions[3], positions[4]]
+    assert pl.get_position(2) == [positions[4]]
+    pl.remove(positions[3])
+    # 最后一个仓位移除后索引中不再保留空的桶
+    assert 3 not in pl._by_strategy and pl.get_position(3) == []
+    assert pl.get_by_symbol('i-DCE') == [positions[2]]
+    with pytest.raises(ValueError):
+        pl.remove(positions[3])
+
+
+def test_remove_while_iterating():
+    pl, positions = filled()
+    for pos in pl:
+        if pos.strategy_id != 3:
+            pl.remove(pos)
+    assert pl.pl == [positions[3]]
+
+
+def test_is_empty():
+    pl, positions = filled()
+    assert not pl.is_empty() and not pl.is_empty(1) and not pl.is_empty([4, 3])
+    assert pl.is_empty(4) and pl.is_empty([4, 5]) and pl.is_empty([])
+    for pos in positions:
+        if pos.strategy_id == 1:
+            pl.remove(pos)
+    assert pl.is_empty(1) and pl.is_empty([1, 4]) and not pl.is_empty([1, 2])
+    for pos in pl.pl:
+        pl.remove(pos)
+    assert pl.is_empty() and pl.is_empty([1, 2, 3])
+
+
+@pytest.mark.parametrize('cls', [PositionList, OrderList])
+def test_pickle_rebuilds_indexes(cls):
+    items, positions = filled(cls)
+    items.remove(positions[0])
+    restored = pickle.loads(pickle.dumps(items))
+    assert len(restored) == 4
+    assert [p.open_price for p in restored] == [p.open_price for p in positions[1:]]
+    # 恢复后的索引指向新对象，可以继续查询和删除
+    first = restored.get_by_strategy(2)[0]
+    assert first.open_price == positions[1].open_price
+    assert restored.get_by_symbol('rb-SHF')[0] is first
+    restored.remove(first)
+    assert [p.open_price for p in restored.get_by_strategy(2)] == [positions[4].open_price]
+    assert restored.is_empty(1) is False and len(restored) == 3
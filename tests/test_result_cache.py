@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from benchmark.SyntheticData import make_bar_data
+from core.Optimizer import backtest_result
+from core.ResultCache import ResultCache
+from core.Symbol import SymbolRB
+from BackTestBoll import StrategyBoll
+from conftest import PARAMETERS
+
+
+def test_hit_after_first_run(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    data = make_bar_data(3000, seed=1)
+    first = backtest_result(data, StrategyBoll, PARAMETERS[0], SymbolRB(), result_cache=cache)
+    second = backtest_result(data, StrategyBoll, PARAMETERS[0], SymbolRB(), result_cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert second['metrics'] == first['metrics']
+
+
+def test_in_place_change_misses(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    data = make_bar_data(3000, seed=1)
+    before = cache.data_hash(data)
+    backtest_result(data, StrategyBoll, PARAMETERS[0], SymbolRB(), result_cache=cache)
+    data.loc[data.index[1000:], 'open'] += 50
+    assert cache.data_hash(data) != before
+    backtest_result(data, StrategyBoll, PARAMETERS[0], SymbolRB(), result_cache=cache)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_engine_options_in_key():
+    data_hash = ResultCache.data_hash(make_bar_data(100, seed=1))
+    keys = {ResultCache.key(data_hash, StrategyBoll, PARAMETERS[0], SymbolRB(), 100000, options)
+            for options in (None, {'precompute_indicators': False}, {'precompute_indicators': True})}
+    assert len(keys) == 3
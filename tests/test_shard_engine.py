@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from core.Account import Account
+from core.ShardEngine import ShardedBackTestEngine
+from core.Symbol import SymbolRB
+from BackTestBoll import StrategyBoll
+from conftest import PARAMETERS, run_quiet
+
+
+def run_sharded(bar_data, parameter, shards, processes=2):
+    engine = ShardedBackTestEngine(bar_data, [StrategyBoll(1, parameter, SymbolRB())], Account(100000),
+                                   shards=shards, processes=processes)
+    run_quiet(engine.run)
+    return engine
+
+
+@pytest.mark.parametrize('parameter', PARAMETERS)
+@pytest.mark.parametrize('shards', [1, 4])
+def test_matches_serial_engine(bar_data, serial_engine, parameter, shards):
+    serial = serial_engine(parameter)
+    sharded = run_sharded(bar_data, parameter, shards)
+    assert len(sharded.trade_list) == len(serial.trade_list)
+    np.testing.assert_array_equal(sharded.recorder['time'], serial.recorder['time'])
+    np.testing.assert_allclose(sharded.recorder['equity'], serial.recorder['equity'], rtol=0, atol=1e-6)
+    np.testing.assert_allclose(sharded.recorder['balance'], serial.recorder['balance'], rtol=0, atol=1e-6)
+    assert sharded.account.equity == pytest.approx(serial.account.equity, abs=1e-6)
+
+
+def test_replays_positions_across_boundaries(bar_data, serial_engine):
+    # 长持仓参数在段首有持仓，需要串行重放后拼接
+    parameter = PARAMETERS[1]
+    sharded = run_sharded(bar_data, parameter, shards=8)
+    assert any(segment not in sharded.segments for begin, end, segment in sharded.pieces)
+    np.testing.assert_allclose(sharded.recorder['equity'], serial_engine(parameter).recorder['equity'],
+                               rtol=0, atol=1e-6)
+
+
+def test_single_symbol_only(bar_data):
+    data = bar_data.copy()
+    data.loc[data.index[-1], 'symbol_name'] = 'OTHER'
+    with pytest.raises(Exception, match='single symbol'):
+        ShardedBackTestEngine(data, [StrategyBoll(1, PARAMETERS[0], SymbolRB())], Account(100000))
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from core.Account import Account
+from core.Symbol import SymbolRB
+from core.VectorEngine import VectorBackTestEngine
+from BackTestBoll import StrategyBoll
+from conftest import PARAMETERS, run_quiet
+
+
+@pytest.mark.parametrize('parameter', PARAMETERS)
+def test_matches_serial_engine(bar_data, serial_engine, parameter):
+    serial = serial_engine(parameter)
+    vector = VectorBackTestEngine(bar_data, StrategyBoll(1, parameter, SymbolRB()), Account(100000))
+    run_quiet(vector.run)
+    assert len(serial.trade_list) > 0
+    assert len(vector.trades['profit']) == len(serial.trade_list)
+    np.testing.assert_array_equal(vector.recorder['time'], serial.recorder['time'])
+    np.testing.assert_allclose(vector.recorder['equity'], serial.recorder['equity'], rtol=0, atol=1e-6)
+    np.testing.assert_allclose(vector.recorder['balance'], serial.recorder['balance'], rtol=0, atol=1e-6)